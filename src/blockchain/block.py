@@ -1,21 +1,117 @@
 import hashlib
 import json
 import logging
-import os
+import re
 import time
-import numpy as np
-import multiprocessing as mp
 from abc import ABC, abstractmethod
-from datetime import datetime
-from ecdsa import VerifyingKey, SECP256k1
-from sklearn.cluster import KMeans
-from .merkle_tree import MerkleTree
+from datetime import datetime, timedelta
+from typing import List, Optional
+from .difficulty import Difficulty, DEFAULT_DIFFICULTY
+from .merkle_tree import MerkleTree, double_hash, hash_leaf
+from .mining_pool import MiningPool
+from .nonce_history import NonceHistory
+from .signature_verifier import SignatureVerifier, verify_cached, verifying_key_cache
+from . import sha256_batch
+from db.codec import EPOCH, decode_block, format_timestamp, is_binary
 from db.mapper import Mapper
 
 log = logging.getLogger()
 
+# every address starts with this balance, for testing
+INITIAL_BALANCE = 100
+
+
+class MiningEngine:
+    '''
+    Calculates the merkle root of a block for many different nonces.
+
+    The nonce is always the last leaf of the merkle tree, so only the nodes on the path from
+    the nonce leaf to the root depend on it. All other nodes are hashed once per block, and
+    for every nonce we only rehash the path (log2 of the number of transactions).
+    The resulting root is the same as MerkleTree(transactions + [str(nonce)]).getRootHash()
+    '''
+
+    # number of nonces a mining process tests before it checks if it should stop
+    batch_size = 256
+
+    def __init__(self, transactions: List[str]) -> None:
+        # siblings[i] is the left neighbour of the nonce node on level i, None means that the
+        # nonce node is the last of an odd number of nodes and gets hashed with itself
+        self.siblings: List[Optional[str]] = []
+        nodes = [double_hash(t) for t in transactions]
+        width = len(nodes) + 1     # +1 for the nonce leaf
+        while True:
+            if width % 2 == 1:
+                self.siblings.append(None)
+            else:
+                self.siblings.append(nodes.pop())
+            nodes = [double_hash(nodes[i] + nodes[i + 1]) for i in range(0, len(nodes), 2)]
+            width = (width + 1) // 2
+            if width == 1:
+                break
+        # the children of the root are hashed to a raw digest, see get_root
+        self.inner_siblings = self.siblings[:-1]
+        self.root_sibling = self.siblings[-1]
+
+    def get_root(self, nonce: int) -> bytes:
+        ''' Raw digest of the root, only the nodes below the root are hex strings '''
+        node = double_hash(str(nonce))
+        for sibling in self.inner_siblings:
+            if sibling is None:
+                node = double_hash(node + node)
+            else:
+                node = double_hash(sibling + node)
+        if self.root_sibling is None:
+            return hash_leaf(node + node)
+        return hash_leaf(self.root_sibling + node)
+
+    def get_root_hash(self, nonce: int) -> str:
+        return self.get_root(nonce).hex()
+
+    def validate_nonce(self, nonce: int, difficulty=DEFAULT_DIFFICULTY) -> bool:
+        return difficulty.check(self.get_root(nonce))
+
+    def search(self, start: int, count: int, step: int = 1,
+               difficulty=DEFAULT_DIFFICULTY) -> Optional[int]:
+        ''' Return the first valid nonce of start, start + step, ... (count nonces) '''
+        nonce = start
+        for _ in range(count):
+            if self.validate_nonce(nonce, difficulty):
+                return nonce
+            nonce += step
+        return None
+
+
+class VectorizedMiningEngine(MiningEngine):
+    '''
+    MiningEngine that tests batch_size nonces at once with the NumPy SHA-256 of sha256_batch.
+    Larger batches need more memory, but spend less time in the Python interpreter per nonce.
+    '''
+
+    def __init__(self, transactions: List[str], batch_size=4096) -> None:
+        super().__init__(transactions)
+        self.batch_size = batch_size
+        # the hex string of a constant left node is the first block of its parent's message
+        self.midstates = [None if sibling is None
+                          else sha256_batch.midstate(sha256_batch.digest_to_state(sibling))
+                          for sibling in self.siblings]
+
+    def search(self, start: int, count: int, step: int = 1,
+               difficulty=DEFAULT_DIFFICULTY) -> Optional[int]:
+        target_words = difficulty.get_target_words()
+        for offset in range(0, count, self.batch_size):
+            nonce = sha256_batch.find_valid_nonce(self.siblings, self.midstates,
+                                                  start + offset * step,
+                                                  min(self.batch_size, count - offset), step,
+                                                  target_words)
+            if nonce is not None:
+                return nonce
+        return None
+
 
 class Serializable(ABC):
+    __slots__ = ()
+
     def serialize(self):
         return json.dumps(self.to_dict(),
                           sort_keys=True).encode("utf-8")
@@ -26,16 +122,102 @@ class Serializable(ABC):
 
 
 class Transaction(Serializable):
+    '''
+    The fields are slots, which needs less memory than a dict for every transaction of a block.
+    Timestamps and pubkeys of received transactions are kept as strings and only parsed when
+    they are used. The serialization and the hash are kept until a field is changed.
+    '''
+    __slots__ = ("_source", "_target", "_amount", "_timestamp", "_timestamp_str", "_pubkey",
+                 "_pubkey_hex", "_sig", "_serialized", "_hash", "_leaf")
+
+    TIMESTAMP_FORMAT = "%m/%d/%Y, %H:%M:%S"
+    # timestamps in this form are the same after parsing and formatting them again
+    TIMESTAMP_PATTERN = re.compile(r"\d\d/\d\d/\d{4}, \d\d:\d\d:\d\d")
+
     def __init__(self, source=None, target=None, amount=0, timestamp=datetime.now(),
                  pubkey=None, sig=None):
-        self.source = source
-        self.target = target
-        self.amount = amount
-        self.timestamp = timestamp
+        self._source = source
+        self._target = target
+        self._amount = amount
+        self._timestamp = timestamp
+        self._timestamp_str = None
+        self._pubkey = None
+        self._pubkey_hex = None
+        self._sig = None
+        self.clear_cache()
         if pubkey and sig:
-            self.pubkey = VerifyingKey.from_string(bytes.fromhex(pubkey), SECP256k1, hashlib.sha256,
-                                                   valid_encodings=['raw'])
-            self.sig = bytes.fromhex(sig)
+            # the key is parsed by the pubkey property when it is needed
+            self._pubkey_hex = pubkey
+            self._sig = bytes.fromhex(sig)
+
+    def clear_cache(self):
+        self._serialized = None
+        self._hash = None
+        self._leaf = None
+
+    @property
+    def source(self):
+        return self._source
+
+    @source.setter
+    def source(self, source):
+        self._source = source
+        self.clear_cache()
+
+    @property
+    def target(self):
+        return self._target
+
+    @target.setter
+    def target(self, target):
+        self._target = target
+        self.clear_cache()
+
+    @property
+    def amount(self):
+        return self._amount
+
+    @amount.setter
+    def amount(self, amount):
+        self._amount = amount
+        self.clear_cache()
+
+    @property
+    def timestamp(self) -> datetime:
+        if self._timestamp is None:
+            self._timestamp = datetime.strptime(self._timestamp_str, self.TIMESTAMP_FORMAT)
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, timestamp):
+        self._timestamp = timestamp
+        self._timestamp_str = None
+        self.clear_cache()
+
+    def get_timestamp_string(self) -> str:
+        if self._timestamp_str is None:
+            self._timestamp_str = self._timestamp.strftime(self.TIMESTAMP_FORMAT)
+        return self._timestamp_str
+
+    @property
+    def pubkey(self):
+        if self._pubkey is None and self._pubkey_hex is not None:
+            # senders use the same pubkey for many transactions, it is only parsed once
+            self._pubkey = verifying_key_cache.get(bytes.fromhex(self._pubkey_hex))
+        return self._pubkey
+
+    @pubkey.setter
+    def pubkey(self, pubkey):
+        self._pubkey = pubkey
+        self._pubkey_hex = None
+
+    @property
+    def sig(self):
+        return self._sig
+
+    @sig.setter
+    def sig(self, sig):
+        self._sig = sig
 
     def set_pubkey(self, pubkey):
         self.pubkey = pubkey
@@ -43,25 +225,53 @@ class Transaction(Serializable):
     def set_signature(self, sig):
         self.sig = sig
 
+    def get_pubkey_hex(self) -> str:
+        if self._pubkey_hex is None:
+            self._pubkey_hex = self._pubkey.to_string().hex()
+        return self._pubkey_hex
+
     @staticmethod
     def from_dict(transaction_dict):
-        if type(transaction_dict["timestamp"]) == str:
-            timestamp = datetime.strptime(
-                transaction_dict["timestamp"], '%m/%d/%Y, %H:%M:%S'
-            )
-        else:
-            timestamp = transaction_dict["timestamp"]
+        transaction = Transaction(transaction_dict["source"], transaction_dict["target"],
+                                  transaction_dict["amount"], transaction_dict["timestamp"],
+                                  transaction_dict["pubkey"], transaction_dict["sig"])
+        transaction.set_timestamp_string()
+        return transaction
 
-        return Transaction(transaction_dict["source"], transaction_dict["target"],
-                           transaction_dict["amount"], timestamp, transaction_dict["pubkey"],
-                           transaction_dict["sig"])
+    @staticmethod
+    def from_values(source, target, amount, timestamp, pubkey, sig):
+        '''
+        Create a transaction from the values of db.codec.read_transaction with raw=True: the
+        timestamp in seconds, pubkey and signature as bytes, or all of them as strings
+        '''
+        transaction = Transaction(source, target, amount, timestamp)
+        if type(timestamp) == int:
+            # formatting is cheaper than parsing the string later
+            transaction._timestamp = EPOCH + timedelta(seconds=timestamp)
+            transaction._timestamp_str = format_timestamp(timestamp)
+        else:
+            transaction.set_timestamp_string()
+        transaction._pubkey_hex = pubkey.hex() if type(pubkey) == bytes else pubkey
+        transaction._sig = sig if type(sig) == bytes else bytes.fromhex(sig)
+        return transaction
+
+    def set_timestamp_string(self):
+        ''' Called if the timestamp is a string, e.g. from a received transaction '''
+        timestamp = self._timestamp
+        if type(timestamp) == str:
+            if self.TIMESTAMP_PATTERN.fullmatch(timestamp):
+                # parsed by the timestamp property when it is needed
+                self._timestamp_str = timestamp
+                self._timestamp = None
+            else:
+                self._timestamp = datetime.strptime(timestamp, self.TIMESTAMP_FORMAT)
 
     def to_dict(self):
         return {
             "source": self.source,
             "target": self.target,
             "amount": self.amount,
-            "timestamp": self.timestamp.strftime("%m/%d/%Y, %H:%M:%S")
+            "timestamp": self.get_timestamp_string()
         }
 
     def to_full_dict(self):
@@ -70,42 +280,53 @@ class Transaction(Serializable):
             "source": self.source,
             "target": self.target,
             "amount": self.amount,
-            "timestamp": self.timestamp.strftime("%m/%d/%Y, %H:%M:%S"),
+            "timestamp": self.get_timestamp_string(),
             # get the text string representation of the ECDSA key binary blobs with hex()
-            "pubkey": self.pubkey.to_string().hex(),
+            "pubkey": self.get_pubkey_hex(),
             "sig": self.sig.hex()
         }
 
+    def serialize(self):
+        if self._serialized is None:
+            self._serialized = super().serialize()
+        return self._serialized
+
     def hash(self):
-        return hashlib.sha256(self.serialize()).hexdigest()
+        if self._hash is None:
+            self._hash = hashlib.sha256(self.serialize()).hexdigest()
+        return self._hash
+
+    def get_leaf(self) -> str:
+        ''' The value of the transaction in the merkle tree of a block '''
+        if self._leaf is None:
+            self._leaf = json.dumps(self.to_dict())
+        return self._leaf
 
     def get_balance(self):
-        balance = 100   # +100 balance for testing
-        cwd = os.getcwd()
-        if cwd.endswith('tests'):
-            # if in directory 'tests', go one directory up
-            cwd = os.path.dirname(os.getcwd())
-        local_block_hashes = os.listdir(cwd + "/db/blocks/")
-        for block_hash in local_block_hashes:
-            block_dict = Mapper().read_block(block_hash)
-            block = Block().from_dict(block_dict, block_hash)
-            try:
-                for transaction in block.transactions:
-                    if transaction.source == self.source:
-                        balance -= transaction.amount
-                    if transaction.target == self.source:
-                        balance += transaction.amount
-            except AttributeError:
-                log.error(f"no transactions for block {block_hash}")
-        return balance
-
-    def validate(self):
+        balance = INITIAL_BALANCE
+        # the balance index is updated with every new latest block, no need to read the blocks
+        return balance + Mapper().read_balance(self.source)
+
+    def get_signature_data(self):
+        ''' Raw pubkey, signature and signed message, for the SignatureVerifier '''
+        return bytes.fromhex(self.get_pubkey_hex()), self.sig, self.hash().encode("utf-8")
+
+    def verify_signature(self) -> bool:
+        ''' Signatures that were already verified are looked up in the signature cache '''
+        return verify_cached(self.get_signature_data())
+
+    def validate(self, check_signature=True):
         # verify the transaction data structure
         # we just assume if the keys are present, the values are also valid
         expected_keys = set(["amount", "source", "target", "timestamp"])
         if set(self.to_dict()) != expected_keys:
             log.error("Transaction key fields invalid")
             return False
+        try:
+            self.timestamp
+        except ValueError:
+            log.error("Transaction timestamp invalid")
+            return False
 
         balance = self.get_balance()
         if balance < self.amount:
@@ -113,9 +334,8 @@ class Transaction(Serializable):
                       f"with balance of {balance}")
             return False
 
-        # verify the transaction signature
-        tx_hash = self.hash()
-        if not self.pubkey.verify(self.sig, tx_hash.encode("utf-8")):
+        # verify the transaction signature, Block.validate verifies all signatures at once
+        if check_signature and not self.verify_signature():
             log.error("Cannot verify transaction signature")
             return False
 
@@ -124,6 +344,15 @@ class Transaction(Serializable):
 
 
 class Block(Serializable):
+    '''
+    The hash and the serialization are kept together with the values they were calculated from
+    (predecessor, nonce and the transactions), so they are only calculated again when one of
+    them changed.
+    '''
+    __slots__ = ("predecessor", "transactions", "nonce", "saved_hash", "is_mining", "iterations",
+                 "mining_pool", "nonce_history", "_hash", "_hash_key", "_serialized",
+                 "_serialized_key")
+
     def __init__(self, pred=None, transactions=None, saved_hash=None, nonce=None):
         if not transactions:
             transactions = list()
@@ -132,7 +361,13 @@ class Block(Serializable):
         self.nonce = nonce
         self.saved_hash = saved_hash
         self.is_mining = True
-        self.nonce_list = []
+        self.iterations = 0
+        self.mining_pool = None
+        self.nonce_history = None
+        self._hash = None
+        self._hash_key = None
+        self._serialized = None
+        self._serialized_key = None
 
     def set_nonce(self, nonce):
         self.nonce = nonce
@@ -153,6 +388,18 @@ class Block(Serializable):
         block.transactions = transaction_objects
         return block
 
+    @staticmethod
+    def from_bytes(block_bytes, block_hash):
+        '''
+        Decode a block that was stored by the Mapper, in the binary or in the JSON format.
+        block_bytes can also be a memoryview of the block store.
+        '''
+        if not is_binary(block_bytes):
+            return Block.from_dict(json.loads(bytes(block_bytes)), block_hash)
+        block_dict = decode_block(block_bytes, raw=True)
+        transactions = [Transaction.from_values(*values) for values in block_dict["transactions"]]
+        return Block(block_dict["predecessor"], transactions, block_hash, block_dict["nonce"])
+
     def to_dict(self):
         transactions = list()
         for t in self.transactions:
@@ -176,11 +423,23 @@ class Block(Serializable):
             "nonce": self.nonce
         }
 
+    def serialize(self):
+        # the transactions keep their own values, so comparing them is cheap
+        key = (self.predecessor, self.nonce,
+               tuple((t.get_leaf(), t.get_pubkey_hex(), t.sig) for t in self.transactions))
+        if key != self._serialized_key:
+            self._serialized = super().serialize()
+            self._serialized_key = key
+        return self._serialized
+
     def hash(self):
         if self.nonce is not None:
-            transactions = list()
-            for t in self.transactions:
-                transactions.append(json.dumps(t.to_dict()))
+            leaves = tuple(t.get_leaf() for t in self.transactions)
+            key = (self.predecessor, self.nonce, leaves)
+            if key == self._hash_key:
+                return self._hash
+
+            transactions = list(leaves)
             transactions.append(str(self.nonce))
             if len(transactions) != 0:
                 mtree = MerkleTree(transactions)
@@ -195,25 +454,40 @@ class Block(Serializable):
             }
             serialized_block = json.dumps(
                 block_dict, sort_keys=True).encode("utf-8")
-            return hashlib.sha256(serialized_block).hexdigest()
+            self._hash = hashlib.sha256(serialized_block).hexdigest()
+            self._hash_key = key
+            return self._hash
         else:
             log.error("No Nonce available yet. Mine it first!")
 
     def add_transaction(self, t):
         self.transactions.append(t)
 
-    def validate(self):
+    def validate(self, difficulty=DEFAULT_DIFFICULTY, verifier: SignatureVerifier = None,
+                 check_signatures=True):
+        '''
+        The signatures are verified with the verifier if one is given, otherwise in this thread.
+        check_signatures=False skips them, if they were already verified, e.g. for all blocks of
+        a block download at once.
+        '''
         transactions = list()
         for transaction in self.transactions:  # Validating each transaction
-            if transaction.validate() is False:
+            if transaction.validate(check_signature=False) is False:
+                return False
+            transactions.append(transaction.get_leaf())
+
+        if check_signatures:
+            if not verifier:
+                verifier = SignatureVerifier()
+            if not verifier.verify_all(self.transactions):
+                log.error("Not valid: cannot verify a transaction signature")
                 return False
-            transactions.append(json.dumps(transaction.to_dict()))
 
         if self.saved_hash != self.hash():
             log.error("Not valid: recalculating the hash results in a different hash")
             return False
 
-        if not self.validate_nonce(transactions, self.nonce):
+        if not self.validate_nonce(transactions, self.nonce, difficulty):
             log.error(f"Not valid: Nonce {self.nonce} does not fullfill the difficulty")
             return False
 
@@ -227,6 +501,8 @@ class Block(Serializable):
 
     def stop_mining(self) -> None:
         self.is_mining = False
+        if self.mining_pool:
+            self.mining_pool.abort(self)
 
     def get_mining_status(self) -> bool:
         return self.is_mining
@@ -235,33 +511,42 @@ class Block(Serializable):
         return self.iterations
 
     def determine_start_nonce(self) -> int:
-        data = Mapper().read_nonce_list()
-        if data:
-            data = data.split('\n')         # str.split() returns a list of strings
-            data.pop(-1)                    # remove the last element, since it is an empty string
-            self.nonce_list = sorted(list(map(int, data)))  # convert all str to int and sort
-
-        # only cluster every 5 blocks and when we have 15 initial values
-        if len(self.nonce_list) >= 15 and len(self.nonce_list) % 5 == 0:
-            data = np.array(self.nonce_list)
-            kmeans = KMeans(n_clusters=3).fit(data.reshape(-1, 1))
-            kmeans.predict(data.reshape(-1, 1))
-            # return the mean value between the first centroid and the smallest nonce in the list
-            return int((int(min(kmeans.cluster_centers_)[0]) + min(self.nonce_list)) / 2)
+        self.nonce_history = NonceHistory()
+        start_nonce = self.nonce_history.estimate_start_nonce()
+        if start_nonce is not None:
+            return start_nonce
         # else return the last determined start nonce
         return int(Mapper().read_latest_start_nonce())
 
-    def find_nonce(self, difficulty=4, method='bruteforce'):
+    def get_mining_engine(self, batch_size=None) -> MiningEngine:
+        ''' Returns a VectorizedMiningEngine if a batch size is given '''
         transactions = list()
         for t in self.transactions:
-            transactions.append(json.dumps(t.to_dict()))
+            transactions.append(t.get_leaf())
+        if batch_size:
+            return VectorizedMiningEngine(transactions, batch_size)
+        return MiningEngine(transactions)
+
+    def find_nonce(self, difficulty=DEFAULT_DIFFICULTY, method='bruteforce', pool=None,
+                   batch_size=4096):
+        '''
+        Methods: bruteforce, nonce-skip, multithreading and vectorized.
+        vectorized tests batch_size nonces at once, it uses the processes of pool if given.
+        difficulty is a Difficulty or a number of leading zero hex digits.
+        '''
+        difficulty = Difficulty.get(difficulty)
+        if method == 'vectorized':
+            engine = self.get_mining_engine(batch_size)
+        else:
+            engine = self.get_mining_engine()
 
         if method == 'bruteforce':
             nonce = 0
             while self.is_mining:
-                if self.validate_nonce(transactions, nonce, difficulty):
+                if engine.validate_nonce(nonce, difficulty):
                     log.info(f"successfull at {nonce}")
                     self.nonce = nonce
+                    self.iterations = nonce + 1
                     self.stop_mining()
                     return nonce
                 else:
@@ -272,25 +557,24 @@ class Block(Serializable):
             nonce = self.determine_start_nonce()
             Mapper().write_latest_start_nonce(str(nonce).encode())
 
-            # remove all elements from the nonce_list that are smaller than the starting nonce
-            self.nonce_list = list(filter(lambda x: x >= nonce, self.nonce_list))
-            index = 0
+            # the used nonces are sorted, so we only have to compare with the next used one
+            used_nonces = self.nonce_history.nonces
+            index = self.nonce_history.index_of(nonce)
             iterations = 0
             while self.is_mining:
                 # check if the nonce has already been used
-                if self.nonce_list and nonce == self.nonce_list[index]:
+                if index < len(used_nonces) and nonce == used_nonces[index]:
                     log.info(f"skipped {nonce}")
                     nonce += 1
-                    # check if we reached the end of the list
-                    if not (index + 1 == len(self.nonce_list)):
+                    while index < len(used_nonces) and used_nonces[index] < nonce:
                         index += 1
                     continue
-                elif self.validate_nonce(transactions, nonce, difficulty):
+                elif engine.validate_nonce(nonce, difficulty):
                     log.info(f"successfull at {nonce}")
                     self.nonce = nonce
                     self.iterations = iterations + 1
                     self.stop_mining()
-                    Mapper().append_to_nonce_list(nonce)
+                    self.nonce_history.add(nonce)
                     return nonce
                 else:
                     log.debug(f"not successfull at {nonce}")
@@ -300,80 +584,42 @@ class Block(Serializable):
                 if nonce > 2**32:
                     self.is_mining = False
 
-        elif method == 'multithreading':
-            max = 2**32  # use the max value of a 32-bit integer as the limit
-            cpus = mp.cpu_count()
-            individual_load = int((max/cpus) - (max/cpus) % 1)
-
-            processes = []
-            manager = mp.Manager()
-            shared_dict = manager.dict()
-            shared_dict["nonce"] = None
-            shared_dict["finished"] = []
-            run = manager.Event()
-            run.set()  # We should keep running.
-
-            for i in range(cpus):
-                process = mp.Process(target=self.mine_multithreaded,
-                                     args=(shared_dict, i, cpus, individual_load+1))
-                processes.append(process)
-
-            log.debug(f"Mining with processes {processes}")
+        elif method == 'vectorized' and pool is None:
+            nonce = 0
+            while self.is_mining:
+                found = engine.search(nonce, batch_size, 1, difficulty)
+                if found is not None:
+                    log.info(f"successfull at {found}")
+                    self.nonce = found
+                    self.iterations = nonce + batch_size    # the whole batch was hashed
+                    self.stop_mining()
+                    return found
+                nonce += batch_size
+
+        elif method in ('multithreading', 'vectorized'):
+            # use the pool of the node if there is one, otherwise start a pool for this block
+            temporary_pool = pool is None
+            if temporary_pool:
+                pool = MiningPool()
+            self.mining_pool = pool
+
             start_time = time.time()
-            for proc in processes:
-                if shared_dict["nonce"] is None:
-                    proc.start()
-                else:
-                    break
-                time.sleep(0.1)
-
-            while True:
-                if not self.is_mining:
-                    log.warning("mining will be stopped for external reasons")
-                    for proc in processes:
-                        if proc.is_alive():
-                            proc.terminate()
-                    break
-                elif shared_dict["nonce"] is not None:
-                    log.info(f"Found nonce {shared_dict['nonce']}")
-                    for proc in processes:
-                        if proc.is_alive():
-                            proc.terminate()
-                    break
-                elif len(shared_dict["finished"]) == cpus:
-                    log.error("Could not determine nonce with multithreading")
-                    break
-                else:
-                    time.sleep(0.1)
+            nonce = pool.mine(engine, difficulty, self)
+            if pool.last_job:
+                # all nonces tried by the workers, not only the ones up to the found nonce
+                self.iterations = pool.last_job["hashes"]
+            if nonce is None and not self.is_mining:
+                log.warning("mining was stopped for external reasons")
             log.debug(f"Took about {round(time.time() - start_time, 2)} seconds")
-            self.stop_mining()
-            return shared_dict["nonce"]
 
-    def mine_multithreaded(self, shared_dict, start=0, steps=1, times=1000):
-        transactions = list()
-        for t in self.transactions:
-            transactions.append(json.dumps(t.to_dict()))
-        nonce = start
-
-        while self.is_mining:
-            # Try with this nonce
-            if self.validate_nonce(transactions, nonce):
-                log.info(f"successfull at {nonce}")
-                shared_dict["nonce"] = nonce
-                return nonce
-            else:
-                log.debug(f"not successfull at {nonce}")
-            nonce += steps
+            if temporary_pool:
+                pool.shutdown()
+            self.mining_pool = None
+            self.stop_mining()
+            return nonce
 
-    def validate_nonce(self, transactions, nonce, difficulty=4):
+    def validate_nonce(self, transactions, nonce, difficulty=DEFAULT_DIFFICULTY):
         transactions.append(str(nonce))
         mtree = MerkleTree(transactions)
-        t_hash = mtree.getRootHash()
         transactions.pop()
-        # check the result
-        important_digits = t_hash[0:difficulty]
-        not_null_digits = important_digits.replace("0", "")
-
-        if len(not_null_digits) == 0:
-            return True
-        return False
+        return Difficulty.get(difficulty).check(mtree.getRoot())
@@ -0,0 +1,94 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+from blockchain.block import Block
+from db.mapper import Mapper
+
+log = logging.getLogger()
+
+
+class BlockCache:
+    '''
+    Read-through cache of decoded blocks by hash in front of Mapper.read_block, so recent
+    blocks that are read again and again (e.g. when several peers download the new blocks)
+    are not read from disk and decoded every time.
+
+    The least recently used blocks are removed when there are more than max_entries blocks or
+    their size is more than max_bytes. The size of a block is approximated by the size of the
+    stored block. The cached blocks are shared and must not be modified.
+    '''
+
+    def __init__(self, max_entries=1000, max_bytes=32 * 1024 * 1024) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # block hash -> (block, size)
+        self.blocks = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, block_hash, block_bytes=None) -> Optional[Block]:
+        '''
+        Returns None if the block doesn't exist. block_bytes is the stored block if the caller
+        has read it already, it is only decoded if the block is not cached.
+        '''
+        with self.lock:
+            entry = self.blocks.get(block_hash)
+            if entry is not None:
+                self.hits += 1
+                self.blocks.move_to_end(block_hash)
+                return entry[0]
+            self.misses += 1
+        if block_bytes is None:
+            block_bytes = Mapper.read_block_bytes(block_hash)
+        if block_bytes is None:
+            return None
+        block = Block.from_bytes(block_bytes, block_hash)
+        self.add(block_hash, block, len(block_bytes))
+        return block
+
+    def add(self, block_hash, block: Block, size: int) -> None:
+        with self.lock:
+            previous = self.blocks.pop(block_hash, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self.blocks[block_hash] = (block, size)
+            self.size += size
+            while len(self.blocks) > self.max_entries or \
+                    (self.size > self.max_bytes and len(self.blocks) > 1):
+                _, (_, evicted_size) = self.blocks.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, block_hash) -> None:
+        with self.lock:
+            entry = self.blocks.pop(block_hash, None)
+            if entry is not None:
+                self.size -= entry[1]
+
+    def clear(self) -> None:
+        ''' Called when the blockchain is replaced '''
+        with self.lock:
+            self.blocks.clear()
+            self.size = 0
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.blocks),
+                "bytes": self.size,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# shared by all conversations of this process
+block_cache = BlockCache()
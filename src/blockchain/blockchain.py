@@ -1,7 +1,8 @@
 import hashlib
-import os
 import logging
+from typing import Optional
 from blockchain.block import Block
+from blockchain.mining_job import MiningJob
 from db.mapper import Mapper
 from network.conversations.block_broadcasting import Block_broadcasting
 
@@ -9,50 +10,62 @@ log = logging.getLogger()
 
 
 class Blockchain():
-    def add_block(self, transactions, node=None):
-        pred_hash = Mapper().read_latest_block_hash()
-
-        block = Block(pred=pred_hash)
-        for transaction in transactions:
-            block.add_transaction(transaction)
-
+    def add_block(self, transactions, node=None) -> Optional[MiningJob]:
+        '''
+        Mine a block with the transactions in the background and return the mining job.
+        When the job is done, the block is validated, saved and broadcasted by save_mined_block.
+        If transactions is None, the block is created from a template of the mempool.
+        '''
         if not node:
             log.error("No node specified, cannot mine block")
-            return
+            return None
+
+        if transactions is None:
+            transactions = node.mempool.get_block_template()
+            if not transactions:
+                log.info("No transactions in the mempool, cannot mine block")
+                return None
 
-        node.set_currently_mined_block(block)
-        block.set_nonce(block.find_nonce())
+        job = node.create_mining_job(transactions)
+        job.add_done_callback(lambda job: self.save_mined_block(job, node))
+        return job.start()
+
+    def save_mined_block(self, job: MiningJob, node):
+        if not self.save_block(job, node):
+            # the transactions can be used for the next block
+            node.mempool.release(job.transactions)
+
+    def save_block(self, job: MiningJob, node) -> bool:
+        if job.cancelled() or job.future.exception() is not None:
+            return False
+        block = job.result()
+        log.info(f"Mined block in {round(job.progress()['elapsed'], 2)} seconds")
 
         block_hash = block.hash()
         log.debug(f"{block_hash=}")
         block.set_saved_hash(block_hash)
-        cwd = os.getcwd()
-
-        if cwd.endswith('tests'):
-            cwd = os.path.dirname(os.getcwd())   # if in directory 'tests', go one directory up
-        my_block_hashes = os.listdir(cwd + "/db/blocks/")
 
-        if block.validate() is False:
+        if block.validate(node.difficulty, node.signature_verifier) is False:
             log.info("The block is not valid")
-            return
+            return False
 
-        if block_hash in my_block_hashes:
+        if Mapper().has_block(block_hash):
             log.info("The local blockchain contains the block already")
-            return
+            return False
 
-        block.write_to_file()
-        Mapper().write_latest_block_hash(block_hash)
+        Mapper().commit_blocks([(block_hash, block.serialize())], block_hash)
+        node.mempool.remove_transactions(block.transactions)
         log.info("block saved")
 
         if node:
             block_broadcasting = Block_broadcasting(node)
             block_broadcasting.broadcast_block(block)
             log.info("block broadcasted")
+        return True
 
     def create_genesis_block(self):
         block = Block()
         block = block.serialize()
         block_hash = hashlib.sha256(block).hexdigest()
 
-        Mapper().write_block(block_hash, block)
-        Mapper().write_latest_block_hash(block_hash)
+        Mapper().commit_blocks([(block_hash, block)], block_hash)
@@ -0,0 +1,76 @@
+import argparse
+from typing import Union
+
+MAX_TARGET = 2**256 - 1
+
+
+def leading_zero_bits(value: str) -> int:
+    ''' argparse type of a difficulty given as number of leading zero bits, 0 to 256 '''
+    try:
+        bits = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not a number of bits")
+    if not 0 <= bits <= 256:
+        raise argparse.ArgumentTypeError(f"{bits} is not between 0 and 256")
+    return bits
+
+
+class Difficulty:
+    '''
+    Proof of work target. A nonce is valid if the merkle root of the block, read as a 256-bit
+    big-endian number, is not greater than the target.
+
+    Difficulties used to be a number of leading zero hex digits, which are steps of 4 bits.
+    from_bits allows every number of leading zero bits and any other target can be given
+    directly, so the difficulty can be tuned in much finer steps.
+    '''
+
+    def __init__(self, target: int) -> None:
+        if not 0 <= target <= MAX_TARGET:
+            raise ValueError(f"Target {target} is not a 256-bit number")
+        self.target = target
+        # the digest is compared with these bytes, which is the same as comparing the numbers
+        self.target_bytes = target.to_bytes(32, "big")
+
+    @staticmethod
+    def from_bits(bits: int) -> 'Difficulty':
+        ''' The first bits bits of the root have to be zero '''
+        if not 0 <= bits <= 256:
+            raise ValueError(f"Invalid number of leading zero bits: {bits}")
+        return Difficulty(MAX_TARGET >> bits)
+
+    @staticmethod
+    def from_hex_digits(digits: int) -> 'Difficulty':
+        ''' The first digits hex digits of the root have to be zero, like before '''
+        return Difficulty.from_bits(4 * digits)
+
+    @staticmethod
+    def get(difficulty: Union['Difficulty', int]) -> 'Difficulty':
+        ''' Integers are a number of leading zero hex digits, as in the old find_nonce API '''
+        if isinstance(difficulty, Difficulty):
+            return difficulty
+        return Difficulty.from_hex_digits(difficulty)
+
+    def check(self, digest: bytes) -> bool:
+        return digest <= self.target_bytes
+
+    def check_hex(self, t_hash: str) -> bool:
+        return self.check(bytes.fromhex(t_hash))
+
+    def get_target_words(self):
+        ''' The target as 8 big-endian 32-bit words, for the vectorized search '''
+        return [(self.target >> (224 - 32 * i)) & 0xffffffff for i in range(8)]
+
+    def get_bits(self) -> int:
+        ''' Number of leading zero bits that every valid root has '''
+        return 256 - self.target.bit_length()
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Difficulty) and self.target == other.target
+
+    def __repr__(self) -> str:
+        return f"Difficulty({self.target:#066x})"
+
+
+# 4 leading zero hex digits, the difficulty that was used before targets were introduced
+DEFAULT_DIFFICULTY = Difficulty.from_hex_digits(4)
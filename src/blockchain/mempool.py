@@ -0,0 +1,145 @@
+import logging
+import threading
+from typing import Dict, List, Optional
+from blockchain.block import Transaction
+
+log = logging.getLogger()
+
+
+class Mempool:
+    '''
+    Validated transactions that are not in a block yet.
+
+    The transactions are indexed by their hash, so a transaction that is received again is
+    ignored, and by their sender. They are ordered by their arrival, a block template contains
+    the oldest transactions first. The mempool holds at most max_size transactions and at most
+    max_per_sender of one sender. When it is full, a transaction of the sender with the most
+    transactions is evicted, so one busy sender can't push out all the others.
+
+    Transactions in a block template are reserved until the block is saved, then they are
+    removed. If the block is not saved, e.g. because mining was cancelled, they are released
+    and can be used for the next block.
+    '''
+
+    def __init__(self, max_size=10000, max_per_sender=100) -> None:
+        self.max_size = max_size
+        self.max_per_sender = max_per_sender
+        # transaction hash -> transaction, the dict keeps the arrival order
+        self.transactions: Dict[str, Transaction] = {}
+        # sender -> hashes of the sender's transactions in arrival order
+        self.by_sender: Dict[str, Dict[str, None]] = {}
+        # hashes of the transactions in block templates that are being mined
+        self.reserved = set()
+        # used by the connection threads, the main thread and the mining jobs
+        self.lock = threading.RLock()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.transactions)
+
+    def __contains__(self, tx_hash) -> bool:
+        return tx_hash in self.transactions
+
+    def add(self, transaction: Transaction) -> bool:
+        ''' Returns False if the transaction is already in the mempool or there is no space '''
+        tx_hash = transaction.hash()
+        sender = transaction.source
+        with self.lock:
+            if tx_hash in self.transactions:
+                log.debug(f"transaction {tx_hash} is already in the mempool")
+                return False
+            sender_hashes = self.by_sender.get(sender, {})
+            if len(sender_hashes) >= self.max_per_sender:
+                log.warning(f"{sender} has too many transactions in the mempool")
+                return False
+            if len(self.transactions) >= self.max_size and not self.evict(sender):
+                log.warning("the mempool is full")
+                return False
+
+            self.transactions[tx_hash] = transaction
+            self.by_sender.setdefault(sender, {})[tx_hash] = None
+        log.debug(f"transaction {tx_hash} added to the mempool")
+        return True
+
+    def evict(self, new_sender) -> bool:
+        ''' Remove the newest transaction of the sender with the most transactions '''
+        candidates = [sender for sender, hashes in self.by_sender.items()
+                      if any(tx_hash not in self.reserved for tx_hash in hashes)]
+        if not candidates:
+            return False
+        sender = max(candidates, key=lambda sender: len(self.by_sender[sender]))
+        new_sender_count = len(self.by_sender.get(new_sender, {})) + 1
+        if len(self.by_sender[sender]) <= new_sender_count:
+            # the new transaction would be the one with the lowest priority
+            return False
+        tx_hash = next(tx_hash for tx_hash in reversed(self.by_sender[sender])
+                       if tx_hash not in self.reserved)
+        self.remove(tx_hash)
+        self.evictions += 1
+        return True
+
+    def get(self, tx_hash) -> Optional[Transaction]:
+        with self.lock:
+            return self.transactions.get(tx_hash)
+
+    def get_by_sender(self, sender) -> List[Transaction]:
+        with self.lock:
+            return [self.transactions[tx_hash] for tx_hash in self.by_sender.get(sender, {})]
+
+    def remove(self, tx_hash) -> None:
+        with self.lock:
+            transaction = self.transactions.pop(tx_hash, None)
+            if transaction is None:
+                return
+            self.reserved.discard(tx_hash)
+            sender = transaction.source
+            del self.by_sender[sender][tx_hash]
+            if not self.by_sender[sender]:
+                del self.by_sender[sender]
+
+    def remove_transactions(self, transactions) -> None:
+        ''' Called when a block with the transactions was saved '''
+        with self.lock:
+            for transaction in transactions:
+                self.remove(transaction.hash())
+
+    def get_block_template(self, max_transactions=100) -> List[Transaction]:
+        '''
+        The oldest transactions that are not reserved yet, without transactions that would
+        send more than the balance of their sender. The transactions are reserved.
+        '''
+        template = []
+        spent = {}
+        with self.lock:
+            for tx_hash, transaction in self.transactions.items():
+                if len(template) >= max_transactions:
+                    break
+                if tx_hash in self.reserved:
+                    continue
+                sender = transaction.source
+                if sender not in spent:
+                    # the reserved transactions are in blocks that are not saved yet
+                    spent[sender] = sum(self.transactions[reserved_hash].amount
+                                        for reserved_hash in self.by_sender[sender]
+                                        if reserved_hash in self.reserved)
+                if spent[sender] + transaction.amount > transaction.get_balance():
+                    continue
+                spent[sender] += transaction.amount
+                template.append(transaction)
+                self.reserved.add(tx_hash)
+        return template
+
+    def release(self, transactions) -> None:
+        ''' The block with the transactions was not saved, they can be used for another block '''
+        with self.lock:
+            for transaction in transactions:
+                self.reserved.discard(transaction.hash())
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "transactions": len(self.transactions),
+                "senders": len(self.by_sender),
+                "reserved": len(self.reserved),
+                "evictions": self.evictions,
+            }
@@ -1,55 +1,102 @@
 import hashlib
 import logging
-from typing import List
+from typing import List, Tuple
 
 log = logging.getLogger()
 
+DIGEST_SIZE = 32
 
-class Tree_Node:
-    def __init__(self, left, right, value: str) -> None:
-        self.left: Tree_Node = left
-        self.right: Tree_Node = right
-        self.value = value
 
-    @staticmethod
-    def hash(val: str) -> str:
-        return hashlib.sha256(val.encode('utf-8')).hexdigest()
+def double_hash(val: str) -> str:
+    return hashlib.sha256(hashlib.sha256(val.encode('utf-8')).hexdigest()
+                          .encode('utf-8')).hexdigest()
 
-    @staticmethod
-    def doubleHash(val: str) -> str:
-        return Tree_Node.hash(Tree_Node.hash(val))
+
+def hash_leaf(val: str) -> bytes:
+    ''' Raw digest of a leaf, bytes.hex() of it is double_hash(val) '''
+    return hashlib.sha256(hashlib.sha256(val.encode('utf-8')).hexdigest()
+                          .encode('utf-8')).digest()
+
+
+def hash_nodes(left: bytes, right: bytes) -> bytes:
+    ''' Raw digest of an inner node, the hex representations of the children are hashed '''
+    return hash_leaf(left.hex() + right.hex())
 
 
 class MerkleTree:
+    '''
+    Merkle tree that stores every level as one contiguous bytes object of 32-byte digests.
+    levels[0] are the leaves, levels[-1] is the root.
+
+    The hex strings of the children are double hashed like in the previous Tree_Node based
+    implementation, so the roots are the same for the numbers of leaves it could handle. It
+    raised a RecursionError for others (e.g. 5, 6 and 9 to 14 leaves); now the last node of a
+    level with an odd number of nodes is hashed with itself, which defines the roots for these.
+    '''
+
     def __init__(self, values: List[str]) -> None:
+        if not values:
+            raise ValueError("Cannot build a merkle tree without values")
+        self.size = len(values)
+        self.levels: List[bytes] = []
         self.__buildTree(values)
 
     def __buildTree(self, values: List[str]) -> None:
-        leaves: List[Tree_Node] = [Tree_Node(None, None, Tree_Node.doubleHash(e)) for e in values]
-        if len(leaves) % 2 == 1:
-            leaves.append(leaves[-1:][0])  # duplicate last elem if odd number of elements
-        self.root: Tree_Node = self.__buildTreeRec(leaves)
-
-    def __buildTreeRec(self, nodes: List[Tree_Node]) -> Tree_Node:
-        half: int = len(nodes) // 2
-
-        if len(nodes) == 2:
-            return Tree_Node(nodes[0], nodes[1],
-                             Tree_Node.doubleHash(nodes[0].value + nodes[1].value))
+        level = b''.join(hash_leaf(value) for value in values)
+        while True:
+            view = memoryview(level)
+            width = len(level) // DIGEST_SIZE
+            if width % 2 == 1:
+                # duplicate last elem if odd number of elements
+                level += bytes(view[-DIGEST_SIZE:])
+                view = memoryview(level)
+                width += 1
+            self.levels.append(level)
+            level = b''.join(
+                hash_nodes(bytes(view[i:i + DIGEST_SIZE]),
+                           bytes(view[i + DIGEST_SIZE:i + 2 * DIGEST_SIZE]))
+                for i in range(0, width * DIGEST_SIZE, 2 * DIGEST_SIZE))
+            if width == 2:
+                self.levels.append(level)
+                break
 
-        left: Tree_Node = self.__buildTreeRec(nodes[:half])
-        right: Tree_Node = self.__buildTreeRec(nodes[half:])
-        value: str = Tree_Node.doubleHash(left.value + right.value)
-        return Tree_Node(left, right, value)
+    def get_node(self, level: int, index: int) -> bytes:
+        offset = index * DIGEST_SIZE
+        return self.levels[level][offset:offset + DIGEST_SIZE]
 
     def printTree(self) -> None:
-        self.__printTreeRec(self.root)
+        for depth, level in enumerate(reversed(self.levels)):
+            for i in range(0, len(level), DIGEST_SIZE):
+                log.info(f"{depth}: {level[i:i + DIGEST_SIZE].hex()}")
 
-    def __printTreeRec(self, node) -> None:
-        if node is not None:
-            log.info(node.value)
-            self.__printTreeRec(node.left)
-            self.__printTreeRec(node.right)
+    def getRoot(self) -> bytes:
+        return self.levels[-1]
 
     def getRootHash(self) -> str:
-        return self.root.value
+        return self.getRoot().hex()
+
+    def get_proof(self, index: int) -> List[Tuple[str, bool]]:
+        '''
+        Create an inclusion proof for the leaf at index.
+        The proof is a list of (sibling hash, sibling is left) from the leaves up to the root.
+        '''
+        if index < 0 or index >= self.size:
+            raise IndexError(f"No leaf with index {index}")
+        proof = []
+        for level in range(len(self.levels) - 1):
+            sibling_is_left = index % 2 == 1
+            sibling = index - 1 if sibling_is_left else index + 1
+            proof.append((self.get_node(level, sibling).hex(), sibling_is_left))
+            index //= 2
+        return proof
+
+    @staticmethod
+    def verify_proof(leaf: str, proof: List[Tuple[str, bool]], root: str) -> bool:
+        ''' Check that the value leaf is part of the tree with the root hash root '''
+        node = hash_leaf(leaf)
+        for sibling, sibling_is_left in proof:
+            if sibling_is_left:
+                node = hash_nodes(bytes.fromhex(sibling), node)
+            else:
+                node = hash_nodes(node, bytes.fromhex(sibling))
+        return node.hex() == root
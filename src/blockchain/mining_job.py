@@ -0,0 +1,210 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, CancelledError
+from typing import Callable, Optional
+from blockchain.block import Block
+from blockchain.block_cache import block_cache
+from db.mapper import Mapper
+
+log = logging.getLogger()
+
+
+class MiningJob:
+    '''
+    Mines a block with the mining pool of the node in a background thread, so the node keeps
+    handling messages from the network in the meantime.
+
+    The job works like a concurrent.futures.Future: result() returns the mined block,
+    add_done_callback() registers a function that is called with the job when it is finished,
+    and cancel() stops the mining. restart() starts over on top of the current latest block,
+    e.g. when a competing block was received. The transactions that were saved in the new
+    blocks in the meantime are not mined again, if none are left the job is cancelled.
+    '''
+
+    def __init__(self, transactions, node, previous_job: 'MiningJob' = None) -> None:
+        self.transactions = transactions
+        self.node = node
+        # transactions of a block template, they are removed from the mempool when they are
+        # saved in another block
+        self.from_mempool = {t.hash() for t in transactions if t.hash() in node.mempool}
+        self.previous_job = previous_job
+        self.future = Future()
+        self.block: Optional[Block] = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.lock = threading.Lock()
+        self.cancel_requested = False
+        self.restart_requested = False
+        self.restarts = 0
+        self.start_time = None
+        self.end_time = None
+        self.hashes_at_end = None
+        self.stop_requested_at = None
+        self.cancel_latency = None
+        self.hashes_at_start = 0
+
+    def start(self) -> 'MiningJob':
+        self.thread.start()
+        return self
+
+    def create_block(self) -> Block:
+        block = Block(pred=Mapper().read_latest_block_hash())
+        for transaction in self.transactions:
+            block.add_transaction(transaction)
+        return block
+
+    def remove_saved_transactions(self, predecessor) -> None:
+        '''
+        Remove the transactions that were saved since the block on top of predecessor was
+        created: the transactions of the template that are no longer in the mempool and the
+        transactions of the new blocks on the chain of the latest block
+        '''
+        if predecessor is None or predecessor == Mapper().read_latest_block_hash():
+            saved = set()
+        else:
+            new_blocks = Mapper().get_block_hashes_after(predecessor)
+            if new_blocks is not None:
+                saved = set()
+                for block_hash in new_blocks:
+                    block = block_cache.get(block_hash)
+                    if block is not None:
+                        saved.update(t.hash() for t in block.transactions)
+            else:
+                # the chain was replaced by a chain without predecessor, its blocks are read
+                # once from the latest block back until all transactions are found
+                pending = {t.hash() for t in self.transactions}
+                saved = set()
+                for block_hash in reversed(Mapper().get_chain_hashes()):
+                    if not pending:
+                        break
+                    block = block_cache.get(block_hash)
+                    if block is not None:
+                        found = pending.intersection(t.hash() for t in block.transactions)
+                        saved.update(found)
+                        pending.difference_update(found)
+        self.node.mempool.remove_transactions([t for t in self.transactions
+                                               if t.hash() in saved])
+        removed = {t.hash() for t in self.transactions if t.hash() in self.from_mempool
+                   and t.hash() not in self.node.mempool}
+        self.transactions = [t for t in self.transactions
+                             if t.hash() not in saved and t.hash() not in removed]
+
+    def run(self) -> None:
+        if not self.future.set_running_or_notify_cancel():
+            return
+        # only one block can be mined at a time, wait for the job that was started before
+        if self.previous_job:
+            self.previous_job.wait()
+            self.previous_job = None
+
+        self.start_time = time.perf_counter()
+        self.hashes_at_start = self.node.mining_pool.get_hashes()
+        try:
+            while True:
+                with self.lock:
+                    if self.cancel_requested:
+                        break
+                    # a waiting job was created before the previous blocks were saved
+                    count = len(self.transactions)
+                    self.remove_saved_transactions(self.block.predecessor if self.block
+                                                   else None)
+                    if count and not self.transactions:
+                        log.info("All transactions were saved in other blocks, mining stopped")
+                        break
+                    self.restart_requested = False
+                    self.block = self.create_block()
+                    self.node.set_currently_mined_block(self.block)
+
+                nonce = self.block.find_nonce(self.node.difficulty, 'multithreading',
+                                              self.node.mining_pool)
+
+                with self.lock:
+                    if self.cancel_requested:
+                        break
+                    if nonce is not None and not self.restart_requested \
+                            and self.block.predecessor == Mapper().read_latest_block_hash():
+                        self.block.set_nonce(nonce)
+                        self.finish()
+                        self.future.set_result(self.block)
+                        return
+                    if nonce is not None:
+                        log.info("The latest block changed while mining, mining again")
+                    self.restarts += 1
+                self.record_stop_latency()
+        except Exception as e:
+            log.error(f"Mining failed: {e}")
+            self.finish()
+            self.future.set_exception(e)
+            return
+
+        self.record_stop_latency()
+        self.finish()
+        if self.cancel_requested:
+            log.info(f"Mining cancelled, the workers stopped {self.cancel_latency} seconds "
+                     "after the cancel request")
+        self.future.set_exception(CancelledError())
+
+    def finish(self) -> None:
+        self.end_time = time.perf_counter()
+        self.hashes_at_end = self.node.mining_pool.get_hashes()
+        self.node.set_currently_mined_block(None)
+
+    def record_stop_latency(self) -> None:
+        if self.stop_requested_at is not None:
+            self.cancel_latency = time.perf_counter() - self.stop_requested_at
+            self.stop_requested_at = None
+
+    def restart(self) -> None:
+        ''' Mine the transactions again on top of the latest block '''
+        with self.lock:
+            if self.future.done() or self.block is None:
+                return
+            self.restart_requested = True
+            self.stop_requested_at = time.perf_counter()
+            self.block.stop_mining()
+        log.info("Restarting mining on top of the new latest block")
+
+    def cancel(self) -> bool:
+        with self.lock:
+            if self.future.done():
+                return False
+            if self.future.cancel():     # not started yet
+                return True
+            self.cancel_requested = True
+            self.stop_requested_at = time.perf_counter()
+            if self.block:
+                self.block.stop_mining()
+        return True
+
+    def cancelled(self) -> bool:
+        return self.future.cancelled() or self.cancel_requested
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def wait(self, timeout=None) -> None:
+        try:
+            self.future.exception(timeout)
+        except CancelledError:
+            pass
+
+    def result(self, timeout=None) -> Block:
+        return self.future.result(timeout)
+
+    def add_done_callback(self, fn: Callable[['MiningJob'], None]) -> None:
+        self.future.add_done_callback(lambda future: fn(self))
+
+    def progress(self) -> dict:
+        ''' Nonces tried so far (over all restarts) and the elapsed time in seconds '''
+        if self.start_time is None:
+            return {"nonces": 0, "elapsed": 0.0, "restarts": 0, "done": self.done()}
+        hashes = self.hashes_at_end
+        if hashes is None:
+            hashes = self.node.mining_pool.get_hashes()
+        end_time = self.end_time or time.perf_counter()
+        return {
+            "nonces": hashes - self.hashes_at_start,
+            "elapsed": end_time - self.start_time,
+            "restarts": self.restarts,
+            "done": self.done(),
+        }
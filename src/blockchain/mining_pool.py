@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+import multiprocessing as mp
+from multiprocessing.connection import wait
+from typing import Optional
+from .difficulty import DEFAULT_DIFFICULTY
+
+log = logging.getLogger()
+
+
+def mine_worker(conn, generation, hashes, index) -> None:
+    '''
+    Main loop of a worker process. A job is a tuple (generation, engine, difficulty, start, step).
+    The worker tries every step-th nonce beginning at start until it finds a valid nonce or
+    the shared generation is changed by the pool, which means that the job was aborted.
+    The generation is checked after every engine.batch_size nonces.
+    For every job the worker sends exactly one answer: ("found", generation, nonce) or
+    ("halted", generation, None)
+    '''
+    while True:
+        job = conn.recv()
+        if job is None:     # shutdown
+            return
+        job_generation, engine, difficulty, nonce, step = job
+        result = ("halted", job_generation, None)
+        while generation.value == job_generation:
+            found = engine.search(nonce, engine.batch_size, step, difficulty)
+            hashes[index] += engine.batch_size
+            if found is not None:
+                result = ("found", job_generation, found)
+                break
+            nonce += engine.batch_size * step
+        conn.send(result)
+
+
+class MiningPool:
+    '''
+    Long-lived pool of mining processes.
+
+    The processes are started once and wait for jobs on a pipe. Jobs are cancelled through a
+    generation counter in shared memory: every job gets a new generation and the workers stop
+    as soon as the shared generation doesn't match the generation of their job anymore.
+    Starting a new job while another one is running cancels the running one, the workers
+    then continue with the new block template without being restarted.
+    '''
+
+    def __init__(self, processes: int = None) -> None:
+        self.processes = processes or mp.cpu_count()
+        self.generation = mp.RawValue('Q', 0)
+        self.hashes = mp.RawArray('Q', self.processes)
+        self.workers = []
+        self.connections = []
+        self.last_generation = 0
+        self.generation_lock = threading.Lock()
+        self.job_lock = threading.Lock()
+        self.current_block = None
+        self.stop_requested_at = None
+        self.last_job = None
+        self.stats = {
+            "jobs": 0,
+            "nonces_found": 0,
+            "hashes": 0,
+            "seconds": 0.0,
+            "hashes_per_second": 0.0,
+            "stop_latency": None,
+        }
+
+    def start(self) -> None:
+        if self.workers:
+            return
+        for index in range(self.processes):
+            parent_conn, child_conn = mp.Pipe()
+            worker = mp.Process(target=mine_worker, daemon=True,
+                                args=(child_conn, self.generation, self.hashes, index))
+            worker.start()
+            self.workers.append(worker)
+            self.connections.append(parent_conn)
+        log.debug(f"Started mining pool with {self.processes} processes")
+
+    def shutdown(self) -> None:
+        self.abort()
+        for conn in self.connections:
+            conn.send(None)
+        for worker in self.workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+        self.connections = []
+
+    def is_running(self) -> bool:
+        return len(self.workers) > 0
+
+    def __next_generation(self) -> int:
+        with self.generation_lock:
+            self.last_generation += 1
+            self.generation.value = self.last_generation
+            return self.last_generation
+
+    def abort(self, block=None) -> None:
+        ''' Cancel the running job, or only the job of block if block is given '''
+        if block is not None and block is not self.current_block:
+            return
+        self.stop_requested_at = time.perf_counter()
+        self.__next_generation()
+
+    def mine(self, engine, difficulty=DEFAULT_DIFFICULTY, block=None) -> Optional[int]:
+        '''
+        Search a nonce for the block template of engine with all processes of the pool.
+        Returns the nonce or None if the job was aborted or replaced by another job.
+        '''
+        if not self.is_running():
+            self.start()
+
+        # cancel a running job right away, so its workers are free for the new template
+        self.stop_requested_at = time.perf_counter()
+        generation = self.__next_generation()
+        with self.job_lock:
+            if self.generation.value != generation:
+                return None     # replaced by a newer job while waiting for the old one
+            if block is not None and not block.get_mining_status():
+                return None
+            self.current_block = block
+
+            hashes_before = sum(self.hashes)
+            start_time = time.perf_counter()
+            self.stop_requested_at = None
+            for index, conn in enumerate(self.connections):
+                conn.send((generation, engine, difficulty, index, self.processes))
+
+            nonce = None
+            pending = list(self.connections)
+            while pending:
+                for conn in wait(pending):
+                    answer, job_generation, value = conn.recv()
+                    if job_generation != generation:
+                        continue
+                    pending.remove(conn)
+                    if answer == "found" and nonce is None:
+                        nonce = value
+                        log.info(f"Found nonce {nonce}")
+                        self.abort()
+
+            halted_at = time.perf_counter()
+            self.current_block = None
+            self.__update_stats(sum(self.hashes) - hashes_before, halted_at - start_time,
+                                nonce is not None, halted_at)
+            return nonce
+
+    def __update_stats(self, hashes, seconds, found, halted_at) -> None:
+        self.last_job = {"hashes": hashes, "seconds": seconds}
+        self.stats["jobs"] += 1
+        self.stats["hashes"] += hashes
+        self.stats["seconds"] += seconds
+        if found:
+            self.stats["nonces_found"] += 1
+        if self.stats["seconds"] > 0:
+            self.stats["hashes_per_second"] = self.stats["hashes"] / self.stats["seconds"]
+        if self.stop_requested_at is not None:
+            self.stats["stop_latency"] = halted_at - self.stop_requested_at
+        log.info(f"Mining job took {round(seconds, 3)} seconds, "
+                 f"{round(self.stats['hashes_per_second'])} nonces per second")
+        if self.stats["stop_latency"] is not None:
+            log.info(f"Workers halted {round(self.stats['stop_latency'] * 1000, 2)} ms after "
+                     "the stop request")
+
+    def get_hashes(self) -> int:
+        ''' Number of nonces tried by all workers since the pool was started '''
+        return sum(self.hashes)
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        if self.stats["seconds"] > 0:
+            stats["nonces_found_per_second"] = self.stats["nonces_found"] / self.stats["seconds"]
+        return stats
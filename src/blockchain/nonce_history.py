@@ -0,0 +1,68 @@
+import bisect
+import logging
+from typing import Optional
+from db.mapper import Mapper
+
+log = logging.getLogger()
+
+
+class NonceHistory:
+    '''
+    Nonces of the previously mined blocks, used by the nonce-skip mining method.
+
+    The nonces are kept in the sorted nonce index of the Mapper, so checking if a nonce was
+    already used is a binary search. The nonces are clustered with an online version of
+    k-means: every new nonce only moves its nearest centroid, instead of fitting KMeans on the
+    whole history again.
+    '''
+    CLUSTERS = 3
+    MIN_NONCES = 15     # only estimate a start nonce when we have 15 initial values
+
+    def __init__(self) -> None:
+        self.nonces = Mapper().read_nonce_index()
+        self.clusters = Mapper().read_nonce_clusters()
+        if self.clusters is None and len(self.nonces) >= self.MIN_NONCES:
+            self.clusters = self.seed_clusters()
+            Mapper().write_nonce_clusters(self.clusters)
+
+    def seed_clusters(self) -> dict:
+        ''' Initial centroids: the means of the sorted nonces split into equal parts '''
+        size = len(self.nonces) // self.CLUSTERS
+        centroids = []
+        counts = []
+        for i in range(self.CLUSTERS):
+            end = len(self.nonces) if i == self.CLUSTERS - 1 else (i + 1) * size
+            part = self.nonces[i * size:end]
+            centroids.append(sum(part) / len(part))
+            counts.append(len(part))
+        return {"centroids": centroids, "counts": counts}
+
+    def add(self, nonce: int) -> None:
+        Mapper().append_to_nonce_list(nonce)
+        self.nonces = Mapper().read_nonce_index()
+        if self.clusters is None:
+            if len(self.nonces) >= self.MIN_NONCES:
+                self.clusters = self.seed_clusters()
+        else:
+            # move the nearest centroid towards the new nonce
+            centroids = self.clusters["centroids"]
+            counts = self.clusters["counts"]
+            nearest = min(range(len(centroids)), key=lambda i: abs(centroids[i] - nonce))
+            counts[nearest] += 1
+            centroids[nearest] += (nonce - centroids[nearest]) / counts[nearest]
+        if self.clusters is not None:
+            Mapper().write_nonce_clusters(self.clusters)
+
+    def estimate_start_nonce(self) -> Optional[int]:
+        ''' The mean value between the first centroid and the smallest nonce '''
+        if self.clusters is None:
+            return None
+        return int((int(min(self.clusters["centroids"])) + self.nonces[0]) / 2)
+
+    def index_of(self, nonce: int) -> int:
+        ''' Position of the first used nonce that is not smaller than nonce '''
+        return bisect.bisect_left(self.nonces, nonce)
+
+    def is_used(self, nonce: int) -> bool:
+        index = self.index_of(nonce)
+        return index < len(self.nonces) and self.nonces[index] == nonce
@@ -0,0 +1,164 @@
+'''
+SHA-256 for a whole batch of messages at once with NumPy.
+
+Every value in the calculation is an array of uint32 words with one entry per message, so one
+NumPy operation does the work of one SHA-256 step for all nonces in the batch.
+Arrays have the shape (words, batch): a message block is (16, batch), a state is (8, batch).
+'''
+
+import numpy as np
+from typing import List, Optional
+
+K = np.array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+], dtype=np.uint32)
+
+H0 = np.array([
+    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+], dtype=np.uint32).reshape(8, 1)
+
+POWERS_OF_TEN = np.array([10**i for i in range(20)], dtype=np.uint64)
+MAX_DIGITS = 20     # a uint64 has at most 20 decimal digits
+NIBBLE_SHIFTS = np.arange(28, -1, -4, dtype=np.uint32).reshape(1, 8, 1)
+
+
+def rotr(x, n):
+    return (x >> np.uint32(n)) | (x << np.uint32(32 - n))
+
+
+def expand(block) -> List:
+    ''' Message schedule of a block, already added to the round constants '''
+    w = list(block)
+    for t in range(16, 64):
+        s0 = rotr(w[t - 15], 7) ^ rotr(w[t - 15], 18) ^ (w[t - 15] >> np.uint32(3))
+        s1 = rotr(w[t - 2], 17) ^ rotr(w[t - 2], 19) ^ (w[t - 2] >> np.uint32(10))
+        w.append(w[t - 16] + s0 + w[t - 7] + s1)
+    return [w[t] + K[t] for t in range(64)]
+
+
+def compress(state, schedule):
+    a, b, c, d, e, f, g, h = state
+    for kw in schedule:
+        t1 = h + (rotr(e, 6) ^ rotr(e, 11) ^ rotr(e, 25)) + ((e & f) ^ (~e & g)) + kw
+        t2 = (rotr(a, 2) ^ rotr(a, 13) ^ rotr(a, 22)) + ((a & b) ^ (a & c) ^ (b & c))
+        h, g, f, e, d, c, b, a = g, f, e, d + t1, c, b, a, t1 + t2
+    return np.stack([a, b, c, d, e, f, g, h]) + state
+
+
+def padding_block(message_length: int):
+    ''' The last block of a message whose length is a multiple of 64 bytes '''
+    block = np.zeros((16, 1), dtype=np.uint32)
+    block[0] = 0x80000000
+    block[15] = message_length * 8
+    return block
+
+
+# the schedules of the padding blocks don't depend on the message, so they are computed once
+PADDING_64 = expand(padding_block(64))
+PADDING_128 = expand(padding_block(128))
+
+
+def hex_block(state):
+    ''' The 64 byte ASCII hex representation of a digest as a message block '''
+    nibbles = (state.reshape(8, 1, -1) >> NIBBLE_SHIFTS) & np.uint32(0xf)
+    ascii = nibbles + np.uint32(48) + np.uint32(39) * (nibbles > 9)
+    ascii = ascii.reshape(16, 4, -1)
+    return (ascii[:, 0] << np.uint32(24)) | (ascii[:, 1] << np.uint32(16)) \
+        | (ascii[:, 2] << np.uint32(8)) | ascii[:, 3]
+
+
+def sha256_hex(state):
+    ''' SHA-256 of the hex representation of a digest, like sha256(digest.hexdigest()) '''
+    return compress(compress(H0, expand(hex_block(state))), PADDING_64)
+
+
+def double_hash_hex_pair(left_midstate, right):
+    '''
+    double_hash(left_hex + right_hex) with the hex representations of two digests.
+    left_midstate is the state after the first block, so the left hex string is only
+    hashed once for a constant left node.
+    '''
+    state = compress(left_midstate, expand(hex_block(right)))
+    return sha256_hex(compress(state, PADDING_128))
+
+
+def double_hash_hex_twice(node):
+    ''' double_hash(node_hex + node_hex) for a node that is hashed with itself '''
+    schedule = expand(hex_block(node))
+    state = compress(compress(H0, schedule), schedule)
+    return sha256_hex(compress(state, PADDING_128))
+
+
+def midstate(state):
+    return compress(H0, expand(hex_block(state)))
+
+
+def digest_to_state(digest: str):
+    ''' Convert a hex digest string to a state of shape (8, 1) '''
+    return np.frombuffer(bytes.fromhex(digest), dtype='>u4').astype(np.uint32).reshape(8, 1)
+
+
+def state_to_digest(state, index: int = 0) -> str:
+    return state[:, index].astype('>u4').tobytes().hex()
+
+
+def nonce_blocks(nonces):
+    ''' The padded message blocks of str(nonce) for every nonce '''
+    count = len(nonces)
+    lengths = 1 + (nonces.reshape(-1, 1) >= POWERS_OF_TEN[1:]).sum(axis=1)
+    message = np.zeros((count, 64), dtype=np.uint8)
+    positions = np.arange(MAX_DIGITS)
+    exponents = lengths.reshape(-1, 1) - 1 - positions
+    is_digit = exponents >= 0
+    digits = (nonces.reshape(-1, 1) // POWERS_OF_TEN[np.where(is_digit, exponents, 0)]) \
+        % np.uint64(10)
+    message[:, :MAX_DIGITS] = np.where(is_digit, digits + 48, 0)
+    message[np.arange(count), lengths] = 0x80
+    message[:, 63] = lengths * 8
+    return message.view('>u4').astype(np.uint32).T
+
+
+def meets_target(state, target_words):
+    ''' Check for each digest if it is not greater than the target (8 big-endian words) '''
+    below = np.zeros(state.shape[1], dtype=bool)
+    equal = np.ones(state.shape[1], dtype=bool)
+    for word, target in zip(state, target_words):
+        target = np.uint32(target)
+        below |= equal & (word < target)
+        equal &= word == target
+        if not equal.any():
+            break
+    return below | equal
+
+
+def merkle_roots(siblings, midstates, nonces):
+    '''
+    Root hashes for all nonces, siblings is the path of the MiningEngine and midstates contains
+    the precomputed midstate for every sibling that isn't None
+    '''
+    # leaf: double_hash(str(nonce))
+    node = sha256_hex(compress(H0, expand(nonce_blocks(nonces))))
+    for sibling, left_midstate in zip(siblings, midstates):
+        if sibling is None:
+            node = double_hash_hex_twice(node)
+        else:
+            node = double_hash_hex_pair(left_midstate, node)
+    return node
+
+
+def find_valid_nonce(siblings, midstates, start: int, count: int, step: int,
+                     target_words) -> Optional[int]:
+    ''' The first nonce of start, start + step, ... whose root meets the target '''
+    nonces = np.uint64(start) + np.uint64(step) * np.arange(count, dtype=np.uint64)
+    valid = meets_target(merkle_roots(siblings, midstates, nonces), target_words)
+    hits = np.flatnonzero(valid)
+    if len(hits) == 0:
+        return None
+    return int(nonces[hits[0]])
@@ -0,0 +1,283 @@
+import hashlib
+import logging
+import math
+import multiprocessing as mp
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Optional, Tuple
+from ecdsa import VerifyingKey, SECP256k1, BadSignatureError
+from ecdsa.ellipticcurve import PointJacobi
+
+log = logging.getLogger()
+
+# raw pubkey, signature and signed message of a transaction
+SignatureData = Tuple[bytes, bytes, bytes]
+
+
+class VerifyingKeyCache:
+    '''
+    Parsed pubkeys, so the key of a sender is only parsed once for all of its transactions.
+
+    Keys that were used for HOT_USES verifications get precomputed multiplication tables,
+    which makes a verification about twice as fast. The tables need about 100 KB per key, so
+    only the max_precomputed most recently used hot keys keep them. A key whose tables were
+    removed needs twice as many verifications as before to get them again, so more hot keys
+    than max_precomputed don't compute tables on every use. The other keys are kept without
+    tables, the least recently used are removed when there are more than max_keys.
+    '''
+    HOT_USES = 4
+
+    def __init__(self, max_keys=10000, max_precomputed=64) -> None:
+        self.max_keys = max_keys
+        self.max_precomputed = max_precomputed
+        # raw pubkey -> [VerifyingKey, number of verifications, verifications needed for the
+        # tables, the tables are being computed]
+        self.keys = OrderedDict()
+        # raw pubkey -> VerifyingKey with precomputed tables
+        self.precomputed = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, pubkey: bytes, verification=False) -> VerifyingKey:
+        ''' Raises ecdsa.MalformedPointError if pubkey is not a valid raw SECP256k1 key '''
+        with self.lock:
+            if pubkey in self.precomputed:
+                self.hits += 1
+                self.precomputed.move_to_end(pubkey)
+                return self.precomputed[pubkey]
+            entry = self.keys.get(pubkey)
+            if entry is None:
+                self.misses += 1
+                entry = [VerifyingKey.from_string(pubkey, SECP256k1, hashlib.sha256,
+                                                  valid_encodings=['raw']), 0, self.HOT_USES,
+                         False]
+                self.keys[pubkey] = entry
+                while len(self.keys) > self.max_keys:
+                    self.keys.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self.hits += 1
+                self.keys.move_to_end(pubkey)
+            if not verification:
+                return entry[0]
+            entry[1] += 1
+            if entry[1] < entry[2] or entry[3] or self.max_precomputed == 0:
+                return entry[0]
+            # other threads use the key without tables until they are computed
+            entry[3] = True
+
+        # about as expensive as 3 verifications, so it is done without holding the lock
+        try:
+            key = self.precompute(entry[0])
+        finally:
+            with self.lock:
+                entry[3] = False
+        with self.lock:
+            self.precomputed[pubkey] = key
+            while len(self.precomputed) > self.max_precomputed:
+                evicted, _ = self.precomputed.popitem(last=False)
+                evicted_entry = self.keys.get(evicted)
+                if evicted_entry is not None:
+                    evicted_entry[1] = 0
+                    evicted_entry[2] *= 2
+        return key
+
+    @staticmethod
+    def precompute(key: VerifyingKey) -> VerifyingKey:
+        # only points that know the order of the curve can have precomputed tables
+        point = key.pubkey.point
+        point = PointJacobi(SECP256k1.curve, point.x(), point.y(), 1, SECP256k1.order,
+                            generator=True)
+        key = VerifyingKey.from_public_point(point, SECP256k1, hashlib.sha256)
+        key.precompute(lazy=False)
+        return key
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "keys": len(self.keys),
+                "precomputed": len(self.precomputed),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# shared by the deserialization and the validation of all transactions of this process, the
+# processes of a SignatureVerifier have their own
+verifying_key_cache = VerifyingKeyCache()
+
+
+def verify_signature(pubkey: bytes, sig: bytes, message: bytes) -> bool:
+    try:
+        key = verifying_key_cache.get(pubkey, verification=True)
+        return key.verify(sig, message)
+    except (BadSignatureError, ValueError, AssertionError):
+        return False
+
+
+def verify_chunk(items: List[SignatureData], stop_at_failure=True) -> List[bool]:
+    ''' Verify the signatures one after another and stop at the first invalid one '''
+    results = []
+    for pubkey, sig, message in items:
+        results.append(verify_signature(pubkey, sig, message))
+        if stop_at_failure and not results[-1]:
+            break
+    return results
+
+
+class SignatureCache:
+    '''
+    Results of verified signatures, so a transaction that is seen again, e.g. in a relayed
+    block or in a block download, is not verified again. The key is the signed message (the
+    transaction hash), the signature and the pubkey. The least recently used results are
+    removed when there are more than max_entries.
+    '''
+
+    def __init__(self, max_entries=100000) -> None:
+        self.max_entries = max_entries
+        self.results = OrderedDict()
+        # the cache is used by the connection threads of the node and by the mining jobs
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, item: SignatureData) -> Optional[bool]:
+        pubkey, sig, message = item
+        key = (message, sig, pubkey)
+        with self.lock:
+            result = self.results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.results.move_to_end(key)
+            return result
+
+    def add(self, item: SignatureData, result: bool) -> None:
+        pubkey, sig, message = item
+        with self.lock:
+            self.results[(message, sig, pubkey)] = result
+            self.results.move_to_end((message, sig, pubkey))
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.results.clear()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.results),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# shared by all verifiers and Transaction.verify_signature of this process
+signature_cache = SignatureCache()
+
+
+def verify_cached(item: SignatureData, cache: SignatureCache = signature_cache) -> bool:
+    result = cache.get(item)
+    if result is None:
+        result = verify_signature(*item)
+        cache.add(item, result)
+    return result
+
+
+class SignatureVerifier:
+    '''
+    Verifies the ECDSA signatures of many transactions at once, e.g. of a block or of all
+    blocks of a block download, with a pool of processes.
+
+    The transactions are split into chunks that are verified in parallel. As soon as one
+    signature is invalid, the chunks that were not started yet are cancelled. Small batches are
+    verified in the calling process, because sending them to the pool takes longer.
+    '''
+    # minimum number of signatures that are verified with the pool
+    MIN_BATCH = 16
+    # number of chunks per process, more chunks stop faster after an invalid signature
+    CHUNKS_PER_PROCESS = 4
+
+    def __init__(self, processes=None, cache: SignatureCache = signature_cache) -> None:
+        self.processes = processes or mp.cpu_count()
+        self.executor = None
+        self.cache = cache
+
+    def start(self) -> None:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.processes)
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def is_running(self) -> bool:
+        return self.executor is not None
+
+    def verify(self, transactions, stop_at_failure=True) -> List[Optional[bool]]:
+        '''
+        Returns True or False for each transaction. Transactions that were not checked because
+        another signature is invalid are None. With stop_at_failure=False, all transactions are
+        checked, e.g. to vote on each transaction of a batch.
+        '''
+        items = []
+        for transaction in transactions:
+            items.append(transaction.get_signature_data())
+        results: List[Optional[bool]] = [None] * len(items)
+
+        # only the signatures that are not in the cache have to be verified
+        uncached = []
+        for i, item in enumerate(items):
+            results[i] = self.cache.get(item)
+            if results[i] is False and stop_at_failure:
+                return results
+            if results[i] is None:
+                uncached.append(i)
+        if not uncached:
+            return results
+
+        if self.executor is None or len(uncached) < self.MIN_BATCH:
+            for i in uncached:
+                results[i] = verify_signature(*items[i])
+                self.cache.add(items[i], results[i])
+                if not results[i] and stop_at_failure:
+                    break
+            return results
+
+        chunk_size = math.ceil(len(uncached) / (self.processes * self.CHUNKS_PER_PROCESS))
+        futures = {}
+        for start in range(0, len(uncached), chunk_size):
+            indices = uncached[start:start + chunk_size]
+            future = self.executor.submit(verify_chunk, [items[i] for i in indices],
+                                          stop_at_failure)
+            futures[future] = indices
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk_results = future.result()
+                for i, result in zip(futures[future], chunk_results):
+                    results[i] = result
+                    self.cache.add(items[i], result)
+                if not all(chunk_results) and stop_at_failure:
+                    for other in pending:
+                        other.cancel()
+                    return results
+        return results
+
+    def verify_all(self, transactions) -> bool:
+        return all(self.verify(transactions))
@@ -0,0 +1,224 @@
+'''
+Verify the stored blockchain from the genesis block to the latest block, e.g. after restoring
+a backup or after the chain was replaced by the chain of a peer
+
+run with 'python -m blockchain.verify_chain' in the src/ directory, options:
+    --tip <hash>            last block of the chain (default: the latest block)
+    --difficulty 16         number of leading zero bits of the proof of work
+    --workers <n>           number of processes (default: number of CPUs)
+    --no-signatures         don't verify the signatures of the transactions
+    --full                  ignore the checkpoint and verify all blocks
+
+The hashes, proofs of work and signatures of the blocks are verified in parallel by a process
+pool, the linkage of the blocks and the balances are checked in order in this process. The
+genesis block is trusted. After the verification a checkpoint with the balances of the last
+valid block is written to the store, later runs only verify the blocks after it. The
+checkpoint records the difficulty and if the signatures were verified, it is only used by runs
+that don't check more than that, and a run that checks less doesn't replace it.
+'''
+
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from blockchain.block import Block, INITIAL_BALANCE
+from blockchain.difficulty import Difficulty, leading_zero_bits
+from db.mapper import Mapper
+from db.snapshot import list_snapshots, read_snapshot, write_snapshot
+
+log = logging.getLogger()
+
+# blocks sent to a worker process at once
+CHUNK_SIZE = 256
+
+
+def get_checkpoint_dir() -> str:
+    return os.path.join(Mapper.get_block_store().path, "checkpoints")
+
+
+def is_as_strict(checkpoint: dict, difficulty_bits, check_signatures) -> bool:
+    ''' True if the blocks of the checkpoint were verified with at least these checks '''
+    return checkpoint.get("difficulty_bits", -1) >= difficulty_bits \
+        and (checkpoint.get("check_signatures", False) or not check_signatures)
+
+
+def verify_blocks(blocks, difficulty_bits, check_signatures=True) -> list:
+    '''
+    Checks (hash, stored block) pairs in a worker process. Returns (predecessor, error,
+    transfers) of every block, error is None if the block is valid and transfers are the
+    (source, target, amount) of its transactions.
+    '''
+    difficulty = Difficulty.from_bits(difficulty_bits)
+    results = []
+    for block_hash, block_bytes in blocks:
+        try:
+            block = Block.from_bytes(block_bytes, block_hash)
+            transfers = [(t.source, t.target, t.amount) for t in block.transactions]
+            # the timestamps are only parsed on first use, an invalid timestamp raises here
+            for transaction in block.transactions:
+                transaction.timestamp
+        except (ValueError, KeyError, TypeError) as e:
+            results.append((None, f"the block can't be decoded ({e})", []))
+            continue
+        error = None
+        if block.hash() != block_hash:
+            error = "recalculating the hash results in a different hash"
+        elif not block.validate_nonce([t.get_leaf() for t in block.transactions], block.nonce,
+                                      difficulty):
+            error = f"nonce {block.nonce} does not fulfill the difficulty"
+        elif check_signatures and not all(t.verify_signature() for t in block.transactions):
+            error = "a transaction signature is invalid"
+        results.append((block.predecessor, error, transfers))
+    return results
+
+
+def verify_chain(tip, difficulty_bits, workers=None, check_signatures=True,
+                 use_checkpoint=True) -> dict:
+    '''
+    Verify the chain that ends with tip. Returns "valid", "error", "height" of the last
+    valid block, the number of "verified" blocks and the "elapsed" seconds.
+    '''
+    start_time = time.perf_counter()
+    result = {"valid": False, "error": None, "height": -1, "verified": 0, "elapsed": 0.0}
+    chain = Mapper.get_chain_index().get_chain_after(tip, None)
+    if not chain:
+        result["error"] = f"block {tip} is not stored"
+        return result
+
+    checkpoint_dir = get_checkpoint_dir()
+    checkpoint = Mapper.find_snapshot(tip, checkpoint_dir) if use_checkpoint else None
+    if checkpoint and not is_as_strict(checkpoint, difficulty_bits, check_signatures):
+        log.info("the checkpoint was verified with fewer checks, verifying all blocks")
+        checkpoint = None
+    if checkpoint:
+        height = checkpoint["height"]
+        balances = dict(checkpoint["balances"])
+        log.info(f"starting after the checkpoint of block {height}")
+    else:
+        genesis = Mapper.read_block_if_exists(chain[0])
+        if genesis is None or genesis.get("predecessor") is not None:
+            result["error"] = f"the predecessor of block {chain[0]} is not stored"
+            return result
+        height = 0
+        balances = {}
+        Mapper.add_block_to_balances(balances, genesis, 1)
+    first_height = height + 1
+
+    error = None
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        # keep a few chunks per worker in flight, so not all blocks are read into memory
+        pending = deque()
+        next_height = first_height
+        while pending or next_height < len(chain):
+            while next_height < len(chain) and len(pending) < 2 * workers:
+                hashes = chain[next_height:next_height + CHUNK_SIZE]
+                blocks = [(block_hash, Mapper.read_block_bytes(block_hash))
+                          for block_hash in hashes]
+                pending.append(executor.submit(verify_blocks, blocks, difficulty_bits,
+                                               check_signatures))
+                next_height += len(hashes)
+            for predecessor, block_error, transfers in pending.popleft().result():
+                if block_error is None:
+                    block_error = check_block(chain[height], predecessor, transfers, balances)
+                if block_error is not None:
+                    error = f"block {chain[height + 1]} at height {height + 1}: {block_error}"
+                    break
+                height += 1
+            if error is not None:
+                for future in pending:
+                    future.cancel()
+                break
+
+    if height >= first_height:
+        write_checkpoint(checkpoint_dir, chain[:height + 1], balances, difficulty_bits,
+                         check_signatures)
+    result.update(valid=error is None, error=error, height=height,
+                  verified=height - first_height + 1,
+                  elapsed=time.perf_counter() - start_time)
+    return result
+
+
+def write_checkpoint(checkpoint_dir, chain, balances, difficulty_bits, check_signatures):
+    ''' Replace the checkpoint, unless it was verified with checks this run didn't do '''
+    properties = {"difficulty_bits": difficulty_bits, "check_signatures": check_signatures}
+    for height in list_snapshots(checkpoint_dir):
+        checkpoint = read_snapshot(checkpoint_dir, height)
+        if checkpoint is not None and not is_as_strict(
+                properties, checkpoint.get("difficulty_bits", -1),
+                checkpoint.get("check_signatures", False)):
+            log.info("the checkpoint was verified with more checks, it is kept")
+            return
+    write_snapshot(checkpoint_dir, chain, balances, keep=1, properties=properties)
+
+
+def check_block(predecessor_hash, predecessor, transfers, balances) -> Optional[str]:
+    '''
+    Check the linkage and the balances of a block, like Transaction.validate with the balances
+    of the previous blocks. The transfers of a valid block are added to the balances.
+    '''
+    if predecessor != predecessor_hash:
+        return f"the predecessor {predecessor} is not the previous block {predecessor_hash}"
+    for source, _, amount in transfers:
+        balance = INITIAL_BALANCE + balances.get(source, 0)
+        if balance < amount:
+            return f"{source} can't send {amount} with balance of {balance}"
+    for source, target, amount in transfers:
+        balances[source] = balances.get(source, 0) - amount
+        balances[target] = balances.get(target, 0) + amount
+    return None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--tip',
+        dest='tip',
+        help='Hash of the last block of the chain (default: the latest block)',
+        default=None
+    )
+    parser.add_argument(
+        '--difficulty',
+        dest='difficulty',
+        type=leading_zero_bits,
+        help='Number of leading zero bits of the proof of work (default: 16)',
+        default=16
+    )
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        type=int,
+        help='Number of processes that verify blocks (default: number of CPUs)',
+        default=None
+    )
+    parser.add_argument(
+        '--no-signatures',
+        dest='no_signatures',
+        help="Don't verify the signatures of the transactions",
+        action='store_true'
+    )
+    parser.add_argument(
+        '--full',
+        dest='full',
+        help='Ignore the checkpoint and verify all blocks',
+        action='store_true'
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s %(levelname)-8s %(message)s", level=logging.INFO,
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    result = verify_chain(args.tip or Mapper.read_latest_block_hash(), args.difficulty,
+                          args.workers, not args.no_signatures, not args.full)
+    elapsed = max(result["elapsed"], 1e-9)
+    print(f"verified {result['verified']} blocks in {result['elapsed']:.2f} seconds "
+          f"({result['verified'] / elapsed:.0f} blocks/s)")
+    if not result["valid"]:
+        print(f"the chain is not valid: {result['error']}")
+        sys.exit(1)
+    print(f"the chain is valid up to block {result['height']}")
@@ -0,0 +1,258 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+from .storage import StorageBackend
+
+log = logging.getLogger()
+
+# record in a segment file: type, block hash, length of the data, crc32 of the data
+RECORD_HEADER = struct.Struct(">B32sII")
+RECORD_BLOCK = 0
+RECORD_DELETE = 1
+
+# entry of the index file: block hash, segment number, offset of the data, length of the data
+INDEX_ENTRY = struct.Struct(">32sIQI")
+# length of index entries of deleted blocks
+DELETED = 0xffffffff
+
+
+class BlockStore(StorageBackend):
+    '''
+    Append-only storage of blocks in segment files, instead of one file per block.
+
+    Every block is appended to the current segment as a record with a header (hash, length
+    and checksum of the data). A new segment is started when the current one would become
+    larger than SEGMENT_SIZE. Deleting a block appends a delete record, the data stays in
+    the segment.
+
+    The index maps every block hash to (segment, offset, length) of its data and is kept in
+    memory. It is also appended to the index file, so it doesn't have to be built from the
+    segments on every start. When the store is opened, the records after the last indexed
+    record are read from the segments (e.g. after a crash before the index was written) and
+    an incomplete record at the end of the last segment is removed.
+
+    get_view returns the data of a block as a view of the memory-mapped segment, so blocks can
+    be sent to peers without copying them into new bytes objects first. Records are never
+    changed after they were appended, so the views stay valid while the store is open.
+    '''
+    SEGMENT_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self.index_file = os.path.join(path, "index")
+        # block hash -> (segment, offset, length)
+        self.index: Dict[str, Tuple[int, int, int]] = {}
+        self.lock = threading.RLock()
+        # read-only file objects of the segments
+        self.readers = {}
+        # read-only memory maps of the segments
+        self.mappings = {}
+        # segment and position after the last record in the index file
+        self.indexed_until = (0, 0)
+        os.makedirs(path, exist_ok=True)
+        self.load_index()
+        self.recover()
+        self.segment = max(self.list_segments(), default=0)
+        self.writer = open(self.segment_file(self.segment), "ab")
+        self.index_writer = open(self.index_file, "ab")
+
+    def segment_file(self, segment) -> str:
+        return os.path.join(self.path, f"segment-{segment:05d}")
+
+    def list_segments(self) -> List[int]:
+        return sorted(int(name[len("segment-"):]) for name in os.listdir(self.path)
+                      if name.startswith("segment-"))
+
+    def load_index(self):
+        try:
+            with open(self.index_file, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return
+        complete = len(data) - len(data) % INDEX_ENTRY.size
+        if complete != len(data):
+            log.warning("removing an incomplete entry at the end of the block index")
+            with open(self.index_file, "r+b") as file:
+                file.truncate(complete)
+        for raw_hash, segment, offset, length in INDEX_ENTRY.iter_unpack(data[:complete]):
+            self.set_index(raw_hash.hex(), segment, offset, length)
+        if complete:
+            _, segment, offset, length = INDEX_ENTRY.unpack_from(data, complete - INDEX_ENTRY.size)
+            self.indexed_until = (segment, offset + (0 if length == DELETED else length))
+
+    def set_index(self, block_hash, segment, offset, length):
+        if length == DELETED:
+            self.index.pop(block_hash, None)
+        else:
+            self.index[block_hash] = (segment, offset, length)
+
+    def recover(self):
+        ''' Add the records after the last indexed record to the index '''
+        last_segment, position = self.indexed_until
+        new_entries = []
+        segments = [segment for segment in self.list_segments() if segment >= last_segment]
+        for segment in segments:
+            start = position if segment == last_segment else 0
+            for entry in self.scan_segment(segment, start):
+                new_entries.append(entry)
+                self.set_index(*entry)
+        if new_entries:
+            log.info(f"{len(new_entries)} blocks were not in the block index, added them")
+            with open(self.index_file, "ab") as file:
+                for block_hash, segment, offset, length in new_entries:
+                    file.write(INDEX_ENTRY.pack(bytes.fromhex(block_hash), segment, offset, length))
+
+    def scan_segment(self, segment, start) -> Iterator[tuple]:
+        '''
+        Yields the index entries of the records from start to the end of the segment. The
+        segment is truncated after the last complete record.
+        '''
+        path = self.segment_file(segment)
+        with open(path, "rb") as file:
+            file.seek(start)
+            position = start
+            while True:
+                header = file.read(RECORD_HEADER.size)
+                if not header:
+                    return
+                if len(header) == RECORD_HEADER.size:
+                    record_type, raw_hash, length, checksum = RECORD_HEADER.unpack(header)
+                    data = file.read(length)
+                    if len(data) == length and zlib.crc32(data) == checksum:
+                        data_offset = position + RECORD_HEADER.size
+                        position = data_offset + length
+                        if record_type == RECORD_DELETE:
+                            length = DELETED
+                        yield raw_hash.hex(), segment, data_offset, length
+                        continue
+                break
+        log.warning(f"removing an incomplete block record at the end of {path}")
+        with open(path, "r+b") as file:
+            file.truncate(position)
+
+    def append(self, record_type, block_hash, data: bytes, flush=True) -> int:
+        ''' Returns the offset of the data, the lock has to be held '''
+        raw_hash = bytes.fromhex(block_hash)
+        if len(raw_hash) != 32:
+            raise ValueError(f"{block_hash} is not a 256-bit hash")
+        size = RECORD_HEADER.size + len(data)
+        if self.writer.tell() > 0 and self.writer.tell() + size > self.SEGMENT_SIZE:
+            # the records of a batch in the full segment must be on disk, like the others
+            self.writer.flush()
+            os.fsync(self.writer.fileno())
+            self.writer.close()
+            self.segment += 1
+            self.writer = open(self.segment_file(self.segment), "ab")
+        offset = self.writer.tell() + RECORD_HEADER.size
+        self.writer.write(RECORD_HEADER.pack(record_type, raw_hash, len(data), zlib.crc32(data)))
+        self.writer.write(data)
+        length = DELETED if record_type == RECORD_DELETE else len(data)
+        self.index_writer.write(INDEX_ENTRY.pack(raw_hash, self.segment, offset, length))
+        if flush:
+            self.flush()
+        return offset
+
+    def flush(self, sync=False) -> None:
+        '''
+        Write the buffered records to the files. With sync, the records are on disk when it
+        returns. The index file isn't synced, it is repaired from the segments after a crash.
+        '''
+        with self.lock:
+            self.writer.flush()
+            self.index_writer.flush()
+            if sync:
+                os.fsync(self.writer.fileno())
+
+    def put(self, block_hash, data: bytes) -> None:
+        with self.lock:
+            offset = self.append(RECORD_BLOCK, block_hash, data)
+            self.index[block_hash] = (self.segment, offset, len(data))
+
+    def put_many(self, blocks, sync=False, delete=()) -> None:
+        '''
+        Append the delete records of the blocks in delete and the (hash, data) of several
+        blocks and flush (and sync) them once
+        '''
+        with self.lock:
+            for block_hash in delete:
+                if block_hash in self.index:
+                    self.append(RECORD_DELETE, block_hash, b"", flush=False)
+                    del self.index[block_hash]
+            for block_hash, data in blocks:
+                offset = self.append(RECORD_BLOCK, block_hash, data, flush=False)
+                self.index[block_hash] = (self.segment, offset, len(data))
+            self.flush(sync)
+
+    def get(self, block_hash) -> Optional[bytes]:
+        with self.lock:
+            location = self.index.get(block_hash)
+            if location is None:
+                return None
+            segment, offset, length = location
+            reader = self.readers.get(segment)
+            if reader is None:
+                reader = self.readers[segment] = open(self.segment_file(segment), "rb")
+            return os.pread(reader.fileno(), length, offset)
+
+    def get_view(self, block_hash) -> Optional[memoryview]:
+        ''' The data of the block in the memory-mapped segment, without copying it '''
+        with self.lock:
+            location = self.index.get(block_hash)
+            if location is None:
+                return None
+            segment, offset, length = location
+            mapping = self.mappings.get(segment)
+            if mapping is None or len(mapping) < offset + length:
+                # the current segment grew since it was mapped, older views keep the old map
+                with open(self.segment_file(segment), "rb") as file:
+                    mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.mappings[segment] = mapping
+            return memoryview(mapping)[offset:offset + length]
+
+    def delete(self, block_hash) -> None:
+        with self.lock:
+            if block_hash in self.index:
+                self.append(RECORD_DELETE, block_hash, b"")
+                del self.index[block_hash]
+
+    def __contains__(self, block_hash) -> bool:
+        return block_hash in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def hashes(self) -> List[str]:
+        ''' Hashes of all blocks in the order they were stored '''
+        with self.lock:
+            return list(self.index)
+
+    def close(self) -> None:
+        with self.lock:
+            self.writer.close()
+            self.index_writer.close()
+            for reader in self.readers.values():
+                reader.close()
+            self.readers.clear()
+            for mapping in self.mappings.values():
+                try:
+                    mapping.close()
+                except BufferError:
+                    # a view of it is still used, it is unmapped when the view is released
+                    pass
+            self.mappings.clear()
+
+
+def import_block_files(store: BlockStore, blocks_dir) -> int:
+    ''' Import the blocks of the old storage with one file per block, returns the count '''
+    imported = 0
+    for block_hash in sorted(os.listdir(blocks_dir)):
+        if block_hash in store:
+            continue
+        with open(os.path.join(blocks_dir, block_hash), "rb") as file:
+            store.put(block_hash, file.read())
+        imported += 1
+    return imported
@@ -0,0 +1,214 @@
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+log = logging.getLogger()
+
+# predecessor of blocks without one in the index file
+NO_PREDECESSOR = "-"
+
+
+class ChainIndex:
+    '''
+    Index of the structure of the stored blocks: the height of every block, the successors of
+    every block and the tips (blocks without successors) with the length of their chain.
+
+    A block whose predecessor is not stored (e.g. the genesis block) has the height 0. If the
+    predecessor is added later, the heights of the block and its successors are updated.
+
+    Changes are appended to the index file as lines "<hash> <predecessor>" for added and
+    "<hash>" for deleted blocks, so a change doesn't rewrite the whole file.
+    '''
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self.lock = threading.RLock()
+        self.predecessors: Dict[str, Optional[str]] = {}
+        self.successors: Dict[str, List[str]] = {}
+        self.heights: Dict[str, int] = {}
+        # hash of a block without successors -> number of blocks of its chain
+        self.tips: Dict[str, int] = {}
+        # hashes of the chain of main_tip by height
+        self.main_chain: List[str] = []
+        self.main_tip = None
+        self.file = None
+
+    def load(self) -> bool:
+        ''' Returns False if there is no index file '''
+        try:
+            with open(self.path) as file:
+                lines = file.read().split("\n")
+        except FileNotFoundError:
+            return False
+        # the last line is incomplete if the node crashed while it was written
+        removed = []
+        for line in lines[:-1]:
+            fields = line.split(" ")
+            if len(fields) == 2:
+                self.remove(removed)
+                removed = []
+                self.add(fields[0], None if fields[1] == NO_PREDECESSOR else fields[1])
+            else:
+                # the blocks of a replaced chain are removed at once
+                removed.append(fields[0])
+        self.remove(removed)
+        return True
+
+    def rebuild(self, blocks: Iterable[Tuple[str, Optional[str]]]):
+        ''' Build the index from (hash, predecessor) of all blocks and rewrite the file '''
+        with self.lock:
+            self.close()
+            self.__init__(self.path)
+            for block_hash, predecessor in blocks:
+                self.add(block_hash, predecessor)
+            tmp_file = self.path + ".tmp"
+            with open(tmp_file, "w") as file:
+                for block_hash, predecessor in self.predecessors.items():
+                    file.write(f"{block_hash} {predecessor or NO_PREDECESSOR}\n")
+            os.replace(tmp_file, self.path)
+        log.info(f"chain index rebuilt with {len(self.heights)} blocks")
+
+    def append(self, line):
+        if self.file is None:
+            self.file = open(self.path, "a")
+        self.file.write(line + "\n")
+        self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def add_block(self, block_hash, predecessor):
+        with self.lock:
+            if block_hash in self.heights:
+                return
+            self.append(f"{block_hash} {predecessor or NO_PREDECESSOR}")
+            self.add(block_hash, predecessor)
+
+    def remove_block(self, block_hash):
+        self.remove_blocks([block_hash])
+
+    def remove_blocks(self, block_hashes: Iterable[str]):
+        with self.lock:
+            removed = [block_hash for block_hash in dict.fromkeys(block_hashes)
+                       if block_hash in self.heights]
+            if not removed:
+                return
+            self.append("\n".join(removed))
+            self.remove(removed)
+
+    def add(self, block_hash, predecessor):
+        if block_hash in self.heights:
+            return
+        self.predecessors[block_hash] = predecessor
+        if predecessor is not None:
+            self.successors.setdefault(predecessor, []).append(block_hash)
+            self.tips.pop(predecessor, None)
+        height = self.heights[predecessor] + 1 if predecessor in self.heights else 0
+        self.set_height(block_hash, height)
+
+    def set_height(self, block_hash, height):
+        ''' Set the height of the block and update the heights of its successors '''
+        stack = [(block_hash, height)]
+        while stack:
+            block_hash, height = stack.pop()
+            if self.heights.get(block_hash, height) != height:
+                # the main chain has to be built again
+                self.main_tip = None
+            self.heights[block_hash] = height
+            successors = self.successors.get(block_hash)
+            if successors:
+                stack.extend((successor, height + 1) for successor in successors)
+            else:
+                self.tips[block_hash] = height + 1
+
+    def remove(self, block_hashes: List[str]):
+        '''
+        Remove the blocks. The heights are only updated once, after all of them are removed, so
+        removing a chain doesn't update the heights of its remaining blocks again and again.
+        '''
+        removed = [block_hash for block_hash in block_hashes if block_hash in self.heights]
+        for block_hash in removed:
+            if block_hash not in self.heights:
+                continue
+            predecessor = self.predecessors.pop(block_hash)
+            del self.heights[block_hash]
+            self.tips.pop(block_hash, None)
+            if predecessor is not None:
+                siblings = self.successors.get(predecessor, [])
+                if block_hash in siblings:
+                    siblings.remove(block_hash)
+                if not siblings:
+                    self.successors.pop(predecessor, None)
+                    if predecessor in self.heights:
+                        self.tips[predecessor] = self.heights[predecessor] + 1
+        if not removed:
+            return
+        # the successors that are still stored start new chains
+        for block_hash in removed:
+            for successor in self.successors.get(block_hash, []):
+                if successor in self.heights:
+                    self.set_height(successor, 0)
+        self.main_tip = None
+
+    def __contains__(self, block_hash) -> bool:
+        return block_hash in self.heights
+
+    def get_height(self, block_hash) -> Optional[int]:
+        return self.heights.get(block_hash)
+
+    def get_successors(self, block_hash) -> List[str]:
+        with self.lock:
+            return list(self.successors.get(block_hash, []))
+
+    def get_tips(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.tips)
+
+    def get_main_chain(self, tip) -> List[str]:
+        '''
+        Hashes of the chain that ends with tip by height, the lock has to be held. The chain of
+        the last tip is kept, so a tip that extends it only adds the new blocks.
+        '''
+        if tip == self.main_tip:
+            return self.main_chain
+        if self.main_tip is None:
+            self.main_chain = []
+        if tip not in self.heights:
+            return []
+        new_blocks = []
+        block_hash = tip
+        chain = self.main_chain
+        while block_hash in self.heights:
+            height = self.heights[block_hash]
+            if height < len(chain) and chain[height] == block_hash:
+                break
+            new_blocks.append(block_hash)
+            block_hash = self.predecessors[block_hash]
+        del chain[self.heights[tip] - len(new_blocks) + 1:]
+        chain.extend(reversed(new_blocks))
+        self.main_tip = tip
+        return chain
+
+    def get_hash_at(self, tip, height) -> Optional[str]:
+        ''' Hash of the block at height on the chain that ends with tip '''
+        with self.lock:
+            chain = self.get_main_chain(tip)
+            return chain[height] if 0 <= height < len(chain) else None
+
+    def get_chain_after(self, tip, block_hash) -> Optional[List[str]]:
+        '''
+        Hashes of the blocks after block_hash on the chain that ends with tip, None if the block
+        is not on this chain. All blocks of the chain if block_hash is None.
+        '''
+        with self.lock:
+            chain = self.get_main_chain(tip)
+            if block_hash is None:
+                return list(chain)
+            height = self.heights.get(block_hash)
+            if height is None or height >= len(chain) or chain[height] != block_hash:
+                return None
+            return chain[height + 1:]
@@ -0,0 +1,285 @@
+'''
+Binary encoding of blocks and transactions, for the block store and for network messages.
+
+The encoding contains the same values as the dicts of Block.to_dict and
+Transaction.to_full_dict, so a decoded dict is serialized to the same JSON and the hashes of
+blocks and transactions don't change. Hashes, pubkeys and signatures are stored as raw bytes
+and timestamps as seconds since 1970 instead of strings. Values that can't be stored like this
+(e.g. a timestamp in another format) are stored as strings, so every valid block can be
+encoded. Dicts that aren't blocks or transactions raise a CodecError.
+'''
+
+import struct
+from datetime import datetime, timedelta
+
+MAGIC = b"\xb1"
+VERSION = 1
+
+TRANSACTION_KEYS = frozenset(["source", "target", "amount", "timestamp", "pubkey", "sig"])
+BLOCK_KEYS = frozenset(["predecessor", "transactions", "nonce"])
+BLOCK_WITH_HASH_KEYS = BLOCK_KEYS | {"hash"}
+
+# flags of a transaction
+AMOUNT_INT = 1
+TIMESTAMP_STR = 2
+PUBKEY_STR = 4
+SIG_STR = 8
+
+# flags of a block
+PREDECESSOR_NONE = 1
+PREDECESSOR_STR = 2
+HAS_HASH = 4
+HASH_STR = 8
+
+U8 = struct.Struct(">B")
+U16 = struct.Struct(">H")
+U32 = struct.Struct(">I")
+U64 = struct.Struct(">Q")
+I64 = struct.Struct(">q")
+F64 = struct.Struct(">d")
+
+# flags, amount, timestamp, pubkey, signature, length of source and target
+TRANSACTION_HEADER = struct.Struct(">Bdq64s64sHH")
+
+EPOCH = datetime(1970, 1, 1)
+# "MM/DD/YYYY, " of the days since 1970, most transactions are from a few days
+date_strings = {}
+
+
+class CodecError(ValueError):
+    pass
+
+
+def is_binary(data) -> bool:
+    return data[:1] == MAGIC
+
+
+def raw_hex(value, size):
+    ''' The bytes of a lowercase hex string of size bytes, None if value isn't one '''
+    if type(value) != str or len(value) != 2 * size:
+        return None
+    try:
+        raw = bytes.fromhex(value)
+    except ValueError:
+        return None
+    return raw if raw.hex() == value else None
+
+
+def parse_timestamp(timestamp):
+    ''' Seconds since 1970 of a timestamp in Transaction.TIMESTAMP_FORMAT, None if it isn't '''
+    if type(timestamp) != str or len(timestamp) != 20 or timestamp[2::3][:2] != "//" \
+            or timestamp[10:12] != ", " or timestamp[14::3] != "::":
+        return None
+    try:
+        moment = datetime(int(timestamp[6:10]), int(timestamp[0:2]), int(timestamp[3:5]),
+                          int(timestamp[12:14]), int(timestamp[15:17]), int(timestamp[18:20]))
+    except ValueError:
+        return None
+    seconds = (moment - EPOCH) // timedelta(seconds=1)
+    return seconds if format_timestamp(seconds) == timestamp else None
+
+
+def format_timestamp(seconds) -> str:
+    days, seconds = divmod(seconds, 86400)
+    date = date_strings.get(days)
+    if date is None:
+        if len(date_strings) > 10000:
+            date_strings.clear()
+        day = EPOCH + timedelta(days=days)
+        date = date_strings[days] = f"{day.month:02d}/{day.day:02d}/{day.year:04d}, "
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{date}{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def write_string(out: bytearray, value):
+    if type(value) != str:
+        raise CodecError(f"{value!r} is not a string")
+    data = value.encode("utf-8")
+    if len(data) > 0xffff:
+        raise CodecError("string too long")
+    out += U16.pack(len(data))
+    out += data
+
+
+def read_string(data, offset):
+    length, = U16.unpack_from(data, offset)
+    offset += U16.size
+    return str(data[offset:offset + length], "utf-8"), offset + length
+
+
+def write_transaction(out: bytearray, transaction: dict):
+    '''
+    The values with a fixed size are in a header, followed by source and target. Values that
+    are stored as strings follow after them.
+    '''
+    if type(transaction) != dict or transaction.keys() != TRANSACTION_KEYS:
+        raise CodecError("not a transaction")
+    amount = transaction["amount"]
+    if type(amount) == int:
+        # stored as float, this is exact up to 2**53
+        if not -2**53 <= amount <= 2**53:
+            raise CodecError("amount too large")
+        flags = AMOUNT_INT
+    elif type(amount) == float:
+        flags = 0
+    else:
+        raise CodecError(f"amount {amount!r} is not a number")
+    source = transaction["source"]
+    target = transaction["target"]
+    if type(source) != str or type(target) != str:
+        raise CodecError("source and target have to be strings")
+    source = source.encode("utf-8")
+    target = target.encode("utf-8")
+    if len(source) > 0xffff or len(target) > 0xffff:
+        raise CodecError("source or target too long")
+
+    timestamp = parse_timestamp(transaction["timestamp"])
+    pubkey = raw_hex(transaction["pubkey"], 64)
+    sig = raw_hex(transaction["sig"], 64)
+    if timestamp is None:
+        flags |= TIMESTAMP_STR
+    if pubkey is None:
+        flags |= PUBKEY_STR
+    if sig is None:
+        flags |= SIG_STR
+
+    out += TRANSACTION_HEADER.pack(flags, amount, timestamp or 0, pubkey or b"", sig or b"",
+                                   len(source), len(target))
+    out += source
+    out += target
+    if timestamp is None:
+        write_string(out, transaction["timestamp"])
+    if pubkey is None:
+        write_string(out, transaction["pubkey"])
+    if sig is None:
+        write_string(out, transaction["sig"])
+
+
+def read_transaction(data, offset, raw=False):
+    '''
+    Returns the transaction dict and the offset after it. With raw=True the transaction is
+    returned as tuple (source, target, amount, timestamp, pubkey, sig) instead, with the
+    timestamp in seconds and pubkey and signature as bytes, unless they were stored as strings.
+    '''
+    flags, amount, timestamp, pubkey, sig, source_length, target_length = \
+        TRANSACTION_HEADER.unpack_from(data, offset)
+    offset += TRANSACTION_HEADER.size
+    source = str(data[offset:offset + source_length], "utf-8")
+    offset += source_length
+    target = str(data[offset:offset + target_length], "utf-8")
+    offset += target_length
+    if flags & AMOUNT_INT:
+        amount = int(amount)
+    if flags & TIMESTAMP_STR:
+        timestamp, offset = read_string(data, offset)
+    elif not raw:
+        timestamp = format_timestamp(timestamp)
+    if flags & PUBKEY_STR:
+        pubkey, offset = read_string(data, offset)
+    elif not raw:
+        pubkey = pubkey.hex()
+    if flags & SIG_STR:
+        sig, offset = read_string(data, offset)
+    elif not raw:
+        sig = sig.hex()
+    if raw:
+        return (source, target, amount, timestamp, pubkey, sig), offset
+    transaction = {
+        "source": source,
+        "target": target,
+        "amount": amount,
+        "timestamp": timestamp,
+        "pubkey": pubkey,
+        "sig": sig
+    }
+    return transaction, offset
+
+
+def write_block(out: bytearray, block: dict):
+    ''' A block dict of Block.to_dict or Block.to_dict_with_hash '''
+    if type(block) != dict or block.keys() not in (BLOCK_KEYS, BLOCK_WITH_HASH_KEYS):
+        raise CodecError("not a block")
+    nonce = block["nonce"]
+    if type(nonce) != int or not 0 <= nonce < 2**64:
+        raise CodecError(f"nonce {nonce!r} can't be encoded")
+    transactions = block["transactions"]
+    if type(transactions) != list:
+        raise CodecError("transactions are not a list")
+
+    flags = 0
+    predecessor = raw_hex(block["predecessor"], 32)
+    if block["predecessor"] is None:
+        flags |= PREDECESSOR_NONE
+    elif predecessor is None:
+        flags |= PREDECESSOR_STR
+    block_hash = None
+    if "hash" in block:
+        flags |= HAS_HASH
+        block_hash = raw_hex(block["hash"], 32)
+        if block_hash is None:
+            flags |= HASH_STR
+
+    out += U8.pack(flags)
+    if flags & PREDECESSOR_STR:
+        write_string(out, block["predecessor"])
+    elif predecessor is not None:
+        out += predecessor
+    if flags & HASH_STR:
+        write_string(out, block["hash"])
+    elif block_hash is not None:
+        out += block_hash
+    out += U64.pack(nonce)
+    out += U32.pack(len(transactions))
+    for transaction in transactions:
+        write_transaction(out, transaction)
+
+
+def read_block(data, offset, raw=False):
+    ''' Returns the block dict and the offset after it, raw is passed to read_transaction '''
+    flags = data[offset]
+    offset += 1
+    block = {}
+    if flags & PREDECESSOR_NONE:
+        predecessor = None
+    elif flags & PREDECESSOR_STR:
+        predecessor, offset = read_string(data, offset)
+    else:
+        predecessor = data[offset:offset + 32].hex()
+        offset += 32
+    if flags & HASH_STR:
+        block["hash"], offset = read_string(data, offset)
+    elif flags & HAS_HASH:
+        block["hash"] = data[offset:offset + 32].hex()
+        offset += 32
+    nonce, count = U64.unpack_from(data, offset)[0], U32.unpack_from(data, offset + 8)[0]
+    offset += 12
+    transactions = []
+    for _ in range(count):
+        transaction, offset = read_transaction(data, offset, raw)
+        transactions.append(transaction)
+    block["predecessor"] = predecessor
+    block["transactions"] = transactions
+    block["nonce"] = nonce
+    return block, offset
+
+
+def encode_block(block: dict) -> bytes:
+    out = bytearray(MAGIC)
+    out += U8.pack(VERSION)
+    write_block(out, block)
+    return bytes(out)
+
+
+def decode_block(data, raw=False) -> dict:
+    if not is_binary(data):
+        raise CodecError("not a binary block")
+    if data[1] > VERSION:
+        raise CodecError(f"unknown version {data[1]}")
+    try:
+        block, offset = read_block(memoryview(data), 2, raw)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise CodecError(f"block is truncated or corrupt ({e})")
+    if offset != len(data):
+        raise CodecError("block is truncated or followed by other data")
+    return block
@@ -1,33 +1,326 @@
+import bisect
 import json
 import logging
 import os
+import threading
+from array import array
+from typing import Dict, List, Optional
+from .block_store import BlockStore, import_block_files
+from .chain_index import ChainIndex
+from .codec import CodecError, encode_block
+from .snapshot import list_snapshots, read_snapshot, write_snapshot
+from .sqlite_store import SqliteStore
+from .storage import StorageBackend, decode_stored_block
 
 log = logging.getLogger()
 
 
 class Mapper():
+    # directory of the old storage with one file per block, imported into the block store
     blockchain_dir = os.path.dirname(
         os.path.realpath(__file__)) + "/blocks"
     latest_block_hash_file = os.path.dirname(
         os.path.realpath(__file__)) + "/latest_block_hash"
     db_dir = os.path.dirname(os.path.realpath(__file__))
+    nonce_index_file = db_dir + "/nonce_index"
+    nonce_clusters_file = db_dir + "/nonce_clusters"
+    balance_index_file = db_dir + "/balance_index"
+    store_dir = db_dir + "/store"
+    # storage of the blocks in store_dir, a key of backends
+    storage_backend = "segments"
+    backends = {"segments": BlockStore, "sqlite": SqliteStore}
+    # encoding of stored blocks, "binary" (db.codec) or "json", both can be read
+    block_format = "binary"
+    # sorted nonces of all mined blocks, loaded once from nonce_index
+    nonce_index = None
+    # new nonces are appended to nonce_index.tail and merged into nonce_index when there are
+    # nonce_tail_max of them, so the sorted index isn't rewritten for every mined block
+    nonce_tail_max = 1024
+    # balance changes of all addresses up to the block "tip", loaded once from balance_index
+    balance_index = None
+    # the opened block store of store_dir
+    block_store = None
+    # heights, successors and tips of the blocks in block_store
+    chain_index = None
+    block_store_lock = threading.RLock()
+    # a snapshot of the balances and the chain is written every snapshot_interval blocks, so
+    # they don't have to be rebuilt from all blocks (0 disables snapshots)
+    snapshot_interval = 1000
+    snapshots_kept = 2
+    # height of the newest snapshot on the chain of the latest block, found on first use
+    snapshot_height = None
+
+    @staticmethod
+    def set_db_dir(db_dir):
+        '''
+        Use another directory for the data of this node, e.g. to run several nodes from one
+        checkout. The store of a new directory imports the blocks of blockchain_dir (the
+        genesis block), its latest block is the tip of the imported blocks.
+        '''
+        os.makedirs(db_dir, exist_ok=True)
+        Mapper.db_dir = db_dir
+        Mapper.latest_block_hash_file = os.path.join(db_dir, "latest_block_hash")
+        Mapper.nonce_index_file = os.path.join(db_dir, "nonce_index")
+        Mapper.nonce_clusters_file = os.path.join(db_dir, "nonce_clusters")
+        Mapper.balance_index_file = os.path.join(db_dir, "balance_index")
+        Mapper.balance_index = None
+        Mapper.nonce_index = None
+        Mapper.store_dir = os.path.join(db_dir, "store")
+
+    @staticmethod
+    def get_block_store() -> StorageBackend:
+        '''
+        Opens the block store on first use. A new store imports the blocks of blockchain_dir,
+        so nodes with the old storage keep their blockchain.
+        '''
+        with Mapper.block_store_lock:
+            store = Mapper.block_store
+            backend = Mapper.backends[Mapper.storage_backend]
+            if store is None or store.path != Mapper.store_dir or type(store) != backend:
+                if store is not None:
+                    store.close()
+                store = backend(Mapper.store_dir)
+                if len(store) == 0 and os.path.isdir(Mapper.blockchain_dir):
+                    imported = import_block_files(store, Mapper.blockchain_dir)
+                    if imported:
+                        log.info(f"imported {imported} blocks from {Mapper.blockchain_dir}")
+                Mapper.block_store = store
+                Mapper.snapshot_height = None
+            return store
+
+    @staticmethod
+    def get_chain_index() -> ChainIndex:
+        '''
+        Loads the chain index of the block store on first use. Blocks that were saved or
+        deleted without updating the index (e.g. after a crash) are added or removed.
+        '''
+        with Mapper.block_store_lock:
+            store = Mapper.get_block_store()
+            chain_index = Mapper.chain_index
+            path = os.path.join(store.path, "chain_index")
+            if chain_index is None or chain_index.path != path:
+                if chain_index is not None:
+                    chain_index.close()
+                chain_index = ChainIndex(path)
+                hashes = store.hashes()
+                if chain_index.load():
+                    chain_index.remove_blocks(set(chain_index.heights).difference(hashes))
+                    for block_hash in hashes:
+                        if block_hash not in chain_index:
+                            chain_index.add_block(block_hash, Mapper.read_predecessor(block_hash))
+                else:
+                    # the predecessors of the blocks in a snapshot don't have to be read
+                    predecessors = Mapper.read_snapshot_predecessors(store)
+                    chain_index.rebuild((block_hash, predecessors[block_hash]
+                                         if block_hash in predecessors
+                                         else Mapper.read_predecessor(block_hash))
+                                        for block_hash in hashes)
+                Mapper.chain_index = chain_index
+            return chain_index
+
+    @staticmethod
+    def load_state():
+        '''
+        Load the block store, the chain index and the balances of the latest block. If they
+        have to be rebuilt, only the blocks after the newest snapshot are read.
+        '''
+        Mapper.get_chain_index()
+        Mapper.read_balance_index()
+
+    @staticmethod
+    def get_snapshot_dir() -> str:
+        return os.path.join(Mapper.get_block_store().path, "snapshots")
+
+    @staticmethod
+    def find_snapshot(tip, directory=None) -> Optional[dict]:
+        '''
+        The newest valid snapshot of a block on the chain that ends with tip, in the snapshot
+        directory of the block store by default
+        '''
+        directory = directory or Mapper.get_snapshot_dir()
+        chain_index = Mapper.get_chain_index()
+        for height in list_snapshots(directory):
+            if chain_index.get_hash_at(tip, height) is None:
+                continue
+            snapshot = read_snapshot(directory, height)
+            if snapshot is not None and chain_index.get_hash_at(tip, height) == snapshot["tip"]:
+                return snapshot
+        return None
+
+    @staticmethod
+    def read_snapshot_predecessors(store: StorageBackend) -> dict:
+        ''' Predecessors of the blocks of the newest valid snapshot whose blocks are stored '''
+        directory = os.path.join(store.path, "snapshots")
+        for height in list_snapshots(directory):
+            snapshot = read_snapshot(directory, height)
+            if snapshot is not None and snapshot["tip"] in store:
+                chain = snapshot["chain"]
+                return dict(zip(chain[1:], chain))
+        return {}
+
+    @staticmethod
+    def write_snapshot_if_due():
+        ''' Called after the balance index was updated to a new latest block '''
+        if not Mapper.snapshot_interval or Mapper.balance_index is None:
+            return
+        tip = Mapper.balance_index["tip"]
+        height = Mapper.get_block_height(tip)
+        if height is None:
+            return
+        if Mapper.snapshot_height is None:
+            snapshot = Mapper.find_snapshot(tip)
+            Mapper.snapshot_height = snapshot["height"] if snapshot else 0
+        if height < Mapper.snapshot_height + Mapper.snapshot_interval:
+            return
+        chain = Mapper.get_chain_index().get_chain_after(tip, None)
+        path = write_snapshot(Mapper.get_snapshot_dir(), chain, Mapper.balance_index["balances"],
+                              Mapper.snapshots_kept)
+        Mapper.snapshot_height = height
+        log.info(f"snapshot of block {height} written to {path}")
+
+    @staticmethod
+    def read_predecessor(block_hash) -> Optional[str]:
+        return Mapper.get_block_store().get_predecessor(block_hash)
+
+    @staticmethod
+    def encode_block(block_hash, block) -> tuple:
+        ''' The stored block and the predecessor of the JSON serialization of a block '''
+        block_dict = json.loads(block)
+        if Mapper.block_format == "binary":
+            try:
+                block = encode_block(block_dict)
+            except CodecError as e:
+                log.debug(f"storing block {block_hash} as JSON: {e}")
+        return block, block_dict.get("predecessor")
 
     @staticmethod
     def write_block(block_hash, block):
-        try:
-            with open(Mapper.blockchain_dir + "/" + str(block_hash), "wb") as file:
-                file.write(block)
-        except EOFError:
-            log.error("Unable to write block")
+        ''' block is the JSON serialization of the block '''
+        data, predecessor = Mapper.encode_block(block_hash, block)
+        Mapper.get_block_store().put(str(block_hash), data)
+        Mapper.get_chain_index().add_block(str(block_hash), predecessor)
+
+    @staticmethod
+    def commit_blocks(blocks, latest_block_hash, delete=()):
+        '''
+        Delete the blocks in delete, save the blocks, a list of (hash, JSON serialization), and
+        make latest_block_hash the latest block. The blocks are synced to disk with one fsync
+        before the latest block hash is replaced, so after a crash it never refers to a block
+        that wasn't saved completely or was deleted. If the latest block is deleted, e.g. when
+        the chain is replaced, the predecessor of the first saved block is made the latest
+        block first.
+        '''
+        encoded = [(str(block_hash),) + Mapper.encode_block(block_hash, block)
+                   for block_hash, block in blocks]
+        saved = {block_hash for block_hash, _, _ in encoded}
+        # blocks that are deleted and saved again are kept
+        delete = [block_hash for block_hash in delete if block_hash not in saved]
+        with Mapper.block_store_lock:
+            if Mapper.read_latest_block_hash() in delete:
+                base = encoded[0][2] if encoded else latest_block_hash
+                Mapper.write_latest_block_hash_file(base or "", sync=True)
+            Mapper.get_block_store().put_many([(block_hash, data)
+                                               for block_hash, data, _ in encoded],
+                                              sync=True, delete=delete)
+            chain_index = Mapper.get_chain_index()
+            chain_index.remove_blocks(delete)
+            for block_hash, _, predecessor in encoded:
+                chain_index.add_block(block_hash, predecessor)
+        Mapper.write_latest_block_hash(latest_block_hash, sync=True)
 
     @staticmethod
     def read_block(block_hash):
-        try:
-            with open(Mapper.blockchain_dir + "/" + block_hash, "rb") as file:
-                block_bytes = file.read()
-                return json.loads(block_bytes)
-        except EOFError:
-            log.error("Unable to read block")
+        ''' Raises KeyError if the block doesn't exist '''
+        block_bytes = Mapper.read_block_bytes(block_hash)
+        if block_bytes is None:
+            raise KeyError(f"block {block_hash} not found")
+        return Mapper.decode_block(block_bytes)
+
+    @staticmethod
+    def read_block_bytes(block_hash) -> Optional[bytes]:
+        ''' The stored block in the binary or JSON format, None if it doesn't exist '''
+        return Mapper.get_block_store().get(block_hash)
+
+    @staticmethod
+    def read_block_view(block_hash) -> Optional[memoryview]:
+        '''
+        Like read_block_bytes, but the stored block is not copied from the memory-mapped block
+        store. Used to send stored blocks to peers.
+        '''
+        return Mapper.get_block_store().get_view(block_hash)
+
+    @staticmethod
+    def decode_block(block_bytes) -> dict:
+        return decode_stored_block(block_bytes)
+
+    @staticmethod
+    def has_block(block_hash) -> bool:
+        return block_hash in Mapper.get_block_store()
+
+    @staticmethod
+    def list_block_hashes() -> list:
+        ''' Hashes of all stored blocks in the order they were saved '''
+        return Mapper.get_block_store().hashes()
+
+    @staticmethod
+    def count_blocks() -> int:
+        return len(Mapper.get_block_store())
+
+    @staticmethod
+    def delete_block(block_hash):
+        Mapper.get_block_store().delete(block_hash)
+        Mapper.get_chain_index().remove_block(block_hash)
+
+    @staticmethod
+    def read_transactions_of(address) -> List[tuple]:
+        ''' (block hash, transaction dict) of all stored transactions from or to the address '''
+        return Mapper.get_block_store().find_transactions(address)
+
+    @staticmethod
+    def read_transaction(tx_hash) -> Optional[tuple]:
+        ''' (block hash, transaction dict) of a stored transaction, None if it isn't stored '''
+        return Mapper.get_block_store().get_transaction(tx_hash)
+
+    @staticmethod
+    def get_block_height(block_hash) -> Optional[int]:
+        ''' Number of blocks before the block, None if it isn't stored '''
+        store = Mapper.get_block_store()
+        if store.has_chain_index:
+            return store.get_height(block_hash)
+        return Mapper.get_chain_index().get_height(block_hash)
+
+    @staticmethod
+    def get_successor_hashes(block_hash) -> List[str]:
+        store = Mapper.get_block_store()
+        if store.has_chain_index:
+            return store.get_successors(block_hash)
+        return Mapper.get_chain_index().get_successors(block_hash)
+
+    @staticmethod
+    def get_chain_tips() -> Dict[str, int]:
+        ''' Hashes of all blocks without successors and the number of blocks of their chains '''
+        return Mapper.get_chain_index().get_tips()
+
+    @staticmethod
+    def get_chain_hashes() -> List[str]:
+        ''' Hashes of the blocks of the chain of the latest block by height '''
+        return Mapper.get_chain_index().get_chain_after(Mapper.read_latest_block_hash(), None) \
+            or []
+
+    @staticmethod
+    def get_block_hash_at(height) -> Optional[str]:
+        ''' Hash of the block at height on the chain of the latest block '''
+        # all backends use the chain index here, a height alone is on several chains
+        return Mapper.get_chain_index().get_hash_at(Mapper.read_latest_block_hash(), height)
+
+    @staticmethod
+    def get_block_hashes_after(block_hash) -> Optional[List[str]]:
+        '''
+        Hashes of the blocks after block_hash on the chain of the latest block, None if the
+        block is not on this chain
+        '''
+        return Mapper.get_chain_index().get_chain_after(Mapper.read_latest_block_hash(),
+                                                        block_hash)
 
     @staticmethod
     def read_latest_block_hash():
@@ -35,17 +328,183 @@ class Mapper():
             with open(Mapper.latest_block_hash_file) as file:
                 data = file.read()
             return data.replace("\n", "")  # Remove any EOL characters
+        except FileNotFoundError:
+            # a new db directory, the latest block is the end of the longest imported chain
+            tips = Mapper.get_chain_tips()
+            tip = max(tips, key=tips.get) if tips else ""
+            with open(Mapper.latest_block_hash_file, "w") as file:
+                file.write(tip)
+            return tip
         except EOFError:
             log.error("Unable to read latest-block-hash")
 
     @staticmethod
-    def write_latest_block_hash(block_hash):
+    def write_latest_block_hash(block_hash, sync=False):
+        ''' Replace the latest block hash and update the balance index and the snapshots '''
+        Mapper.write_latest_block_hash_file(block_hash, sync)
+        Mapper.update_balance_index(str(block_hash))
+        Mapper.write_snapshot_if_due()
+
+    @staticmethod
+    def write_latest_block_hash_file(block_hash, sync=False):
+        '''
+        The file is replaced by a temporary file, so it is never empty or truncated. With sync,
+        the new latest block hash is on disk when it returns.
+        '''
+        tmp_file = Mapper.latest_block_hash_file + ".tmp"
         try:
-            with open(Mapper.latest_block_hash_file, "w") as file:
+            with open(tmp_file, "w") as file:
                 file.write(str(block_hash))
+                if sync:
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(tmp_file, Mapper.latest_block_hash_file)
+            if sync and os.name == "posix":
+                # the rename is only on disk if the directory is synced
+                directory = os.open(os.path.dirname(Mapper.latest_block_hash_file) or ".",
+                                    os.O_RDONLY)
+                try:
+                    os.fsync(directory)
+                finally:
+                    os.close(directory)
         except EOFError:
             log.error("Unable to write latest-block-hash")
 
+    @staticmethod
+    def read_balance(address) -> float:
+        ''' Sum of all amounts received minus all amounts sent by address on the chain '''
+        return Mapper.read_balance_index()["balances"].get(address, 0)
+
+    @staticmethod
+    def read_balance_index() -> dict:
+        '''
+        The balance index contains the hash of the latest block it includes ("tip") and the
+        balance changes of every address ("balances"). It is rebuilt from the blocks if it is
+        missing or corrupt, and updated if it doesn't belong to the latest block.
+        '''
+        balance_index = Mapper.balance_index
+        if balance_index is None:
+            try:
+                with open(Mapper.balance_index_file) as file:
+                    balance_index = json.load(file)
+                if not isinstance(balance_index.get("balances"), dict):
+                    raise ValueError("no balances")
+            except FileNotFoundError:
+                balance_index = None
+            except (ValueError, AttributeError) as e:
+                log.warning(f"The balance index is corrupt ({e}), rebuilding it")
+                balance_index = None
+        if balance_index is None:
+            balance_index = Mapper.rebuild_balance_index()
+        elif balance_index.get("tip") != Mapper.read_latest_block_hash():
+            # e.g. the node stopped before the index was written, add the missing blocks
+            Mapper.balance_index = balance_index
+            Mapper.update_balance_index(Mapper.read_latest_block_hash())
+            balance_index = Mapper.balance_index
+        Mapper.balance_index = balance_index
+        return balance_index
+
+    @staticmethod
+    def write_balance_index(balance_index: dict):
+        # write to a temporary file first, so a crash can't leave a truncated index
+        tmp_file = Mapper.balance_index_file + ".tmp"
+        with open(tmp_file, "w") as file:
+            json.dump(balance_index, file)
+        os.replace(tmp_file, Mapper.balance_index_file)
+        Mapper.balance_index = balance_index
+
+    @staticmethod
+    def rebuild_balance_index() -> dict:
+        '''
+        Add up the transactions of all blocks from the latest block back to the genesis, or
+        back to the block of the newest snapshot on the chain
+        '''
+        tip = Mapper.read_latest_block_hash()
+        snapshot = Mapper.find_snapshot(tip)
+        balance_index = {"tip": tip, "balances": dict(snapshot["balances"]) if snapshot else {}}
+        block_hash = tip
+        replayed = 0
+        while block_hash and (snapshot is None or block_hash != snapshot["tip"]):
+            block_dict = Mapper.read_block_if_exists(block_hash)
+            if block_dict is None:
+                break
+            Mapper.add_block_to_balances(balance_index["balances"], block_dict, 1)
+            block_hash = block_dict.get("predecessor")
+            replayed += 1
+        if snapshot:
+            log.info(f"balance index rebuilt from the snapshot of block {snapshot['height']} "
+                     f"and {replayed} blocks after it")
+        else:
+            log.info(f"balance index rebuilt from {replayed} blocks")
+        Mapper.write_balance_index(balance_index)
+        return balance_index
+
+    @staticmethod
+    def update_balance_index(block_hash):
+        ''' Add the transactions of the blocks up to the new latest block to the balances '''
+        balance_index = Mapper.balance_index
+        if balance_index is None:
+            try:
+                with open(Mapper.balance_index_file) as file:
+                    balance_index = json.load(file)
+            except (FileNotFoundError, ValueError):
+                balance_index = {}
+        # the new blocks from block_hash back to the indexed block, several blocks are added at
+        # once by commit_blocks
+        new_blocks = []
+        tip = block_hash
+        while tip and tip != balance_index.get("tip"):
+            block_dict = Mapper.read_block_if_exists(tip)
+            if block_dict is None:
+                break
+            new_blocks.append(block_dict)
+            tip = block_dict.get("predecessor")
+        if not new_blocks or tip != balance_index.get("tip") \
+                or not isinstance(balance_index.get("balances"), dict):
+            # no index yet or the block is not a successor of the indexed block
+            Mapper.rebuild_balance_index()
+            return
+        balances = dict(balance_index["balances"])
+        for block_dict in reversed(new_blocks):
+            Mapper.add_block_to_balances(balances, block_dict, 1)
+        Mapper.write_balance_index({"tip": block_hash, "balances": balances})
+
+    @staticmethod
+    def roll_back_balance_index(block_hash):
+        '''
+        Remove the transactions of all blocks after block_hash from the balances. This has to
+        be done before these blocks are deleted, e.g. when the chain is replaced by a longer one.
+        '''
+        balance_index = Mapper.read_balance_index()
+        balances = dict(balance_index["balances"])
+        tip = balance_index["tip"]
+        # the newest snapshot may be of a block that is removed
+        Mapper.snapshot_height = None
+        while tip and tip != block_hash:
+            block_dict = Mapper.read_block_if_exists(tip)
+            if block_dict is None:
+                # block_hash is not on the indexed chain, start with empty balances
+                balances = {}
+                break
+            Mapper.add_block_to_balances(balances, block_dict, -1)
+            tip = block_dict.get("predecessor")
+        Mapper.write_balance_index({"tip": block_hash, "balances": balances})
+
+    @staticmethod
+    def add_block_to_balances(balances: dict, block_dict: dict, sign: int):
+        ''' sign is 1 to add the transactions of the block and -1 to remove them '''
+        for transaction in block_dict.get("transactions") or []:
+            amount = sign * transaction["amount"]
+            balances[transaction["source"]] = balances.get(transaction["source"], 0) - amount
+            balances[transaction["target"]] = balances.get(transaction["target"], 0) + amount
+
+    @staticmethod
+    def read_block_if_exists(block_hash):
+        try:
+            return Mapper.read_block(block_hash)
+        except (KeyError, ValueError):
+            return None
+
     @staticmethod
     def read_nonce_list():
         try:
@@ -65,6 +524,77 @@ class Mapper():
                 file.write(str(nonce) + "\n")
         except EOFError:
             log.error("Unable to write nonce list")
+        nonce_index = Mapper.read_nonce_index()
+        bisect.insort(nonce_index, nonce)
+        with open(Mapper.nonce_index_file + ".tail", "ab") as file:
+            array('Q', [nonce]).tofile(file)
+            tail_length = file.tell() // nonce_index.itemsize
+        if tail_length >= Mapper.nonce_tail_max:
+            Mapper.write_nonce_index(nonce_index)
+
+    @staticmethod
+    def read_nonce_index() -> array:
+        '''
+        Sorted array of all nonces in the nonce list, stored as unsigned 64-bit integers. The
+        nonces of the tail are merged into it when it is loaded.
+        '''
+        if Mapper.nonce_index is not None:
+            return Mapper.nonce_index
+        nonce_index = array('Q')
+        try:
+            with open(Mapper.nonce_index_file, "rb") as file:
+                nonce_index.frombytes(file.read())
+        except FileNotFoundError:
+            # build the index from the text file of older versions
+            data = Mapper.read_nonce_list()
+            if data:
+                nonce_index = array('Q', sorted(map(int, data.split())))
+                Mapper.write_nonce_index(nonce_index)
+        tail = array('Q')
+        try:
+            with open(Mapper.nonce_index_file + ".tail", "rb") as file:
+                data = file.read()
+            # ignore a nonce that was written partially before a crash
+            tail.frombytes(data[:len(data) - len(data) % tail.itemsize])
+        except FileNotFoundError:
+            pass
+        if tail:
+            nonce_index = array('Q', sorted(nonce_index + tail))
+        Mapper.nonce_index = nonce_index
+        return nonce_index
+
+    @staticmethod
+    def write_nonce_index(nonce_index: array):
+        '''
+        Write the whole index and remove the tail. A crash before the tail is removed only
+        duplicates some nonces, which doesn't change if a nonce was used.
+        '''
+        # write to a temporary file first, so a crash can't leave a truncated index
+        tmp_file = Mapper.nonce_index_file + ".tmp"
+        with open(tmp_file, "wb") as file:
+            nonce_index.tofile(file)
+        os.replace(tmp_file, Mapper.nonce_index_file)
+        try:
+            os.remove(Mapper.nonce_index_file + ".tail")
+        except FileNotFoundError:
+            pass
+        Mapper.nonce_index = nonce_index
+
+    @staticmethod
+    def read_nonce_clusters():
+        try:
+            with open(Mapper.nonce_clusters_file) as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def write_nonce_clusters(clusters):
+        try:
+            with open(Mapper.nonce_clusters_file, "w") as file:
+                json.dump(clusters, file)
+        except EOFError:
+            log.error("Unable to write nonce clusters")
 
     @staticmethod
     def read_latest_start_nonce():
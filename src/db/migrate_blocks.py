@@ -0,0 +1,69 @@
+'''
+Import the blocks of the old storage with one file per block into the block store. With
+--backend sqlite, the blocks of the segment files in the store directory are imported too.
+
+run with 'python -m db.migrate_blocks' in the src/ directory
+'''
+
+import argparse
+import logging
+import os
+from db.block_store import BlockStore, import_block_files
+from db.mapper import Mapper
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--blocks',
+        dest='blocks_dir',
+        help=f'Directory with one file per block (default: {Mapper.blockchain_dir})',
+        default=Mapper.blockchain_dir
+    )
+    parser.add_argument(
+        '--store',
+        dest='store_dir',
+        help=f'Directory of the block store (default: {Mapper.store_dir})',
+        default=Mapper.store_dir
+    )
+    parser.add_argument(
+        '--backend',
+        dest='backend',
+        choices=sorted(Mapper.backends),
+        help='Storage to import the blocks into (default: segments)',
+        default='segments'
+    )
+    parser.add_argument(
+        '--remove',
+        dest='remove',
+        help='Remove the block files after they were imported',
+        action='store_true'
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s %(levelname)-8s %(message)s", level=logging.INFO,
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    log = logging.getLogger()
+
+    store = Mapper.backends[args.backend](args.store_dir)
+    imported = import_block_files(store, args.blocks_dir)
+    if not isinstance(store, BlockStore):
+        segments = BlockStore(args.store_dir)
+        hashes = [block_hash for block_hash in segments.hashes() if block_hash not in store]
+        store.put_many((block_hash, segments.get(block_hash)) for block_hash in hashes)
+        segments.close()
+        imported += len(hashes)
+    log.info(f"imported {imported} blocks, the store contains {len(store)} blocks")
+
+    if args.remove:
+        for block_hash in os.listdir(args.blocks_dir):
+            # only remove blocks that can be read from the store
+            block_bytes = store.get(block_hash)
+            with open(os.path.join(args.blocks_dir, block_hash), "rb") as file:
+                if block_bytes != file.read():
+                    log.warning(f"block {block_hash} differs from the stored block, kept it")
+                    continue
+            os.remove(os.path.join(args.blocks_dir, block_hash))
+        log.info(f"removed the imported block files from {args.blocks_dir}")
+    store.close()
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import logging
+import os
+from typing import List, Optional
+
+log = logging.getLogger()
+
+VERSION = 1
+
+
+def checksum(snapshot: dict) -> str:
+    ''' sha256 of the snapshot without its checksum '''
+    values = {key: value for key, value in snapshot.items() if key != "checksum"}
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def snapshot_file(directory, height) -> str:
+    return os.path.join(directory, f"snapshot-{height:010d}")
+
+
+def list_snapshots(directory) -> List[int]:
+    ''' Heights of the snapshots in the directory, the newest first '''
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted((int(name[len("snapshot-"):]) for name in names
+                   if name.startswith("snapshot-") and name[len("snapshot-"):].isdigit()),
+                  reverse=True)
+
+
+def write_snapshot(directory, chain: List[str], balances: dict, keep=2,
+                   properties: Optional[dict] = None) -> str:
+    '''
+    Write a snapshot of the state at the last block of chain (the hashes of the chain by
+    height) and remove all but the newest keep snapshots. properties are stored in the
+    snapshot as well. Returns the path of the snapshot.
+    '''
+    snapshot = {
+        **(properties or {}),
+        "version": VERSION,
+        "tip": chain[-1],
+        "height": len(chain) - 1,
+        "chain": chain,
+        "balances": balances,
+    }
+    snapshot["checksum"] = checksum(snapshot)
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_file(directory, snapshot["height"])
+    # write to a temporary file first, so a crash can't leave a truncated snapshot
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w") as file:
+        json.dump(snapshot, file)
+    os.replace(tmp_file, path)
+    for height in list_snapshots(directory)[keep:]:
+        os.remove(snapshot_file(directory, height))
+    return path
+
+
+def read_snapshot(directory, height) -> Optional[dict]:
+    ''' None if the snapshot is missing, corrupt or of another version '''
+    path = snapshot_file(directory, height)
+    try:
+        with open(path) as file:
+            snapshot = json.load(file)
+        if not isinstance(snapshot, dict) or snapshot.get("checksum") != checksum(snapshot):
+            raise ValueError("wrong checksum")
+        if snapshot["version"] != VERSION:
+            raise ValueError(f"unknown version {snapshot['version']}")
+        if snapshot["height"] != height or len(snapshot["chain"]) != height + 1 \
+                or snapshot["chain"][-1] != snapshot["tip"] \
+                or not isinstance(snapshot["balances"], dict):
+            raise ValueError("inconsistent snapshot")
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError) as e:
+        log.warning(f"ignoring the snapshot {path} ({e})")
+        return None
+    return snapshot
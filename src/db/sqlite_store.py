@@ -0,0 +1,213 @@
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Tuple
+from .storage import StorageBackend, decode_stored_block, transaction_hash
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blocks (
+    hash TEXT PRIMARY KEY,
+    predecessor TEXT,
+    -- 0 for blocks whose predecessor is not stored, like in the chain index
+    height INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_by_height ON blocks (height);
+CREATE INDEX IF NOT EXISTS blocks_by_predecessor ON blocks (predecessor);
+CREATE TABLE IF NOT EXISTS transactions (
+    block_hash TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    source TEXT,
+    target TEXT,
+    PRIMARY KEY (block_hash, position)
+);
+CREATE INDEX IF NOT EXISTS transactions_by_hash ON transactions (hash);
+CREATE INDEX IF NOT EXISTS transactions_by_source ON transactions (source);
+CREATE INDEX IF NOT EXISTS transactions_by_target ON transactions (target);
+'''
+
+
+class SqliteStore(StorageBackend):
+    '''
+    Storage of the blocks in an SQLite database (blocks.sqlite in path) in WAL mode, so reads
+    don't wait for writes.
+
+    Besides the stored block, the predecessor and the height of every block and the hash and
+    the addresses of every transaction are stored in indexed columns, so blocks by height or
+    predecessor and transactions by hash or address are found without decoding all blocks. The
+    Mapper gets heights and successors from here instead of the chain index. put_many deletes
+    and stores all blocks in one transaction.
+    '''
+    has_chain_index = True
+
+    def __init__(self, path) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.lock = threading.RLock()
+        # the connection is shared by the threads of the node, the lock serializes its use
+        self.connection = sqlite3.connect(os.path.join(path, "blocks.sqlite"),
+                                          check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # commits are only synced to disk if put_many is called with sync
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def insert(self, block_hash, data: bytes) -> None:
+        ''' Insert or replace a block, within a transaction '''
+        block = decode_stored_block(data)
+        predecessor = block.get("predecessor")
+        row = self.connection.execute("SELECT height FROM blocks WHERE hash = ?",
+                                      (predecessor,)).fetchone()
+        height = row[0] + 1 if row else 0
+        self.connection.execute("DELETE FROM transactions WHERE block_hash = ?", (block_hash,))
+        self.connection.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)",
+                                (block_hash, predecessor, height, data))
+        self.connection.executemany(
+            "INSERT INTO transactions VALUES (?, ?, ?, ?, ?)",
+            ((block_hash, position, transaction_hash(t), t.get("source"), t.get("target"))
+             for position, t in enumerate(block.get("transactions") or [])))
+        # successors that were stored before the block
+        self.update_heights(block_hash, height)
+
+    def update_heights(self, block_hash, height) -> None:
+        ''' Set the heights of all blocks after the block, within a transaction '''
+        blocks = [(block_hash, height)]
+        while blocks:
+            predecessor, height = blocks.pop()
+            successors = self.connection.execute(
+                "SELECT hash FROM blocks WHERE predecessor = ?", (predecessor,)).fetchall()
+            for successor, in successors:
+                self.connection.execute("UPDATE blocks SET height = ? WHERE hash = ?",
+                                        (height + 1, successor))
+                blocks.append((successor, height + 1))
+
+    def put(self, block_hash, data: bytes) -> None:
+        self.put_many([(block_hash, data)])
+
+    def put_many(self, blocks: Iterable[Tuple[str, bytes]], sync=False,
+                 delete: Iterable[str] = ()) -> None:
+        with self.lock:
+            if sync:
+                self.connection.execute("PRAGMA synchronous=FULL")
+            try:
+                self.connection.execute("BEGIN")
+                try:
+                    self.remove(delete)
+                    for block_hash, data in blocks:
+                        self.insert(block_hash, bytes(data))
+                except BaseException:
+                    self.connection.execute("ROLLBACK")
+                    raise
+                self.connection.execute("COMMIT")
+            finally:
+                if sync:
+                    self.connection.execute("PRAGMA synchronous=NORMAL")
+
+    def get(self, block_hash) -> Optional[bytes]:
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM blocks WHERE hash = ?",
+                                          (block_hash,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def remove(self, block_hashes: Iterable[str]) -> None:
+        '''
+        Delete blocks, within a transaction. The heights are updated after all blocks are
+        deleted, so the heights of deleted blocks are not updated.
+        '''
+        deleted = []
+        for block_hash in block_hashes:
+            self.connection.execute("DELETE FROM transactions WHERE block_hash = ?",
+                                    (block_hash,))
+            if self.connection.execute("DELETE FROM blocks WHERE hash = ?",
+                                       (block_hash,)).rowcount:
+                deleted.append(block_hash)
+        # the successors that are still stored start new chains, like in the chain index
+        for block_hash in deleted:
+            for successor, in self.connection.execute(
+                    "SELECT hash FROM blocks WHERE predecessor = ?", (block_hash,)).fetchall():
+                self.connection.execute("UPDATE blocks SET height = 0 WHERE hash = ?",
+                                        (successor,))
+                self.update_heights(successor, 0)
+
+    def delete(self, block_hash) -> None:
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                self.remove([block_hash])
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def __contains__(self, block_hash) -> bool:
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM blocks WHERE hash = ?",
+                                           (block_hash,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+
+    def hashes(self) -> List[str]:
+        with self.lock:
+            return [row[0] for row in
+                    self.connection.execute("SELECT hash FROM blocks ORDER BY rowid")]
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def get_predecessor(self, block_hash) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute("SELECT predecessor FROM blocks WHERE hash = ?",
+                                          (block_hash,)).fetchone()
+        if row is None:
+            raise KeyError(f"block {block_hash} not found")
+        return row[0]
+
+    def get_height(self, block_hash) -> Optional[int]:
+        with self.lock:
+            row = self.connection.execute("SELECT height FROM blocks WHERE hash = ?",
+                                          (block_hash,)).fetchone()
+        return row[0] if row else None
+
+    def get_hashes_at_height(self, height) -> List[str]:
+        ''' Hashes of the blocks at height on all chains '''
+        with self.lock:
+            return [row[0] for row in self.connection.execute(
+                "SELECT hash FROM blocks WHERE height = ? ORDER BY rowid", (height,))]
+
+    def get_successors(self, block_hash) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.connection.execute(
+                "SELECT hash FROM blocks WHERE predecessor = ? ORDER BY rowid", (block_hash,))]
+
+    def read_transactions(self, rows) -> List[Tuple[str, dict]]:
+        ''' (block hash, transaction dict) of (block hash, position) rows '''
+        blocks = {}
+        found = []
+        for block_hash, position in rows:
+            if block_hash not in blocks:
+                blocks[block_hash] = decode_stored_block(self.get(block_hash))["transactions"]
+            found.append((block_hash, blocks[block_hash][position]))
+        return found
+
+    def find_transactions(self, address) -> List[Tuple[str, dict]]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT transactions.block_hash, transactions.position FROM transactions "
+                "JOIN blocks ON blocks.hash = transactions.block_hash "
+                "WHERE transactions.source = ? OR transactions.target = ? "
+                "ORDER BY blocks.rowid, transactions.position", (address, address)).fetchall()
+            return self.read_transactions(rows)
+
+    def get_transaction(self, tx_hash) -> Optional[Tuple[str, dict]]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT transactions.block_hash, transactions.position FROM transactions "
+                "JOIN blocks ON blocks.hash = transactions.block_hash "
+                "WHERE transactions.hash = ? ORDER BY blocks.rowid, transactions.position "
+                "LIMIT 1", (tx_hash,)).fetchall()
+            found = self.read_transactions(rows)
+        return found[0] if found else None
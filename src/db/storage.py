@@ -0,0 +1,100 @@
+import hashlib
+import json
+from abc import ABC, abstractmethod
+from typing import Iterable, List, Optional, Tuple
+from .codec import decode_block, is_binary
+
+
+def decode_stored_block(data) -> dict:
+    ''' The dict of a stored block in the binary or the JSON format '''
+    if is_binary(data):
+        return decode_block(data)
+    return json.loads(data)
+
+
+def transaction_hash(transaction: dict) -> str:
+    ''' The same hash as Transaction.hash of a transaction dict of a block '''
+    values = {key: transaction.get(key) for key in ("source", "target", "amount", "timestamp")}
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class StorageBackend(ABC):
+    '''
+    Storage of the blocks used by the Mapper. Blocks are stored as bytes (db.codec or JSON)
+    by their hash. The queries that aren't abstract decode the stored blocks, backends with
+    indexes (e.g. SqliteStore) override them.
+
+    path is a directory, the Mapper keeps the chain index and the snapshots of the stored
+    blocks there.
+    '''
+
+    path = None
+    # the backend has get_height and get_successors, the Mapper uses them instead of the
+    # chain index
+    has_chain_index = False
+
+    @abstractmethod
+    def put(self, block_hash, data: bytes) -> None:
+        pass
+
+    @abstractmethod
+    def put_many(self, blocks: Iterable[Tuple[str, bytes]], sync=False,
+                 delete: Iterable[str] = ()) -> None:
+        '''
+        Delete the blocks in delete and store several (hash, data) at once, with sync they are
+        on disk when it returns
+        '''
+        pass
+
+    @abstractmethod
+    def get(self, block_hash) -> Optional[bytes]:
+        pass
+
+    def get_view(self, block_hash) -> Optional[memoryview]:
+        ''' The data of the block without copying it, if the backend can do that '''
+        return self.get(block_hash)
+
+    @abstractmethod
+    def delete(self, block_hash) -> None:
+        pass
+
+    @abstractmethod
+    def __contains__(self, block_hash) -> bool:
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abstractmethod
+    def hashes(self) -> List[str]:
+        ''' Hashes of all blocks in the order they were stored '''
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+    def get_predecessor(self, block_hash) -> Optional[str]:
+        ''' Raises KeyError if the block doesn't exist '''
+        data = self.get(block_hash)
+        if data is None:
+            raise KeyError(f"block {block_hash} not found")
+        return decode_stored_block(data).get("predecessor")
+
+    def find_transactions(self, address) -> List[Tuple[str, dict]]:
+        ''' (block hash, transaction dict) of all transactions from or to the address '''
+        found = []
+        for block_hash in self.hashes():
+            for transaction in decode_stored_block(self.get(block_hash))["transactions"]:
+                if address in (transaction.get("source"), transaction.get("target")):
+                    found.append((block_hash, transaction))
+        return found
+
+    def get_transaction(self, tx_hash) -> Optional[Tuple[str, dict]]:
+        ''' (block hash, transaction dict) of the first block with the transaction '''
+        for block_hash in self.hashes():
+            for transaction in decode_stored_block(self.get(block_hash))["transactions"]:
+                if transaction_hash(transaction) == tx_hash:
+                    return block_hash, transaction
+        return None
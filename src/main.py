@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import os
+import time
 import logging
 import argparse
 from Crypto.PublicKey import RSA
@@ -8,7 +9,9 @@ from network.node import P2PNode
 from ecdsa import SigningKey, SECP256k1
 from hashlib import sha256
 from blockchain.block import Transaction
+from blockchain.difficulty import Difficulty, leading_zero_bits
 from blockchain.blockchain import Blockchain
+from db.mapper import Mapper
 
 
 if __name__ == "__main__":
@@ -22,6 +25,57 @@ if __name__ == "__main__":
         help='Port on which to start the node (default: 80)',
         default=80
     )
+    parser.add_argument(
+        '--difficulty',
+        dest='difficulty',
+        type=leading_zero_bits,
+        help='Number of leading zero bits of the proof of work (default: 16)',
+        default=16
+    )
+    parser.add_argument(
+        '--batch-size',
+        dest='batch_size',
+        type=int,
+        help='Number of transactions that are validated by the peers at once (default: 100)',
+        default=100
+    )
+    parser.add_argument(
+        '--batch-wait',
+        dest='batch_wait',
+        type=float,
+        help='Seconds a transaction waits for a full batch before it is validated '
+             '(default: 0.5)',
+        default=0.5
+    )
+    parser.add_argument(
+        '--db',
+        dest='db_dir',
+        help='Directory of the data of this node, so several nodes can run from one checkout '
+             f'(default: {Mapper.db_dir})',
+        default=None
+    )
+    parser.add_argument(
+        '--storage',
+        dest='storage',
+        choices=sorted(Mapper.backends),
+        help='Storage of the blocks: append-only segment files or an SQLite database '
+             '(default: segments)',
+        default='segments'
+    )
+    parser.add_argument(
+        '--snapshot-interval',
+        dest='snapshot_interval',
+        type=int,
+        help='Number of blocks between two snapshots of the balances and the chain, '
+             '0 disables them (default: 1000)',
+        default=1000
+    )
+    parser.add_argument(
+        '--json',
+        dest='json',
+        help='Store blocks and send messages as JSON instead of the binary encoding',
+        action='store_true'
+    )
     parser.add_argument(
         '--debug',
         dest='debug',
@@ -36,23 +90,38 @@ if __name__ == "__main__":
     if args.debug:
         log.setLevel(logging.DEBUG)
 
+    if args.db_dir:
+        Mapper.set_db_dir(os.path.abspath(args.db_dir))
+    Mapper.storage_backend = args.storage
+
     # start node
     node = P2PNode("127.0.0.1", args.port, args.port, max_connections=3)
+    node.difficulty = Difficulty.from_bits(args.difficulty)
+    node.validation_batcher.batch_size = args.batch_size
+    node.validation_batcher.max_wait = args.batch_wait
+    if args.json:
+        node.codec_version = None
+        Mapper.block_format = "json"
+    Mapper.snapshot_interval = args.snapshot_interval
+    start = time.perf_counter()
+    Mapper.load_state()
+    log.info(f"Loaded the blockchain state in {time.perf_counter() - start:.2f} seconds")
     node.start_up()
 
-    if not os.path.exists('db/keys'):
-        os.mkdir("db/keys")
+    keys_dir = os.path.join(Mapper.db_dir, "keys")
+    if not os.path.exists(keys_dir):
+        os.mkdir(keys_dir)
 
-    if not os.path.exists('db/keys/private_key.pem') \
-            or not os.path.exists('db/keys/public_key.pem'):
+    if not os.path.exists(os.path.join(keys_dir, "private_key.pem")) \
+            or not os.path.exists(os.path.join(keys_dir, "public_key.pem")):
         # generate keys
         key = RSA.generate(2048)
         private_key = key.export_key()
-        with open("db/keys/private_key.pem", "wb") as file:
+        with open(os.path.join(keys_dir, "private_key.pem"), "wb") as file:
             file.write(private_key)
 
         public_key = key.publickey().export_key()
-        with open("db/keys/public_key.pem", "wb") as file:
+        with open(os.path.join(keys_dir, "public_key.pem"), "wb") as file:
             file.write(public_key)
 
         print(public_key.decode('ASCII'))
@@ -61,11 +130,27 @@ if __name__ == "__main__":
     user_input = ''
     while user_input not in possible_inputs:
         user_input = input("(s)\tstop the node\n(t)\tcreate transactions, "
-                           "put them in a block and broadcast it to the network\n")
+                           "put them in a block and broadcast it to the network\n"
+                           "(m)\tshow the progress of the mining jobs\n"
+                           "(b)\tmine a block with the transactions in the mempool\n")
 
         if user_input == 's':
             node.stop()
 
+        elif user_input == 'm':
+            if not node.mining_jobs:
+                print("no block is being mined")
+            for job in list(node.mining_jobs):
+                progress = job.progress()
+                print(f"{progress['nonces']} nonces tried in {round(progress['elapsed'], 2)} "
+                      f"seconds, restarted {progress['restarts']} times")
+            user_input = ''
+
+        elif user_input == 'b':
+            print(f"{len(node.mempool)} transactions in the mempool")
+            Blockchain().add_block(None, node)
+            user_input = ''
+
         elif user_input == 't':
             transactions = []
             create_transactions = True
@@ -99,8 +184,13 @@ if __name__ == "__main__":
                     create_transactions = False
 
             answer = input("type 'go' to create a block, append it to your blockchain "
-                           "and broadcast it to the network \n")
+                           "and broadcast it to the network, or 'mempool' to let the peers "
+                           "validate the transactions and add them to the mempool \n")
             if answer == 'go':
+                # the block is mined in the background, it is broadcasted when it is found
                 blockchain = Blockchain()
                 blockchain.add_block(transactions, node)
+            elif answer == 'mempool':
+                for transaction in transactions:
+                    node.validate_transaction(transaction)
             user_input = ''
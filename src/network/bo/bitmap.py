@@ -0,0 +1,15 @@
+from typing import List
+
+
+def to_bitmap(values: List[bool]) -> str:
+    ''' Bit i is set if values[i] is True, as a hex string '''
+    bitmap = 0
+    for i, value in enumerate(values):
+        if value:
+            bitmap |= 1 << i
+    return format(bitmap, "x")
+
+
+def from_bitmap(bitmap: str, count: int) -> List[bool]:
+    bits = int(bitmap, 16)
+    return [bool(bits >> i & 1) for i in range(count)]
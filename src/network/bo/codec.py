@@ -0,0 +1,215 @@
+'''
+Binary encoding of the network messages, used instead of JSON for peers that support it.
+
+A message is a dict of JSON values. Blocks and transactions in a message are encoded with
+db.codec, all other values are tagged with their type. The decoded message is the same dict
+as the JSON message, so the messages in network/bo/messages don't need to know the encoding.
+
+Since version 2, blocks of the block store (Stored_block) are copied into the message as they
+are stored, with their hash and length in front. They are decoded by the receiver only.
+'''
+
+import json
+import struct
+from db.codec import (CodecError, BLOCK_KEYS, BLOCK_WITH_HASH_KEYS, TRANSACTION_KEYS, U8, U16,
+                      U32, I64, F64, read_block, read_string, read_transaction, write_block,
+                      write_string, write_transaction)
+from db.codec import decode_block, is_binary as is_binary_block
+from .stored_block import Stored_block
+
+MAGIC = b"\xb2"
+VERSION = 2
+# the first version, peers with older versions only understand JSON
+MIN_VERSION = 1
+# the first version with STORED_BLOCK
+STORED_BLOCK_VERSION = 2
+
+# type tags of the values
+NONE = 0
+FALSE = 1
+TRUE = 2
+INT = 3
+FLOAT = 4
+STRING = 5
+LIST = 6
+DICT = 7
+TRANSACTION = 8
+BLOCK = 9
+# integers that don't fit into 64 bits, as decimal string
+BIG_INT = 10
+LONG_STRING = 11
+# a block of the block store: raw hash, length, stored block (db.codec or JSON)
+STORED_BLOCK = 12
+
+
+def is_binary(data) -> bool:
+    return data[:1] == MAGIC
+
+
+def write_value(out: bytearray, value, version=VERSION):
+    value_type = type(value)
+    if value is None:
+        out += U8.pack(NONE)
+    elif value_type == bool:
+        out += U8.pack(TRUE if value else FALSE)
+    elif value_type == int:
+        if -2**63 <= value < 2**63:
+            out += U8.pack(INT)
+            out += I64.pack(value)
+        else:
+            out += U8.pack(BIG_INT)
+            write_string(out, str(value))
+    elif value_type == float:
+        out += U8.pack(FLOAT)
+        out += F64.pack(value)
+    elif value_type == str:
+        data = value.encode("utf-8")
+        if len(data) > 0xffff:
+            out += U8.pack(LONG_STRING)
+            out += U32.pack(len(data))
+            out += data
+        else:
+            out += U8.pack(STRING)
+            out += U16.pack(len(data))
+            out += data
+    elif value_type in (list, tuple):
+        out += U8.pack(LIST)
+        out += U32.pack(len(value))
+        for item in value:
+            write_value(out, item, version)
+    elif value_type == dict:
+        write_dict(out, value, version)
+    elif value_type == Stored_block:
+        write_stored_block(out, value, version)
+    else:
+        raise CodecError(f"{value_type.__name__} can't be encoded")
+
+
+def write_dict(out: bytearray, value: dict, version=VERSION):
+    keys = value.keys()
+    if keys == TRANSACTION_KEYS or keys == BLOCK_KEYS or keys == BLOCK_WITH_HASH_KEYS:
+        start = len(out)
+        try:
+            if keys == TRANSACTION_KEYS:
+                out += U8.pack(TRANSACTION)
+                write_transaction(out, value)
+            else:
+                out += U8.pack(BLOCK)
+                write_block(out, value)
+            return
+        except CodecError:
+            # not a valid transaction or block, encode it like other dicts
+            del out[start:]
+    out += U8.pack(DICT)
+    out += U32.pack(len(value))
+    for key, item in value.items():
+        write_string(out, key)
+        write_value(out, item, version)
+
+
+def write_stored_block(out: bytearray, block: Stored_block, version):
+    if version < STORED_BLOCK_VERSION:
+        write_dict(out, block.to_dict(), version)
+        return
+    raw_hash = bytes.fromhex(block.saved_hash)
+    if len(raw_hash) != 32:
+        raise CodecError(f"{block.saved_hash} is not a 256-bit hash")
+    out += U8.pack(STORED_BLOCK)
+    out += raw_hash
+    out += U32.pack(len(block.data))
+    out += block.data
+
+
+def read_stored_block(data, offset):
+    ''' Returns the same dict as Stored_block.to_dict and the offset after it '''
+    block_hash = data[offset:offset + 32].hex()
+    length, = U32.unpack_from(data, offset + 32)
+    offset += 36
+    stored = data[offset:offset + length]
+    if len(stored) != length:
+        raise CodecError("stored block is truncated")
+    if is_binary_block(stored):
+        block = decode_block(stored)
+    else:
+        block = json.loads(bytes(stored))
+        if type(block) != dict or block.keys() != BLOCK_KEYS:
+            raise CodecError("stored block is not a block")
+    return {
+        "hash": block_hash,
+        "predecessor": block["predecessor"],
+        "transactions": block["transactions"],
+        "nonce": block["nonce"],
+    }, offset + length
+
+
+def read_value(data, offset):
+    ''' Returns the value and the offset after it '''
+    tag = data[offset]
+    offset += 1
+    if tag == NONE:
+        return None, offset
+    if tag == FALSE:
+        return False, offset
+    if tag == TRUE:
+        return True, offset
+    if tag == INT:
+        return I64.unpack_from(data, offset)[0], offset + 8
+    if tag == FLOAT:
+        return F64.unpack_from(data, offset)[0], offset + 8
+    if tag == STRING:
+        return read_string(data, offset)
+    if tag == LONG_STRING:
+        length, = U32.unpack_from(data, offset)
+        offset += 4
+        return str(data[offset:offset + length], "utf-8"), offset + length
+    if tag == BIG_INT:
+        value, offset = read_string(data, offset)
+        return int(value), offset
+    if tag == LIST:
+        count, = U32.unpack_from(data, offset)
+        offset += 4
+        items = []
+        for _ in range(count):
+            item, offset = read_value(data, offset)
+            items.append(item)
+        return items, offset
+    if tag == DICT:
+        count, = U32.unpack_from(data, offset)
+        offset += 4
+        value = {}
+        for _ in range(count):
+            key, offset = read_string(data, offset)
+            value[key], offset = read_value(data, offset)
+        return value, offset
+    if tag == TRANSACTION:
+        return read_transaction(data, offset)
+    if tag == BLOCK:
+        return read_block(data, offset)
+    if tag == STORED_BLOCK:
+        return read_stored_block(data, offset)
+    raise CodecError(f"unknown type {tag}")
+
+
+def encode_message(message: dict, version=VERSION) -> bytes:
+    '''
+    Encodes the message for peers that decode the given version. Raises a CodecError if the
+    message contains values that are not JSON values or stored blocks.
+    '''
+    out = bytearray(MAGIC)
+    out += U8.pack(version)
+    write_dict(out, message, version)
+    return bytes(out)
+
+
+def decode_message(data) -> dict:
+    if not is_binary(data):
+        raise CodecError("not a binary message")
+    if data[1] > VERSION:
+        raise CodecError(f"unknown version {data[1]}")
+    try:
+        message, offset = read_value(memoryview(data), 2)
+    except (struct.error, IndexError, UnicodeDecodeError, ValueError) as e:
+        raise CodecError(f"message is truncated or corrupt ({e})")
+    if offset != len(data) or type(message) != dict:
+        raise CodecError("message is truncated or followed by other data")
+    return message
@@ -1,5 +1,6 @@
 from .message import Message
 from blockchain.block import Block
+from ..stored_block import Stored_block
 
 
 class Blocks(Message):
@@ -26,6 +27,9 @@ class Blocks(Message):
         for block in self.get_blocks():
             if isinstance(block, Block):
                 blocks.append(block.to_dict_with_hash())
+            elif isinstance(block, Stored_block):
+                # encoded by P2PNodeConnection.send without decoding it
+                blocks.append(block)
 
         return {
             "name": self.get_name(),
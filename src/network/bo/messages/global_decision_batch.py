@@ -0,0 +1,34 @@
+from .message import Message
+
+
+class Global_decision_batch(Message):
+    ''' The bitmap contains one bit for every transaction of the batch, set if it is valid '''
+
+    def __init__(self, batch_id, bitmap) -> None:
+        super().__init__()
+        self._name = "global-decision-batch"
+        self._batch_id = batch_id
+        self._bitmap = bitmap
+
+    def get_batch_id(self):
+        return self._batch_id
+
+    def set_batch_id(self, batch_id):
+        self._batch_id = batch_id
+
+    def get_bitmap(self):
+        return self._bitmap
+
+    def set_bitmap(self, bitmap):
+        self._bitmap = bitmap
+
+    def to_dict(self):
+        return {
+            "name": self.get_name(),
+            "batch_id": self.get_batch_id(),
+            "bitmap": self.get_bitmap(),
+        }
+
+    @staticmethod
+    def from_dict(dict):
+        return Global_decision_batch(dict["batch_id"], dict["bitmap"])
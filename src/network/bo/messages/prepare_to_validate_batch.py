@@ -0,0 +1,32 @@
+from .message import Message
+
+
+class Prepare_to_validate_batch(Message):
+    def __init__(self, batch_id, transactions) -> None:
+        super().__init__()
+        self._name = "prepare-to-validate-batch"
+        self._batch_id = batch_id
+        self._transactions = transactions
+
+    def get_batch_id(self):
+        return self._batch_id
+
+    def set_batch_id(self, batch_id):
+        self._batch_id = batch_id
+
+    def get_transactions(self):
+        return self._transactions
+
+    def set_transactions(self, transactions):
+        self._transactions = transactions
+
+    def to_dict(self):
+        return {
+            "name": self.get_name(),
+            "batch_id": self.get_batch_id(),
+            "transactions": self.get_transactions(),
+        }
+
+    @staticmethod
+    def from_dict(dict):
+        return Prepare_to_validate_batch(dict["batch_id"], dict["transactions"])
@@ -2,10 +2,12 @@ from .message import Message
 
 
 class Vote(Message):
-    def __init__(self, valid) -> None:
+    def __init__(self, valid, tx_id=None) -> None:
         super().__init__()
         self._name = "vote"
         self._valid = valid
+        # hash of the transaction the message belongs to
+        self._tx_id = tx_id
 
     def get_valid(self):
         return self._valid
@@ -13,12 +15,19 @@ class Vote(Message):
     def set_valid(self, valid):
         self._valid = valid
 
+    def get_tx_id(self):
+        return self._tx_id
+
+    def set_tx_id(self, tx_id):
+        self._tx_id = tx_id
+
     def to_dict(self):
         return {
             "name": self.get_name(),
             "valid": self.get_valid(),
+            "tx_id": self.get_tx_id(),
         }
 
     @staticmethod
     def from_dict(dict):
-        return Vote(dict["valid"])
+        return Vote(dict["valid"], dict.get("tx_id"))
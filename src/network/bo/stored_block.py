@@ -0,0 +1,18 @@
+from blockchain.block_cache import block_cache
+
+
+class Stored_block():
+    '''
+    A block as it is stored in the block store (binary or JSON), used to send blocks to peers
+    without decoding them. The binary message encoding copies the stored bytes into the
+    message, other encodings use to_dict.
+    '''
+
+    def __init__(self, saved_hash, data) -> None:
+        self.saved_hash = saved_hash
+        # bytes or a memoryview of the block store
+        self.data = data
+
+    def to_dict(self):
+        ''' The same dict as Block.to_dict_with_hash, the decoded block is cached '''
+        return {"hash": self.saved_hash, **block_cache.get(self.saved_hash, self.data).to_dict()}
@@ -0,0 +1,228 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import List
+from blockchain.block import Transaction
+from network.bo.bitmap import to_bitmap, from_bitmap
+from network.bo.messages.prepare_to_validate_batch import Prepare_to_validate_batch
+from network.bo.messages.vote_batch import Vote_batch
+from network.bo.messages.global_decision_batch import Global_decision_batch
+
+log = logging.getLogger()
+
+
+def validate_transactions(node, transactions: List[Transaction]) -> List[bool]:
+    '''
+    Validate all transactions of a batch. The signatures are verified at once with the
+    signature verifier of the node. A sender can't spend more than the balance with all of the
+    sender's transactions in the batch together.
+    '''
+    signatures = node.signature_verifier.verify(transactions, stop_at_failure=False)
+    results = []
+    spent = {}
+    for transaction, signature_valid in zip(transactions, signatures):
+        valid = signature_valid and transaction.validate(check_signature=False)
+        if valid:
+            spent[transaction.source] = spent.get(transaction.source, 0) + transaction.amount
+            if spent[transaction.source] > transaction.get_balance():
+                log.error(f"Not valid: {transaction.source} can't send {spent[transaction.source]} "
+                          "in one batch")
+                spent[transaction.source] -= transaction.amount
+                valid = False
+        results.append(bool(valid))
+    return results
+
+
+class Batch_Validation():
+    '''
+    Two-phase validation of a batch of transactions. The coordinator sends all transactions in
+    one message, every participant answers with one vote that contains a bit for every
+    transaction. The global decision is also a bitmap: a transaction is valid if all peers voted
+    for it. The conversations are kept in node.conversations["batch_validation"] by batch id.
+    '''
+    # seconds until a conversation is aborted if not all votes or the decision were received
+    TIMEOUT = 30
+
+    def __init__(self, node, batch_id, transactions) -> None:
+        self.node = node
+        self.batch_id = batch_id
+        # transactions as dicts, like in the messages
+        self.transactions = transactions
+        self.votes = {}
+        self.started = time.monotonic()
+
+    @staticmethod
+    def create(node, transactions) -> 'Batch_Validation':
+        ''' The batch id is the hash of the hashes of the transactions '''
+        tx_hashes = [Transaction.from_dict(transaction).hash() for transaction in transactions]
+        batch_id = hashlib.sha256("".join(tx_hashes).encode("utf-8")).hexdigest()
+        return Batch_Validation(node, batch_id, transactions)
+
+    @staticmethod
+    def get(node, batch_id):
+        with node.conversations_lock:
+            return node.conversations["batch_validation"].get(batch_id)
+
+    def register(self) -> bool:
+        ''' Returns False if the batch is already being validated '''
+        with self.node.conversations_lock:
+            conversations = self.node.conversations["batch_validation"]
+            if self.batch_id in conversations:
+                return False
+            conversations[self.batch_id] = self
+            return True
+
+    def remove(self) -> bool:
+        ''' Returns False if the conversation was already removed, e.g. after a timeout '''
+        with self.node.conversations_lock:
+            return self.node.conversations["batch_validation"].pop(self.batch_id, None) \
+                is not None
+
+    @staticmethod
+    def remove_expired(node):
+        ''' Abort all conversations that took longer than TIMEOUT, called by the node '''
+        now = time.monotonic()
+        with node.conversations_lock:
+            expired = [validation for validation in
+                       node.conversations["batch_validation"].values()
+                       if now - validation.started > validation.TIMEOUT]
+        for validation in expired:
+            if not validation.remove():
+                continue
+            if validation.votes:
+                log.warning(f"not all peers voted for batch {validation.batch_id} in time")
+                msg_out = Global_decision_batch(validation.batch_id, to_bitmap([]))
+                validation.node.send_to_nodes(msg_out.to_dict())
+            else:
+                log.warning(f"no global decision for batch {validation.batch_id} received "
+                            "in time")
+
+    def add_to_mempool(self, decisions):
+        added = 0
+        for transaction, valid in zip(self.transactions, decisions):
+            if valid and self.node.mempool.add(Transaction.from_dict(transaction)):
+                added += 1
+        log.debug(f"{added} of {len(self.transactions)} transactions of batch {self.batch_id} "
+                  "added to mempool")
+
+    # coordinator
+    def send_prepare_to_validate(self):
+        if not self.register():
+            log.debug(f"batch {self.batch_id} is already being validated")
+            return
+        with self.node.conversations_lock:
+            for peer in self.node.all_nodes:
+                self.votes[peer.port] = "not_voted"
+
+        if not self.votes:
+            # no peers that have to agree, the transactions were only validated one by one
+            self.remove()
+            transactions = [Transaction.from_dict(transaction)
+                            for transaction in self.transactions]
+            self.add_to_mempool(validate_transactions(self.node, transactions))
+            return
+
+        msg = Prepare_to_validate_batch(self.batch_id, self.transactions)
+        self.node.send_to_nodes(msg.to_dict())
+
+    # participants
+    def prepare_to_validate_received(self, sender_node_conn):
+        if not self.register():
+            log.debug(f"batch {self.batch_id} is already being validated")
+            return
+
+        transactions = [Transaction.from_dict(transaction) for transaction in self.transactions]
+        valid = validate_transactions(self.node, transactions)
+
+        # simulate that node 81 can't validate the transactions
+        if self.node.port == 81:
+            valid = [False] * len(valid)
+
+        log.debug(f"vote {sum(valid)} of {len(valid)} transactions of batch {self.batch_id} "
+                  "valid")
+        msg_out = Vote_batch(self.batch_id, to_bitmap(valid))
+        self.node.send_to_node(sender_node_conn, msg_out.to_dict())
+
+    # coordinator
+    def vote_received(self, sender_node_conn, message):
+        msg_in = Vote_batch.from_dict(message)
+
+        # votes of several connection threads can arrive at the same time
+        with self.node.conversations_lock:
+            if sender_node_conn.port not in self.votes:
+                log.warning(f"vote from unexpected peer {sender_node_conn.port}")
+                return
+            self.votes[sender_node_conn.port] = from_bitmap(msg_in.get_bitmap(),
+                                                            len(self.transactions))
+            if "not_voted" in self.votes.values():
+                return
+        # only the thread of the last vote sends the decision, unless the round timed out
+        if not self.remove():
+            return
+
+        decisions = [all(votes) for votes in zip(*self.votes.values())]
+        self.add_to_mempool(decisions)
+        msg_out = Global_decision_batch(self.batch_id, to_bitmap(decisions))
+        self.node.send_to_nodes(msg_out.to_dict())
+
+    # participants
+    def global_decision_received(self, message):
+        msg = Global_decision_batch.from_dict(message)
+        self.add_to_mempool(from_bitmap(msg.get_bitmap(), len(self.transactions)))
+        self.remove()
+
+
+class Validation_Batcher():
+    '''
+    Collects the transactions that should be validated by the peers. A batch is sent when it
+    contains batch_size transactions or when the first transaction waited for max_wait seconds.
+    Larger batches need fewer messages, a shorter wait gets single transactions validated
+    faster.
+    '''
+
+    def __init__(self, node, batch_size=100, max_wait=0.5) -> None:
+        self.node = node
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.pending = []
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def add(self, transaction: Transaction):
+        ''' Transactions that are not valid locally are not sent to the peers '''
+        if not validate_transactions(self.node, [transaction])[0]:
+            log.error("transaction not valid")
+            return
+        batch = None
+        with self.lock:
+            self.pending.append(transaction.to_full_dict())
+            if len(self.pending) >= self.batch_size:
+                batch = self.take_pending()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.max_wait, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if batch:
+            self.send(batch)
+
+    def take_pending(self) -> list:
+        batch = self.pending
+        self.pending = []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return batch
+
+    def flush(self):
+        with self.lock:
+            batch = self.take_pending()
+        if batch:
+            self.send(batch)
+
+    def send(self, transactions):
+        Batch_Validation.create(self.node, transactions).send_prepare_to_validate()
+
+    def stop(self):
+        with self.lock:
+            self.take_pending()
@@ -1,4 +1,3 @@
-import os
 import logging
 from network.conversations.block_download import Block_download
 from network.bo.messages.block_message import Block_message
@@ -22,18 +21,17 @@ class Block_broadcasting():
         msg_in = Block_message.from_dict(message)
         block = msg_in.get_block()
 
-        my_block_hashes = os.listdir(os.getcwd() + "/db/blocks/")
         local_latest_block_hash = Mapper().read_latest_block_hash()
 
-        if block.validate() is False:
+        if block.validate(self.node.difficulty, self.node.signature_verifier) is False:
             log.error("The block is not valid")
             return False
-        if block.saved_hash in my_block_hashes:
+        if Mapper().has_block(block.saved_hash):
             log.error("The local blockchain contains the block already")
             return False
         if block.predecessor == local_latest_block_hash:
-            block.write_to_file()
-            Mapper().write_latest_block_hash(block.saved_hash)
+            Mapper().commit_blocks([(block.saved_hash, block.serialize())], block.saved_hash)
+            self.node.mempool.remove_transactions(block.transactions)
             log.info("block saved")
         else:
             log.warning("the predecessor of the received block doesn't match the "
@@ -1,9 +1,10 @@
 import logging
-import os
+import time
 from ..bo.messages.get_blocks import Get_blocks
 from ..bo.messages.blocks import Blocks
+from ..bo.stored_block import Stored_block
 from db.mapper import Mapper
-from blockchain.block import Block
+from blockchain.block_cache import block_cache
 
 log = logging.getLogger()
 
@@ -13,6 +14,8 @@ class Block_download():
         self.node = node
         # hash of the genesis block
         self.genesis_block_hash = "ca831b26dda2d7f27cf1eead9528ef3f1b793c6a68e9e652e8fb3e6164425e38"
+        # times a response is built, if blocks are deleted while it is built
+        self.build_attempts = 3
 
     # node that requests blocks
     def get_blocks(self, node_connection):
@@ -23,63 +26,95 @@ class Block_download():
     def serve_block_request(self, node_connection, message):
         """ Handle a received Get_blocks request from a peer node """
         msg_in = Get_blocks.from_dict(message)
-        latest_block_hash_from_peer = msg_in.get_latest_block_hash()
+        for _ in range(self.build_attempts):
+            msg = self.build_response(msg_in.get_latest_block_hash())
+            if msg is not None:
+                self.node.send_to_node(node_connection, msg.to_dict())
+                return
+            log.warning("the local blockchain changed while the response was built, "
+                        "building it again")
+        log.error("the blocks of the local blockchain can't be read, no response is sent")
+
+    def build_response(self, latest_block_hash_from_peer):
+        """ The Blocks message for the peer, None if a block was deleted in the meantime """
         own_latest_block_hash = Mapper().read_latest_block_hash()
-        my_block_hashes = os.listdir(os.getcwd() + "/db/blocks/")
         if latest_block_hash_from_peer == own_latest_block_hash:
             # up to date with peer
             log.debug("Already synced with peer")
-            blocks = []
-            info = "already-synced"
-            msg = Blocks(blocks, info)
-            self.node.send_to_node(node_connection, msg.to_dict())
-        elif latest_block_hash_from_peer != own_latest_block_hash:
-            if latest_block_hash_from_peer not in my_block_hashes:
-                # local blockchain doesn't contain latest_block_hash_from_peer -> possible fork
-                log.warning("the local blockchain doesn't contain the latest_block_hash "
-                            "from peer")
-                blocks = self.build_whole_blockchain()
-                info = "fork-detected"
-                msg = Blocks(blocks, info)
-                self.node.send_to_node(node_connection, msg.to_dict())
-            elif latest_block_hash_from_peer in my_block_hashes:
-                log.debug("send blocks to peer")
-                blocks = self.build_blockchain_from_hash(latest_block_hash_from_peer, [])
-                msg = Blocks(blocks)
-                self.node.send_to_node(node_connection, msg.to_dict())
+            return Blocks([], "already-synced")
+        if Mapper().get_block_hashes_after(latest_block_hash_from_peer) is None:
+            # local blockchain doesn't contain latest_block_hash_from_peer or it is on
+            # another branch -> possible fork
+            log.warning("the local blockchain doesn't contain the latest_block_hash "
+                        "from peer")
+            blocks = self.build_whole_blockchain()
+            return Blocks(blocks, "fork-detected") if blocks is not None else None
+        log.debug("send blocks to peer")
+        blocks = self.build_blockchain_from_hash(latest_block_hash_from_peer, [])
+        return Blocks(blocks) if blocks is not None else None
 
     # node that requested blocks
     def receive_blocks(self, message):
         """ Receive blocks from a peer node after sending a Get_blocks request """
         msg_in = Blocks.from_dict(message)
-        my_block_hashes = os.listdir(os.getcwd() + "/db/blocks/")
         local_latest_block_hash = Mapper().read_latest_block_hash()
-        successor_of_local_latest_block_count = 0
+        # local blocks that are deleted when the blocks of the peer are saved
+        replaced = set()
         if msg_in.get_info() == "already-synced":
             log.debug("Already synced with peer")
             return False
         if msg_in.get_info() == "fork-detected":
             log.warning("Possible fork detected")
             # if the chain from the peer is longer than the local chain, rebuild the whole thing
-            if len(msg_in.get_blocks()) > len(my_block_hashes):
+            if len(msg_in.get_blocks()) > Mapper().count_blocks():
                 log.debug("Less local blocks, adopting longest chain")
-                db_dir = os.getcwd() + "/db/blocks/"
-                # delete the local blockchain
-                for block_hash in os.listdir(db_dir):
-                    # keep the genesis block
-                    if block_hash == self.genesis_block_hash:
-                        continue
-                    os.remove(os.path.join(db_dir, block_hash))
-                my_block_hashes = ''
-                local_latest_block_hash = ''
+                # remove the transactions of the deleted blocks from the balances
+                Mapper().roll_back_balance_index(self.genesis_block_hash)
+                Mapper().write_latest_block_hash_file(self.genesis_block_hash, sync=True)
+                # the local blockchain except the genesis block is deleted together with saving
+                # the new blocks, so a crash can't leave the latest block hash on a deleted block
+                replaced = set(Mapper().list_block_hashes())
+                replaced.discard(self.genesis_block_hash)
             else:
                 return False
 
+        if not self.validate_blocks(msg_in, local_latest_block_hash, replaced):
+            if replaced:
+                # keep the local blockchain
+                Mapper().write_latest_block_hash(local_latest_block_hash, sync=True)
+            return False
+
+        # save all blocks and the new latest block at once
+        blocks = msg_in.get_blocks()
+        start = time.perf_counter()
+        stored = [(block.saved_hash, block.serialize()) for block in blocks]
+        Mapper().commit_blocks(stored, blocks[-1].saved_hash, delete=replaced)
+        elapsed = time.perf_counter() - start
+        if replaced:
+            block_cache.clear()
+        # the verified blocks are decoded already, peers and mining jobs read them next
+        for block, (block_hash, data) in zip(blocks, stored):
+            block_cache.add(block_hash, block, len(data))
+        for block in blocks:
+            self.node.mempool.remove_transactions(block.transactions)
+        log.info(f"{len(blocks)} block(s) saved in {elapsed:.3f} seconds "
+                 f"({len(blocks) / max(elapsed, 1e-9):.0f} blocks/s)")
+        return True
+
+    def validate_blocks(self, msg_in, local_latest_block_hash, replaced) -> bool:
+        ''' Check the received blocks before they are saved, replaced are deleted then '''
+        # verify the signatures of all blocks at once, this stops at the first invalid one
+        transactions = [t for block in msg_in.get_blocks() for t in block.transactions]
+        if not self.node.signature_verifier.verify_all(transactions):
+            log.error("A block contains a transaction with an invalid signature")
+            return False
+
+        successor_of_local_latest_block_count = 0
         for block in msg_in.get_blocks():
-            if block.validate() is False:
+            if block.validate(self.node.difficulty, check_signatures=False) is False:
                 log.error("A block is not valid")
                 return False
-            if block.saved_hash in my_block_hashes:
+            if Mapper().has_block(block.saved_hash) and block.saved_hash not in replaced:
                 log.debug("The local blockchain contains one of the blocks already")
                 return False
             if block.predecessor == local_latest_block_hash:
@@ -89,41 +124,29 @@ class Block_download():
                 and msg_in.get_info() != "fork-detected":
             log.error("Not exactly one successor of the local latest block")
             return False
-
-        for block in msg_in.get_blocks():
-            block.write_to_file()
-            Mapper().write_latest_block_hash(block.saved_hash)
-        log.info("block(s) saved")
         return True
 
-    # helper method
-    def get_successor_block(self, predecessor_hash):
-        for block_hash in os.listdir(os.getcwd() + "/db/blocks/"):
-            block_dict = Mapper().read_block(block_hash)
-            block: Block = Block().from_dict(block_dict, block_hash)
-            if block.predecessor == predecessor_hash:
-                return block
+    def read_stored_blocks(self, block_hashes, blocks_to_send):
+        '''
+        The blocks are sent as they are stored, without decoding and encoding them again.
+        Returns None if a block was deleted in the meantime, e.g. because the chain was
+        replaced, the peer would reject a chain without it.
+        '''
+        for block_hash in block_hashes:
+            view = Mapper().read_block_view(block_hash)
+            if view is None:
+                log.warning(f"block {block_hash} was deleted")
+                return None
+            blocks_to_send.append(Stored_block(block_hash, view))
+        return blocks_to_send
 
-    # recursive helper method
     def build_blockchain_from_hash(self, predecessor_hash, blocks_to_send):
-        successor_block = self.get_successor_block(predecessor_hash)
-        blocks_to_send.append(successor_block)
-
-        local_latest_block_hash = Mapper().read_latest_block_hash()
-        if successor_block.saved_hash == local_latest_block_hash:
-            return blocks_to_send
-
-        blocks_to_send = self.build_blockchain_from_hash(successor_block.saved_hash, blocks_to_send)
-        return blocks_to_send
+        ''' Append the blocks after predecessor_hash up to the local latest block '''
+        return self.read_stored_blocks(Mapper().get_block_hashes_after(predecessor_hash) or [],
+                                       blocks_to_send)
 
     def build_whole_blockchain(self):
         ''' Rebuild the whole blockchain in case a peer node discovered a fork '''
-        blocks_to_send = []
-        for block_hash in os.listdir(os.getcwd() + "/db/blocks/"):
-            # ignore the genesis block
-            if block_hash == self.genesis_block_hash:
-                continue
-            block_dict = Mapper().read_block(block_hash)
-            block: Block = Block().from_dict(block_dict, block_hash)
-            blocks_to_send.append(block)
-        return blocks_to_send
+        # ignore the genesis block
+        return self.read_stored_blocks([block_hash for block_hash in Mapper().get_chain_hashes()
+                                        if block_hash != self.genesis_block_hash], [])
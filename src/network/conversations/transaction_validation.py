@@ -1,4 +1,6 @@
 import logging
+import time
+from blockchain.block import Transaction
 from network.bo.messages.prepare_to_validate import Prepare_to_validate
 from network.bo.messages.vote import Vote
 from network.bo.messages.global_decision import Global_decision
@@ -7,66 +9,150 @@ log = logging.getLogger()
 
 
 class Transaction_Validation():
+    '''
+    Two-phase validation of one transaction. The conversations of a node are kept in
+    node.conversations["transaction_validation"] by the hash of their transaction, so many
+    transactions can be validated at the same time. Votes and global decisions contain the
+    hash, so they are passed to the right conversation.
+    '''
+    # seconds until a conversation is aborted if not all votes or the decision were received
+    TIMEOUT = 30
+
     def __init__(self, node, transaction) -> None:
         self.node = node
         self.transaction = transaction
+        self.tx_id = Transaction.from_dict(transaction).hash()
         self.votes = {}
+        self.started = time.monotonic()
+
+    @staticmethod
+    def get(node, tx_id):
+        with node.conversations_lock:
+            return node.conversations["transaction_validation"].get(tx_id)
+
+    def register(self) -> bool:
+        ''' Returns False if the transaction is already being validated '''
+        with self.node.conversations_lock:
+            conversations = self.node.conversations["transaction_validation"]
+            if self.tx_id in conversations:
+                return False
+            conversations[self.tx_id] = self
+            return True
+
+    def remove(self) -> bool:
+        ''' Returns False if the conversation was already removed, e.g. after a timeout '''
+        with self.node.conversations_lock:
+            return self.node.conversations["transaction_validation"].pop(self.tx_id, None) \
+                is not None
+
+    def is_expired(self, now) -> bool:
+        return now - self.started > self.TIMEOUT
+
+    @staticmethod
+    def remove_expired(node):
+        ''' Abort all conversations that took longer than TIMEOUT, called by the node '''
+        now = time.monotonic()
+        with node.conversations_lock:
+            expired = [validation for validation in
+                       node.conversations["transaction_validation"].values()
+                       if validation.is_expired(now)]
+        for validation in expired:
+            validation.timed_out()
+
+    def timed_out(self):
+        if not self.remove():
+            # finished in the meantime
+            return
+        if self.votes:
+            # coordinator: the peers that voted are waiting for the decision
+            log.warning(f"not all peers voted for transaction {self.tx_id} in time")
+            msg_out = Global_decision(False, self.tx_id)
+            self.node.send_to_nodes(msg_out.to_dict())
+        else:
+            log.warning(f"no global decision for transaction {self.tx_id} received in time")
 
     # coordinator
     def send_prepare_to_validate(self):
-        for peer in self.node.all_nodes:
-            self.votes[peer.port] = "not_voted"
+        if not Transaction.from_dict(self.transaction).validate():
+            log.error("transaction not valid")
+            return
+        if not self.register():
+            log.debug(f"transaction {self.tx_id} is already being validated")
+            return
+        with self.node.conversations_lock:
+            for peer in self.node.all_nodes:
+                self.votes[peer.port] = "not_voted"
+
+        if not self.votes:
+            # no peers that have to agree
+            self.remove()
+            self.add_to_mempool()
+            return
 
         msg = Prepare_to_validate(self.transaction)
         self.node.send_to_nodes(msg.to_dict())
 
     # participants
     def prepare_to_validate_received(self, sender_node_conn):
-        valid = True
+        if not self.register():
+            log.debug(f"transaction {self.tx_id} is already being validated")
+            return
+
+        valid = Transaction.from_dict(self.transaction).validate()
 
         # simulate that node 81 can't validate the transaction
         if self.node.port == 81:
             valid = False
 
         if valid:
-            msg_out = Vote(True)
+            msg_out = Vote(True, self.tx_id)
             log.debug("vote transaction valid")
         else:
-            msg_out = Vote(False)
+            msg_out = Vote(False, self.tx_id)
             log.debug("vote transaction not valid")
 
         self.node.send_to_node(sender_node_conn, msg_out.to_dict())
 
+    def add_to_mempool(self):
+        transaction = Transaction.from_dict(self.transaction)
+        if self.node.mempool.add(transaction):
+            log.debug("transaction validated and added to mempool")
+
     # coordinator
     def vote_received(self, sender_node_conn, message):
         msg_in = Vote.from_dict(message)
 
-        self.votes[sender_node_conn.port] = msg_in.get_valid()
-
-        # if all peers have voted
-        all_peers_voted = "not_voted" not in self.votes.values()
-        # if len(self.votes) == len(self.node.all_nodes):
-        if all_peers_voted:
-            if all(self.votes.values()):
-                # add transaction to mempool
-                msg_out = Global_decision(True)
-                log.debug("transaction validated and added to mempool")
-            else:
-                msg_out = Global_decision(False)
-                log.error("transaction not valid")
+        # votes of several connection threads can arrive at the same time
+        with self.node.conversations_lock:
+            if sender_node_conn.port not in self.votes:
+                log.warning(f"vote from unexpected peer {sender_node_conn.port}")
+                return
+            self.votes[sender_node_conn.port] = msg_in.get_valid()
+
+            # if all peers have voted
+            all_peers_voted = "not_voted" not in self.votes.values()
+            if not all_peers_voted:
+                return
+        # only the thread of the last vote sends the decision, unless the round timed out
+        if not self.remove():
+            return
+
+        if all(self.votes.values()):
+            msg_out = Global_decision(True, self.tx_id)
+            self.add_to_mempool()
+        else:
+            msg_out = Global_decision(False, self.tx_id)
+            log.error("transaction not valid")
 
-            self.node.send_to_nodes(msg_out.to_dict())
-            self.votes.clear()
-            self.node.conversations.pop("transaction_validation")
+        self.node.send_to_nodes(msg_out.to_dict())
 
     # participants
     def global_decision_received(self, message):
         msg = Global_decision.from_dict(message)
 
         if msg.get_valid():
-            # add transaction to mempool
-            log.debug("transaction validated and added to mempool")
+            self.add_to_mempool()
         else:
             log.error("transaction not valid")
 
-        self.node.conversations.pop("transaction_validation")
+        self.remove()
@@ -1,13 +1,24 @@
 import time
 import json
 import socket
+import threading
 import logging
 from p2pnetwork.node import Node
+from blockchain.block_cache import block_cache
+from blockchain.difficulty import DEFAULT_DIFFICULTY
+from blockchain.mempool import Mempool
+from blockchain.mining_job import MiningJob
+from blockchain.mining_pool import MiningPool
+from blockchain.signature_verifier import SignatureVerifier
+from .bo.codec import VERSION as CODEC_VERSION
 from .bo.messages.prepare_to_validate import Prepare_to_validate
+from .bo.messages.prepare_to_validate_batch import Prepare_to_validate_batch
+from .conversations.batch_validation import Batch_Validation, Validation_Batcher
 from .conversations.block_download import Block_download
 from .conversations.transaction_validation import Transaction_Validation
 from .conversations.initial_peer_discovery import Initial_Peer_Discovery
 from .conversations.block_broadcasting import Block_broadcasting
+from .node_connection import P2PNodeConnection
 
 log = logging.getLogger()
 
@@ -19,15 +30,52 @@ class P2PNode(Node):
             host, port, id, callback, max_connections)
         self.genesis_port = 80
         self.potential_peers = [self.genesis_port]
-        self.conversations = {}
+        # transaction validations by the hash of their transaction, batch validations by the
+        # batch id
+        self.conversations = {"transaction_validation": {}, "batch_validation": {}}
+        self.conversations_lock = threading.RLock()
+        self.last_cleanup = time.monotonic()
         self.debug = False
         self.currently_mined_block = None
+        # proof of work target for mined blocks and for the validation of received blocks
+        self.difficulty = DEFAULT_DIFFICULTY
+        # start the mining processes once, they are reused for every block
+        self.mining_pool = MiningPool()
+        self.mining_pool.start()
+        # processes that verify the transaction signatures of received blocks
+        self.signature_verifier = SignatureVerifier()
+        self.signature_verifier.start()
+        # mining jobs that are not done yet, they are mined one after another
+        self.mining_jobs = []
+        # validated transactions for the next blocks
+        self.mempool = Mempool()
+        # transactions are validated by the peers in batches
+        self.validation_batcher = Validation_Batcher(self)
+        # version of the binary message encoding, None to only send JSON messages
+        self.codec_version = CODEC_VERSION
 
         log.info("MyPeer2PeerNode: Started")
 
     def set_currently_mined_block(self, block):
         self.currently_mined_block = block
 
+    def create_mining_job(self, transactions) -> MiningJob:
+        previous_job = self.mining_jobs[-1] if self.mining_jobs else None
+        job = MiningJob(transactions, self, previous_job)
+        self.mining_jobs.append(job)
+        job.add_done_callback(self.mining_jobs.remove)
+        return job
+
+    def validate_transaction(self, transaction):
+        '''
+        Let the peers validate the transaction, it is added to the mempool if it is valid. The
+        transaction is sent with the next batch of the validation batcher.
+        '''
+        self.validation_batcher.add(transaction)
+
+    def create_new_connection(self, connection, id, host, port, codec=None):
+        return P2PNodeConnection(self, connection, id, host, port, codec)
+
     def outbound_node_connected(self, node):
         log.info("outbound_node_connected (" + self.id + "): " + node.id)
 
@@ -72,27 +120,42 @@ class P2PNode(Node):
 
         if message['name'] == 'block':
             block_broadcasting = Block_broadcasting(self)
-            # FIXME if the local node finds a valid block while the mining process is being
-            # terminated, there could be two valid blocks on the local node
+            # a mining job checks the latest block again before it finishes, so a block found
+            # while the job is being restarted is mined again on top of the received block
             if block_broadcasting.block_received(sender_node_conn, message):
-                if self.currently_mined_block:
-                    log.info("Valid block from network reveived, stopping mining process")
-                    self.currently_mined_block.stop_mining()
+                for job in list(self.mining_jobs):
+                    # only restarts the running job, the others use the new block anyway
+                    job.restart()
 
         if message["name"] == 'prepare-to-validate':
             msg_in = Prepare_to_validate.from_dict(message)
 
             validation = Transaction_Validation(self, msg_in.get_transaction())
-            self.conversations["transaction_validation"] = validation
             validation.prepare_to_validate_received(sender_node_conn)
 
-        if message['name'] == 'vote':
-            validation = self.conversations["transaction_validation"]
-            validation.vote_received(sender_node_conn, message)
+        if message['name'] in ('vote', 'global-decision'):
+            validation = Transaction_Validation.get(self, message.get('tx_id'))
+            if validation is None:
+                log.warning(f"{message['name']} for unknown transaction {message.get('tx_id')}")
+            elif message['name'] == 'vote':
+                validation.vote_received(sender_node_conn, message)
+            else:
+                validation.global_decision_received(message)
+
+        if message["name"] == 'prepare-to-validate-batch':
+            msg_in = Prepare_to_validate_batch.from_dict(message)
 
-        if message['name'] == 'global-decision':
-            validation = self.conversations["transaction_validation"]
-            validation.global_decision_received(message)
+            validation = Batch_Validation(self, msg_in.get_batch_id(), msg_in.get_transactions())
+            validation.prepare_to_validate_received(sender_node_conn)
+
+        if message['name'] in ('vote-batch', 'global-decision-batch'):
+            validation = Batch_Validation.get(self, message.get('batch_id'))
+            if validation is None:
+                log.warning(f"{message['name']} for unknown batch {message.get('batch_id')}")
+            elif message['name'] == 'vote-batch':
+                validation.vote_received(sender_node_conn, message)
+            else:
+                validation.global_decision_received(message)
 
     def node_disconnect_with_outbound_node(self, node):
         log.debug("node wants to disconnect with oher outbound node: "
@@ -136,6 +199,9 @@ class P2PNode(Node):
 
             # Basic information exchange (not secure) of the nodes!
             data = {'id': self.id, 'port': self.port}
+            if self.codec_version is not None:
+                # the peer sends binary messages if it supports them
+                data['codec'] = self.codec_version
             msg = json.dumps(data)
             # Send my id and port to the connected node
             sock.send(msg.encode('utf-8'))
@@ -190,7 +256,8 @@ class P2PNode(Node):
 
                 thread_client = self.create_new_connection(connection, connected_node["id"],
                                                            client_address[0],
-                                                           connected_node["port"])
+                                                           connected_node["port"],
+                                                           connected_node.get("codec"))
                 thread_client.start()
 
                 self.nodes_inbound.append(thread_client)
@@ -204,9 +271,18 @@ class P2PNode(Node):
 
             self.reconnect_nodes()
 
+            # abort validations that didn't finish in time, at most once per second
+            if time.monotonic() - self.last_cleanup > 1:
+                Transaction_Validation.remove_expired(self)
+                Batch_Validation.remove_expired(self)
+                self.last_cleanup = time.monotonic()
+
             time.sleep(0.01)
 
         log.info("Node stopping...")
+        self.validation_batcher.stop()
+        for job in list(self.mining_jobs):
+            job.cancel()
         for t in self.nodes_inbound:
             t.stop()
 
@@ -221,6 +297,12 @@ class P2PNode(Node):
         for t in self.nodes_outbound:
             t.join()
 
+        self.mining_pool.shutdown()
+        self.signature_verifier.shutdown()
+        log.info(f"Signature cache statistics: {self.signature_verifier.cache.get_stats()}")
+        log.info(f"Block cache statistics: {block_cache.get_stats()}")
+        log.info(f"Mining statistics: {self.mining_pool.get_stats()}")
+
         self.sock.settimeout(None)
         self.sock.close()
         log.info("Node stopped")
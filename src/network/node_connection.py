@@ -0,0 +1,81 @@
+import json
+import logging
+from p2pnetwork.nodeconnection import NodeConnection
+from network.bo.codec import (CodecError, MIN_VERSION, VERSION, decode_message, encode_message,
+                              is_binary)
+from network.bo.stored_block import Stored_block
+
+log = logging.getLogger()
+
+# p2pnetwork ends every message with EOT, so it is escaped in binary messages
+ESCAPE = b"\x1b"
+EOT = b"\x04"
+
+
+def escape(data: bytes) -> bytes:
+    return data.replace(ESCAPE, ESCAPE + b"\x01").replace(EOT, ESCAPE + b"\x02")
+
+
+def unescape(data: bytes) -> bytes:
+    return data.replace(ESCAPE + b"\x02", EOT).replace(ESCAPE + b"\x01", ESCAPE)
+
+
+def to_json(value):
+    ''' json.dumps default for the values that are only encoded by network.bo.codec '''
+    if isinstance(value, Stored_block):
+        return value.to_dict()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class P2PNodeConnection(NodeConnection):
+    '''
+    Sends messages in the binary encoding of network.bo.codec if the peer supports it, and JSON
+    otherwise. A peer supports it if it sent the codec version when it connected to this node,
+    or if it sent a binary message. Nodes only send binary messages to peers that support them,
+    so the outbound side of a connection knows it after the first message (e.g.
+    connection-accepted). Messages are encoded in the highest version both nodes support.
+    '''
+
+    def __init__(self, main_node, sock, id, host, port, codec=None):
+        super(P2PNodeConnection, self).__init__(main_node, sock, id, host, port)
+        # codec version of the peer, None if it only understands JSON
+        self.codec = codec
+
+    def use_binary(self) -> bool:
+        return self.main_node.codec_version is not None and self.codec is not None \
+            and self.codec >= MIN_VERSION
+
+    def send(self, data, encoding_type='utf-8', compression='none'):
+        if isinstance(data, dict) and compression == 'none' and self.use_binary():
+            try:
+                packet = encode_message(data, min(self.codec, VERSION))
+            except CodecError as e:
+                log.debug(f"sending {data.get('name')} as JSON: {e}")
+            else:
+                try:
+                    self.sock.sendall(escape(packet) + self.EOT_CHAR)
+                except Exception as e:
+                    # like NodeConnection.send, close the connection if sending failed
+                    self.main_node.debug_print(f"nodeconnection send: Error sending data: {e}")
+                    self.stop()
+                return
+        if isinstance(data, dict):
+            try:
+                data = json.dumps(data, default=to_json)
+            except TypeError:
+                # NodeConnection.send logs that the dict is invalid
+                pass
+        super(P2PNodeConnection, self).send(data, encoding_type, compression)
+
+    def parse_packet(self, packet):
+        if is_binary(packet):
+            data = unescape(packet)
+            try:
+                message = decode_message(data)
+            except CodecError as e:
+                log.error(f"received an invalid binary message from {self.id}: {e}")
+                return {"name": "invalid"}
+            # the peer can decode binary messages of this version
+            self.codec = max(self.codec or 0, data[1])
+            return message
+        return super(P2PNodeConnection, self).parse_packet(packet)
@@ -0,0 +1,82 @@
+'''
+Compares the size and the decoding time of blocks and network messages in JSON and in the
+binary encoding
+
+run with 'python -m tests.benchmark_codec' in the src/ directory, options:
+    --transactions 100      transactions per block
+    --blocks 100            blocks in the blocks message
+'''
+
+import argparse
+import json
+import logging
+import time
+from datetime import datetime
+from hashlib import sha256
+from ecdsa import SigningKey, SECP256k1
+
+# local imports
+from blockchain.block import Block, Transaction
+from db.codec import decode_block, encode_block
+from network.bo.codec import decode_message, encode_message
+from network.bo.messages.blocks import Blocks
+
+logging.disable(logging.CRITICAL)
+
+
+def create_block(transaction_count) -> Block:
+    private_key = SigningKey.generate(curve=SECP256k1, hashfunc=sha256)
+    transactions = []
+    for i in range(transaction_count):
+        tx = Transaction("bob", "alice", float(i), datetime(2022, 1, 1, 0, 0, i % 60))
+        tx.set_pubkey(private_key.get_verifying_key())
+        tx.set_signature(private_key.sign(tx.hash().encode("utf-8")))
+        transactions.append(tx)
+    block = Block("00" * 32, transactions, nonce=12345)
+    block.set_saved_hash(block.hash())
+    return block
+
+
+def decode_and_check(block_bytes) -> Block:
+    ''' Decode a stored block and parse the timestamps like Transaction.validate '''
+    block = Block.from_bytes(block_bytes, None)
+    for transaction in block.transactions:
+        transaction.timestamp
+    return block
+
+
+def measure(decode, data, repeat) -> float:
+    ''' Milliseconds per decoding '''
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decode(data)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=100)
+    parser.add_argument('--blocks', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    block = create_block(args.transactions)
+    message = Blocks([block] * args.blocks).to_dict()
+    json_block = block.serialize()
+    binary_block = encode_block(block.to_dict())
+    cases = [
+        ("stored block", json_block, json.loads, binary_block, decode_block, 100),
+        ("to Block", json_block, lambda data: Block.from_bytes(data, None), binary_block,
+         lambda data: Block.from_bytes(data, None), 100),
+        ("to Block+check", json_block, decode_and_check, binary_block, decode_and_check, 20),
+        ("blocks message", json.dumps(message).encode("utf-8"), json.loads,
+         encode_message(message), decode_message, 3),
+    ]
+    print(f"{'':16}{'JSON bytes':>12}{'binary bytes':>14}{'JSON ms':>10}{'binary ms':>11}")
+    for name, json_data, json_decode, binary_data, binary_decode, repeat in cases:
+        print(f"{name:16}{len(json_data):12}{len(binary_data):14}"
+              f"{measure(json_decode, json_data, repeat):10.2f}"
+              f"{measure(binary_decode, binary_data, repeat):11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+'''
+Measures how many blocks per second are saved as the new latest blocks, one by one and in
+batches with Mapper.commit_blocks like Block_download.receive_blocks
+
+run with 'python -m tests.benchmark_commit' in the src/ directory, options:
+    --blocks 1000           blocks to save
+    --transactions 10       transactions per block
+'''
+
+import argparse
+import logging
+import tempfile
+import time
+
+# local imports
+from db.mapper import Mapper
+from tests.benchmark_codec import create_block
+from tests.temp_mapper import temp_mapper
+
+logging.disable(logging.CRITICAL)
+
+
+def create_chain(block_count, transaction_count) -> list:
+    ''' (hash, JSON serialization) of block_count blocks after the genesis block '''
+    template = create_block(transaction_count)
+    blocks = []
+    predecessor = None
+    for nonce in range(block_count + 1):
+        template.predecessor = predecessor
+        template.nonce = nonce
+        predecessor = template.hash()
+        blocks.append((predecessor, template.serialize()))
+    return blocks
+
+
+def one_by_one(blocks):
+    ''' Like receive_blocks before commit_blocks: save every block and replace the tip '''
+    for block_hash, block in blocks:
+        Mapper.write_block(block_hash, block)
+        Mapper.write_latest_block_hash(block_hash)
+
+
+def commit_each(blocks):
+    for block_hash, block in blocks:
+        Mapper.commit_blocks([(block_hash, block)], block_hash)
+
+
+def commit_batch(blocks):
+    Mapper.commit_blocks(blocks, blocks[-1][0])
+
+
+def measure(save, genesis, blocks) -> float:
+    ''' Blocks per second, in a new temporary db directory '''
+    with tempfile.TemporaryDirectory() as db_dir, temp_mapper(db_dir):
+        Mapper.commit_blocks([genesis], genesis[0])
+        start = time.perf_counter()
+        save(blocks)
+        elapsed = time.perf_counter() - start
+    return len(blocks) / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--blocks', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    genesis, *blocks = create_chain(args.blocks, args.transactions)
+    cases = [
+        ("one by one, no fsync", one_by_one),
+        ("commit_blocks per block", commit_each),
+        ("commit_blocks batch", commit_batch),
+    ]
+    print(f"{'':26}{'blocks/s':>10}")
+    for name, save in cases:
+        print(f"{name:26}{measure(save, genesis, blocks):10.0f}")
+
+
+if __name__ == "__main__":
+    main()
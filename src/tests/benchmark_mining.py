@@ -0,0 +1,251 @@
+'''
+Benchmark suite for the mining methods, the merkle tree and validate_nonce
+
+Every mining method is run for combinations of difficulty, number of transactions per block
+and number of worker processes. The results are written as JSON and compared with a baseline
+file, so a regression in the hash rate shows up right away.
+
+run with 'python -m tests.benchmark_mining' in the src/ directory, options:
+    --quick                 only a small grid, e.g. for a quick check before committing
+    --output FILE           where to write the results (default: benchmark_results.json)
+    --baseline FILE         baseline to compare with (default: tests/benchmark_baseline.json)
+    --update-baseline       write the results to the baseline file instead of comparing
+    --tolerance 0.25        allowed relative decrease of the hash rate against the baseline
+
+The exit code is 1 if a configuration is slower than the baseline allows.
+'''
+
+import argparse
+import json
+import logging
+import math
+import multiprocessing as mp
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# local imports
+from blockchain.block import Block, Transaction
+from blockchain.merkle_tree import MerkleTree
+from blockchain.mining_pool import MiningPool
+from tests.temp_mapper import temp_mapper
+
+logging.disable(logging.CRITICAL)
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             "benchmark_baseline.json")
+
+FULL_GRID = {
+    "methods": ["bruteforce", "nonce-skip", "multithreading", "vectorized"],
+    "difficulties": [2, 3, 4],
+    "transactions": [1, 16, 256],
+    "workers": sorted({1, mp.cpu_count()}),
+    "blocks": 10,
+}
+
+QUICK_GRID = {
+    "methods": ["bruteforce", "nonce-skip", "multithreading", "vectorized"],
+    "difficulties": [3],
+    "transactions": [1, 16],
+    "workers": [1],
+    "blocks": 10,
+}
+
+# methods that mine with a pool of worker processes
+POOL_METHODS = ["multithreading", "vectorized"]
+
+
+def create_block(block_no, transaction_count) -> Block:
+    ''' Deterministic block, so the iterations are the same in every run '''
+    transactions = [Transaction('bob', 'alice', float(block_no * 1000 + i),
+                                datetime(2022, 1, 1, 0, 0, 0))
+                    for i in range(transaction_count)]
+    return Block(transactions=transactions)
+
+
+def percentile(values, percent):
+    ''' Nearest-rank percentile '''
+    values = sorted(values)
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+@contextmanager
+def empty_nonce_history():
+    '''
+    nonce-skip reads and writes the nonce history, so every run gets an empty temporary db
+    directory. That way the results don't depend on the order of the runs.
+    '''
+    with tempfile.TemporaryDirectory() as db_dir, temp_mapper(db_dir):
+        yield
+
+
+def run_mining(method, difficulty, transaction_count, workers, blocks) -> dict:
+    pool = None
+    if method in POOL_METHODS:
+        pool = MiningPool(processes=workers)
+        pool.start()
+
+    times = []
+    iterations = []
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        for block_no in range(blocks):
+            block = create_block(block_no, transaction_count)
+            start = time.perf_counter()
+            if method == "vectorized" and workers == 1:
+                block.find_nonce(difficulty, method)
+            else:
+                block.find_nonce(difficulty, method, pool)
+            times.append(time.perf_counter() - start)
+            iterations.append(block.get_iterations())
+    finally:
+        if pool:
+            pool.shutdown()
+    wall_time = time.perf_counter() - wall_start
+
+    return {
+        "method": method,
+        "difficulty": difficulty,
+        "transactions": transaction_count,
+        "workers": workers,
+        "blocks": blocks,
+        "hashes_per_second": sum(iterations) / wall_time,
+        "iterations_per_block": statistics.mean(iterations),
+        "wall_time": wall_time,
+        # only the CPU time of this process, the pool processes are not included
+        "cpu_time": time.process_time() - cpu_start,
+        "time_to_nonce_p50": percentile(times, 50),
+        "time_to_nonce_p99": percentile(times, 99),
+    }
+
+
+# minimum run time of the merkle tree and validate_nonce benchmarks in seconds
+MIN_DURATION = 0.5
+
+
+def run_merkle_tree(leaves) -> dict:
+    values = [json.dumps({"amount": float(i)}) for i in range(leaves)]
+    repetitions = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < MIN_DURATION:
+        MerkleTree(values).getRootHash()
+        repetitions += 1
+    wall_time = time.perf_counter() - start
+    return {
+        "method": "merkle-tree",
+        "transactions": leaves,
+        "trees_per_second": repetitions / wall_time,
+        "hashes_per_second": repetitions * (2 * leaves - 1) / wall_time,
+        "wall_time": wall_time,
+    }
+
+
+def run_validate_nonce(transaction_count) -> dict:
+    block = create_block(0, transaction_count)
+    transactions = [json.dumps(t.to_dict()) for t in block.transactions]
+    repetitions = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < MIN_DURATION:
+        block.validate_nonce(transactions, repetitions)
+        repetitions += 1
+    wall_time = time.perf_counter() - start
+    return {
+        "method": "validate-nonce",
+        "transactions": transaction_count,
+        "hashes_per_second": repetitions / wall_time,
+        "wall_time": wall_time,
+    }
+
+
+def result_key(result) -> str:
+    keys = ["method", "difficulty", "transactions", "workers", "blocks"]
+    return "/".join(f"{key}={result[key]}" for key in keys if key in result)
+
+
+def run_benchmarks(grid) -> list:
+    results = []
+    for transaction_count in grid["transactions"]:
+        results.append(run_merkle_tree(transaction_count + 1))
+        results.append(run_validate_nonce(transaction_count))
+
+    for method in grid["methods"]:
+        for difficulty in grid["difficulties"]:
+            for transaction_count in grid["transactions"]:
+                workers_list = grid["workers"] if method in POOL_METHODS else [1]
+                for workers in workers_list:
+                    with empty_nonce_history():
+                        result = run_mining(method, difficulty, transaction_count, workers,
+                                            grid["blocks"])
+                    print(f"{result_key(result):70} {result['hashes_per_second']:12.0f} H/s "
+                          f"p50 {result['time_to_nonce_p50']:.3f}s "
+                          f"p99 {result['time_to_nonce_p99']:.3f}s")
+                    results.append(result)
+    return results
+
+
+def compare(results, baseline, tolerance) -> list:
+    ''' Returns the keys of all results with a lower hash rate than the baseline allows '''
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        key = result_key(result)
+        if key not in baseline_results:
+            continue
+        expected = baseline_results[key]["hashes_per_second"]
+        change = result["hashes_per_second"] / expected - 1
+        result["baseline_change"] = change
+        if change < -tolerance:
+            regressions.append(key)
+            print(f"REGRESSION {key}: {result['hashes_per_second']:.0f} H/s, "
+                  f"baseline {expected:.0f} H/s ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the mining methods")
+    parser.add_argument('--quick', action='store_true', help='only run a small grid')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='file for the JSON results')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline JSON file')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative decrease of the hash rate')
+    args = parser.parse_args(argv)
+
+    grid = QUICK_GRID if args.quick else FULL_GRID
+    results = run_benchmarks(grid)
+
+    report = {
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": mp.cpu_count(),
+        "grid": grid,
+        "results": results,
+    }
+
+    regressions = []
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        report["regressions"] = regressions
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
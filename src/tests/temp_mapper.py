@@ -0,0 +1,59 @@
+'''
+The Mapper in an empty temporary db directory instead of src/db, for tests and benchmarks
+'''
+
+import tempfile
+from contextlib import ExitStack, contextmanager
+from unittest import TestCase
+from unittest.mock import patch
+
+# local imports
+from db.mapper import Mapper
+
+
+@contextmanager
+def temp_mapper(db_dir, **attributes):
+    '''
+    Use db_dir for all files of the Mapper and forget the opened stores and loaded indexes.
+    attributes are other Mapper attributes for the duration, e.g. storage_backend="sqlite".
+    The stores opened in the meantime are closed at the end.
+    '''
+    values = {
+        "db_dir": db_dir,
+        "blockchain_dir": db_dir + "/blocks",
+        "latest_block_hash_file": db_dir + "/latest_block_hash",
+        "nonce_index_file": db_dir + "/nonce_index",
+        "nonce_clusters_file": db_dir + "/nonce_clusters",
+        "balance_index_file": db_dir + "/balance_index",
+        "store_dir": db_dir + "/store",
+        "nonce_index": None,
+        "balance_index": None,
+        "block_store": None,
+        "chain_index": None,
+        "snapshot_height": None,
+    }
+    values.update(attributes)
+    with ExitStack() as stack:
+        for name, value in values.items():
+            stack.enter_context(patch.object(Mapper, name, value))
+        try:
+            yield
+        finally:
+            if Mapper.chain_index is not None:
+                Mapper.chain_index.close()
+            if Mapper.block_store is not None:
+                Mapper.block_store.close()
+
+
+class TempMapperTestCase(TestCase):
+    ''' Every test uses the Mapper in its own temporary db directory, self.db_dir '''
+    # other Mapper attributes of the tests, see temp_mapper
+    mapper_attributes = {}
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.db_dir = tmp_dir.name
+        stack = ExitStack()
+        self.addCleanup(stack.close)
+        stack.enter_context(temp_mapper(self.db_dir, **self.mapper_attributes))
@@ -0,0 +1,132 @@
+'''
+Tests for the balance index of the Mapper
+
+run with 'python -m unittest tests.test_balance_index' in the src/ directory
+'''
+
+import hashlib
+import json
+import logging
+import os
+from unittest.mock import patch
+
+# local imports
+from db.block_store import BlockStore
+from db.mapper import Mapper
+from tests.temp_mapper import TempMapperTestCase
+
+logging.disable(logging.CRITICAL)
+
+
+class TestBalanceIndex(TempMapperTestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.mkdir(self.db_dir + "/blocks")
+        self.genesis_hash = self.add_block(None, [])
+
+    def add_block(self, predecessor, transfers) -> str:
+        ''' Save a block with (source, target, amount) transfers as the new latest block '''
+        block = {
+            "predecessor": predecessor,
+            "transactions": [{"source": source, "target": target, "amount": amount}
+                             for source, target, amount in transfers],
+            "nonce": 0,
+        }
+        block_bytes = json.dumps(block, sort_keys=True).encode("utf-8")
+        block_hash = hashlib.sha256(block_bytes).hexdigest()
+        Mapper.write_block(block_hash, block_bytes)
+        Mapper.write_latest_block_hash(block_hash)
+        return block_hash
+
+    def test_balances_follow_the_latest_block(self):
+        block_hash = self.add_block(self.genesis_hash, [("bob", "alice", 10)])
+        self.add_block(block_hash, [("alice", "carol", 3), ("bob", "carol", 1)])
+        self.assertEqual(Mapper.read_balance("alice"), 7)
+        self.assertEqual(Mapper.read_balance("bob"), -11)
+        self.assertEqual(Mapper.read_balance("carol"), 4)
+        self.assertEqual(Mapper.read_balance("dave"), 0)
+
+    def test_index_is_updated_incrementally(self):
+        block_hash = self.add_block(self.genesis_hash, [("bob", "alice", 10)])
+        with patch.object(Mapper, "rebuild_balance_index") as rebuild:
+            self.add_block(block_hash, [("alice", "bob", 4)])
+            self.assertEqual(Mapper.read_balance("alice"), 6)
+        rebuild.assert_not_called()
+
+    def test_commit_several_blocks(self):
+        blocks = []
+        predecessor = self.genesis_hash
+        for amount in (1, 2, 3):
+            block_bytes = json.dumps({"predecessor": predecessor, "nonce": 0, "transactions": [
+                {"source": "bob", "target": "alice", "amount": amount}]}).encode("utf-8")
+            predecessor = hashlib.sha256(block_bytes).hexdigest()
+            blocks.append((predecessor, block_bytes))
+        with patch.object(Mapper, "rebuild_balance_index") as rebuild, \
+                patch("os.fsync", wraps=os.fsync) as fsync:
+            Mapper.commit_blocks(blocks, predecessor)
+        rebuild.assert_not_called()
+        # blocks, latest block hash and its directory
+        self.assertEqual(fsync.call_count, 3 if os.name == "posix" else 2)
+        self.assertEqual(Mapper.read_latest_block_hash(), predecessor)
+        self.assertEqual(Mapper.get_block_height(predecessor), 3)
+        self.assertEqual(Mapper.read_balance("alice"), 6)
+        self.assertFalse(os.path.exists(Mapper.latest_block_hash_file + ".tmp"))
+
+    def test_replace_the_chain(self):
+        old_chain = [self.add_block(self.genesis_hash, [("bob", "alice", 10)])]
+        old_chain.append(self.add_block(old_chain[0], [("alice", "carol", 3)]))
+        block_bytes = json.dumps({"predecessor": self.genesis_hash, "nonce": 1, "transactions": [
+            {"source": "bob", "target": "dave", "amount": 5}]}).encode("utf-8")
+        new_block = (hashlib.sha256(block_bytes).hexdigest(), block_bytes)
+
+        # crash before the blocks were saved
+        with patch.object(BlockStore, "put_many", side_effect=OSError("crash")):
+            with self.assertRaises(OSError):
+                Mapper.commit_blocks([new_block], new_block[0], delete=old_chain)
+        with open(Mapper.latest_block_hash_file) as file:
+            self.assertEqual(file.read(), self.genesis_hash)
+
+        Mapper.commit_blocks([new_block], new_block[0], delete=old_chain)
+        self.assertEqual(Mapper.list_block_hashes(), [self.genesis_hash, new_block[0]])
+        self.assertEqual(Mapper.get_chain_hashes(), [self.genesis_hash, new_block[0]])
+        self.assertEqual(Mapper.read_balance("dave"), 5)
+        self.assertEqual(Mapper.read_balance("alice"), 0)
+
+    def test_missing_index_is_rebuilt(self):
+        self.add_block(self.genesis_hash, [("bob", "alice", 10)])
+        os.remove(Mapper.balance_index_file)
+        Mapper.balance_index = None
+        self.assertEqual(Mapper.read_balance("alice"), 10)
+        self.assertTrue(os.path.exists(Mapper.balance_index_file))
+
+    def test_corrupt_index_is_rebuilt(self):
+        self.add_block(self.genesis_hash, [("bob", "alice", 10)])
+        with open(Mapper.balance_index_file, "w") as file:
+            file.write('{"tip": ')
+        Mapper.balance_index = None
+        self.assertEqual(Mapper.read_balance("alice"), 10)
+
+    def test_index_of_another_block_is_rebuilt(self):
+        block_hash = self.add_block(self.genesis_hash, [("bob", "alice", 10)])
+        Mapper.write_balance_index({"tip": self.genesis_hash, "balances": {}})
+        with open(Mapper.latest_block_hash_file, "w") as file:
+            file.write(block_hash)
+        self.assertEqual(Mapper.read_balance("alice"), 10)
+
+    def test_roll_back(self):
+        block_hash = self.add_block(self.genesis_hash, [("bob", "alice", 10)])
+        self.add_block(block_hash, [("alice", "carol", 3)])
+        Mapper.roll_back_balance_index(block_hash)
+        self.assertEqual(Mapper.balance_index["tip"], block_hash)
+        self.assertEqual(Mapper.balance_index["balances"].get("carol"), 0)
+        self.assertEqual(Mapper.balance_index["balances"]["alice"], 10)
+
+    def test_replace_chain(self):
+        block_hash = self.add_block(self.genesis_hash, [("bob", "alice", 10)])
+        Mapper.roll_back_balance_index(self.genesis_hash)
+        Mapper.delete_block(block_hash)
+        self.add_block(self.genesis_hash, [("bob", "carol", 5)])
+        self.assertEqual(Mapper.read_balance("alice"), 0)
+        self.assertEqual(Mapper.read_balance("carol"), 5)
+        self.assertEqual(Mapper.read_balance("bob"), -5)
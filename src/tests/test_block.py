@@ -0,0 +1,97 @@
+'''
+Tests for the lazy decoding and the cached hashes of transactions and blocks
+
+run with 'python -m unittest tests.test_block' in the src/ directory
+'''
+
+import json
+import logging
+from datetime import datetime
+from hashlib import sha256
+from unittest import TestCase
+from unittest.mock import patch
+from ecdsa import SigningKey, SECP256k1
+
+# local imports
+from blockchain.block import Block, Transaction
+
+logging.disable(logging.CRITICAL)
+
+
+def create_block(count) -> Block:
+    private_key = SigningKey.generate(curve=SECP256k1, hashfunc=sha256)
+    block = Block(pred="0" * 64, nonce=42)
+    for i in range(count):
+        tx = Transaction('bob', 'alice', float(i), datetime(2022, 1, 1, 0, 0, 0))
+        tx.set_pubkey(private_key.get_verifying_key())
+        tx.set_signature(private_key.sign(tx.hash().encode("utf-8")))
+        block.add_transaction(tx)
+    return block
+
+
+class TestTransaction(TestCase):
+
+    def setUp(self):
+        self.tx_dict = create_block(1).transactions[0].to_full_dict()
+
+    def test_fields_are_decoded_lazily(self):
+        tx = Transaction.from_dict(self.tx_dict)
+        self.assertIsNone(tx._timestamp)
+        self.assertIsNone(tx._pubkey)
+        self.assertEqual(tx.to_full_dict(), self.tx_dict)
+        self.assertIsNone(tx._timestamp)
+        self.assertEqual(tx.timestamp, datetime(2022, 1, 1, 0, 0, 0))
+        self.assertEqual(tx.pubkey.to_string().hex(), self.tx_dict["pubkey"])
+        self.assertTrue(tx.verify_signature())
+
+    def test_non_canonical_timestamp(self):
+        self.tx_dict["timestamp"] = "1/1/2022, 0:00:00"
+        tx = Transaction.from_dict(self.tx_dict)
+        self.assertEqual(tx.to_dict()["timestamp"], "01/01/2022, 00:00:00")
+
+    def test_invalid_timestamp(self):
+        self.tx_dict["timestamp"] = "13/45/2022, 00:00:00"
+        self.assertFalse(Transaction.from_dict(self.tx_dict).validate())
+
+    def test_hash_is_cached_until_a_field_changes(self):
+        tx = Transaction.from_dict(self.tx_dict)
+        tx_hash = tx.hash()
+        with patch("json.dumps") as dumps:
+            self.assertEqual(tx.hash(), tx_hash)
+        dumps.assert_not_called()
+        tx.amount = 99.0
+        self.assertNotEqual(tx.hash(), tx_hash)
+        self.assertEqual(json.loads(tx.serialize())["amount"], 99.0)
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            Transaction().unknown = 1
+
+
+class TestBlock(TestCase):
+
+    def test_hash_is_cached(self):
+        block = create_block(3)
+        block_hash = block.hash()
+        with patch("blockchain.block.MerkleTree") as tree:
+            self.assertEqual(block.hash(), block_hash)
+            self.assertEqual(block.to_dict_with_hash()["hash"], block_hash)
+        tree.assert_not_called()
+
+    def test_hash_changes_with_the_transactions(self):
+        block = create_block(3)
+        block_hash = block.hash()
+        serialized = block.serialize()
+        block.transactions[1].amount = 99.0
+        self.assertNotEqual(block.hash(), block_hash)
+        self.assertNotEqual(block.serialize(), serialized)
+        block.transactions[1].amount = 1.0
+        self.assertEqual(block.hash(), block_hash)
+        block.set_nonce(43)
+        self.assertNotEqual(block.hash(), block_hash)
+
+    def test_from_dict(self):
+        block = create_block(3)
+        received = Block.from_dict(json.loads(block.serialize()), block.hash())
+        self.assertEqual(received.hash(), block.hash())
+        self.assertEqual(received.serialize(), block.serialize())
@@ -0,0 +1,75 @@
+'''
+Tests for the cache of decoded blocks
+
+run with 'python -m unittest tests.test_block_cache' in the src/ directory
+'''
+
+import hashlib
+import json
+import logging
+from unittest.mock import patch
+
+# local imports
+from blockchain.block_cache import BlockCache
+from db.mapper import Mapper
+from tests.temp_mapper import TempMapperTestCase
+
+logging.disable(logging.CRITICAL)
+
+
+class TestBlockCache(TempMapperTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.hashes = []
+        for nonce in range(5):
+            block_bytes = json.dumps({"predecessor": None, "transactions": [],
+                                      "nonce": nonce}).encode("utf-8")
+            block_hash = hashlib.sha256(block_bytes).hexdigest()
+            Mapper.write_block(block_hash, block_bytes)
+            self.block_size = len(Mapper.read_block_bytes(block_hash))
+            self.hashes.append(block_hash)
+
+    def test_read_through(self):
+        cache = BlockCache()
+        block = cache.get(self.hashes[2])
+        self.assertEqual((block.nonce, block.saved_hash), (2, self.hashes[2]))
+        with patch.object(Mapper, "read_block_bytes") as read_block_bytes:
+            self.assertIs(cache.get(self.hashes[2]), block)
+        read_block_bytes.assert_not_called()
+        self.assertIsNone(cache.get("0" * 64))
+        stats = cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_decode_the_given_bytes(self):
+        cache = BlockCache()
+        block_bytes = Mapper.read_block_bytes(self.hashes[1])
+        with patch.object(Mapper, "read_block_bytes") as read_block_bytes:
+            block = cache.get(self.hashes[1], memoryview(block_bytes))
+        read_block_bytes.assert_not_called()
+        self.assertEqual(block.nonce, 1)
+        self.assertIs(cache.get(self.hashes[1]), block)
+
+    def test_evict_least_recently_used(self):
+        cache = BlockCache(max_entries=3)
+        for block_hash in self.hashes[:3]:
+            cache.get(block_hash)
+        cache.get(self.hashes[0])
+        cache.get(self.hashes[3])
+        self.assertEqual(list(cache.blocks), [self.hashes[2], self.hashes[0], self.hashes[3]])
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+
+    def test_evict_by_size(self):
+        cache = BlockCache(max_bytes=2 * self.block_size)
+        for block_hash in self.hashes:
+            cache.get(block_hash)
+        stats = cache.get_stats()
+        self.assertEqual((stats["entries"], stats["bytes"]), (2, 2 * self.block_size))
+
+    def test_clear(self):
+        cache = BlockCache()
+        cache.get(self.hashes[0])
+        cache.clear()
+        self.assertEqual(cache.get_stats()["entries"], 0)
+        cache.get(self.hashes[0])
+        self.assertEqual(cache.get_stats()["misses"], 2)
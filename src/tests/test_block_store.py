@@ -0,0 +1,152 @@
+'''
+Tests for the append-only block store
+
+run with 'python -m unittest tests.test_block_store' in the src/ directory
+'''
+
+import hashlib
+import logging
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+# local imports
+from db.block_store import BlockStore, import_block_files, RECORD_HEADER
+from db.mapper import Mapper
+from tests.temp_mapper import temp_mapper
+
+logging.disable(logging.CRITICAL)
+
+
+def block(number) -> tuple:
+    ''' (hash, data) of a test block '''
+    data = f'{{"nonce": {number}}}'.encode("utf-8")
+    return hashlib.sha256(data).hexdigest(), data
+
+
+class TestBlockStore(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = self.tmp_dir.name + "/store"
+        self.store = BlockStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def reopen(self):
+        self.store.close()
+        self.store = BlockStore(self.path)
+
+    def test_put_get_delete(self):
+        blocks = [block(i) for i in range(5)]
+        for block_hash, data in blocks:
+            self.store.put(block_hash, data)
+        self.store.delete(blocks[1][0])
+        self.assertEqual(self.store.get(blocks[3][0]), blocks[3][1])
+        self.assertIsNone(self.store.get(blocks[1][0]))
+        self.assertNotIn(blocks[1][0], self.store)
+        self.assertEqual(self.store.hashes(), [blocks[i][0] for i in (0, 2, 3, 4)])
+
+        self.reopen()
+        self.assertEqual(len(self.store), 4)
+        self.assertIsNone(self.store.get(blocks[1][0]))
+        self.assertEqual(self.store.get(blocks[4][0]), blocks[4][1])
+
+    def test_views_of_the_mapped_segments(self):
+        blocks = [block(i) for i in range(3)]
+        self.store.put(*blocks[0])
+        first = self.store.get_view(blocks[0][0])
+        self.assertIsInstance(first, memoryview)
+        # the current segment is mapped again after it grew
+        for block_hash, data in blocks[1:]:
+            self.store.put(block_hash, data)
+        self.assertEqual([bytes(self.store.get_view(h)) for h, _ in blocks],
+                         [data for _, data in blocks])
+        self.assertIsNone(self.store.get_view(block(5)[0]))
+        # the view stays valid after the store was closed
+        self.reopen()
+        self.assertEqual(bytes(first), blocks[0][1])
+
+    def test_put_many(self):
+        blocks = [block(i) for i in range(5)]
+        with patch("os.fsync") as fsync:
+            self.store.put_many(blocks, sync=True)
+        fsync.assert_called_once()
+        self.reopen()
+        self.assertEqual(self.store.hashes(), [block_hash for block_hash, _ in blocks])
+        self.assertEqual(self.store.get(blocks[2][0]), blocks[2][1])
+
+    def test_new_segment_when_full(self):
+        with patch.object(BlockStore, "SEGMENT_SIZE", 200):
+            blocks = [block(i) for i in range(10)]
+            for block_hash, data in blocks:
+                self.store.put(block_hash, data)
+            self.assertGreater(len(self.store.list_segments()), 1)
+            for segment in self.store.list_segments():
+                self.assertLessEqual(os.path.getsize(self.store.segment_file(segment)), 200)
+            self.reopen()
+            for block_hash, data in blocks:
+                self.assertEqual(self.store.get(block_hash), data)
+
+    def test_records_missing_in_the_index_are_recovered(self):
+        blocks = [block(i) for i in range(3)]
+        for block_hash, data in blocks:
+            self.store.put(block_hash, data)
+        # crash after the last record was written, but before its index entry
+        self.store.close()
+        index_size = os.path.getsize(self.store.index_file)
+        with open(self.store.index_file, "r+b") as file:
+            file.truncate(index_size - 10)
+
+        self.store = BlockStore(self.path)
+        self.assertEqual(self.store.get(blocks[2][0]), blocks[2][1])
+        self.assertEqual(os.path.getsize(self.store.index_file), index_size)
+
+    def test_incomplete_record_is_removed(self):
+        first_hash, first_data = block(1)
+        self.store.put(first_hash, first_data)
+        second_hash, second_data = block(2)
+        self.store.put(second_hash, second_data)
+        # crash while the second record was written
+        self.store.close()
+        segment_file = self.store.segment_file(0)
+        with open(segment_file, "r+b") as file:
+            file.truncate(os.path.getsize(segment_file) - 3)
+        with open(self.store.index_file, "r+b") as file:
+            file.truncate(os.path.getsize(self.store.index_file) - 48)
+
+        self.store = BlockStore(self.path)
+        self.assertEqual(self.store.get(first_hash), first_data)
+        self.assertNotIn(second_hash, self.store)
+        self.assertEqual(os.path.getsize(segment_file), RECORD_HEADER.size + len(first_data))
+        # the next record is appended after the complete one
+        self.store.put(second_hash, second_data)
+        self.reopen()
+        self.assertEqual(self.store.get(second_hash), second_data)
+
+    def test_import_block_files(self):
+        blocks_dir = self.tmp_dir.name + "/blocks"
+        os.mkdir(blocks_dir)
+        blocks = [block(i) for i in range(3)]
+        for block_hash, data in blocks:
+            with open(os.path.join(blocks_dir, block_hash), "wb") as file:
+                file.write(data)
+        self.assertEqual(import_block_files(self.store, blocks_dir), 3)
+        self.assertEqual(import_block_files(self.store, blocks_dir), 0)
+        for block_hash, data in blocks:
+            self.assertEqual(self.store.get(block_hash), data)
+
+    def test_mapper_imports_block_files(self):
+        db_dir = self.tmp_dir.name + "/db"
+        os.makedirs(db_dir + "/blocks")
+        block_hash, data = block(1)
+        with open(os.path.join(db_dir, "blocks", block_hash), "wb") as file:
+            file.write(data)
+        with temp_mapper(db_dir):
+            self.assertEqual(Mapper.read_block(block_hash), {"nonce": 1})
+            self.assertEqual(Mapper.list_block_hashes(), [block_hash])
+            with self.assertRaises(KeyError):
+                Mapper.read_block(block(2)[0])
@@ -0,0 +1,178 @@
+'''
+Tests for the chain index of the stored blocks
+
+run with 'python -m unittest tests.test_chain_index' in the src/ directory
+'''
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+# local imports
+from db.chain_index import ChainIndex
+from db.mapper import Mapper
+from network.conversations.block_download import Block_download
+from tests.temp_mapper import TempMapperTestCase
+
+logging.disable(logging.CRITICAL)
+
+
+def block_hash(name) -> str:
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+
+class TestChainIndex(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index = ChainIndex(self.tmp_dir.name + "/chain_index")
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp_dir.cleanup()
+
+    def test_fork(self):
+        # genesis <- a <- b
+        #              <- c <- d
+        self.index.add_block("genesis", None)
+        self.index.add_block("a", "genesis")
+        self.index.add_block("b", "a")
+        self.index.add_block("c", "a")
+        self.index.add_block("d", "c")
+        self.assertEqual(self.index.get_height("d"), 3)
+        self.assertEqual(self.index.get_successors("a"), ["b", "c"])
+        self.assertEqual(self.index.get_tips(), {"b": 3, "d": 4})
+        self.assertEqual(self.index.get_chain_after("d", "a"), ["c", "d"])
+        self.assertEqual(self.index.get_chain_after("b", "a"), ["b"])
+        self.assertIsNone(self.index.get_chain_after("b", "c"))
+        self.assertEqual(self.index.get_hash_at("d", 2), "c")
+
+        self.index.remove_block("d")
+        self.index.remove_block("c")
+        self.assertEqual(self.index.get_tips(), {"b": 3})
+
+    def test_predecessor_added_later(self):
+        self.index.add_block("b", "a")
+        self.index.add_block("c", "b")
+        self.assertEqual(self.index.get_height("c"), 1)
+        self.assertEqual(self.index.get_chain_after("c", None), ["b", "c"])
+        self.index.add_block("a", None)
+        self.assertEqual(self.index.get_height("c"), 2)
+        self.assertEqual(self.index.get_chain_after("c", None), ["a", "b", "c"])
+
+    def test_remove_a_chain_at_once(self):
+        # genesis <- a <- b <- c <- d
+        #                   <- e
+        self.index.add_block("genesis", None)
+        for block_hash, predecessor in (("a", "genesis"), ("b", "a"), ("c", "b"), ("d", "c"),
+                                        ("e", "b")):
+            self.index.add_block(block_hash, predecessor)
+        with patch.object(self.index, "set_height", wraps=self.index.set_height) as set_height:
+            self.index.remove_blocks(["a", "b", "c"])
+        # only the heights of the remaining successors are updated
+        self.assertCountEqual([call.args for call in set_height.call_args_list],
+                              [("d", 0), ("e", 0)])
+        self.assertEqual(self.index.get_tips(), {"genesis": 1, "d": 1, "e": 1})
+        self.index.close()
+
+        index = ChainIndex(self.index.path)
+        self.assertTrue(index.load())
+        self.assertEqual(index.heights, self.index.heights)
+        self.assertEqual(index.get_tips(), self.index.get_tips())
+
+    def test_index_file(self):
+        self.index.add_block("genesis", None)
+        self.index.add_block("a", "genesis")
+        self.index.add_block("b", "a")
+        self.index.remove_block("b")
+        self.index.close()
+        # incomplete line of a crash
+        with open(self.index.path, "a") as file:
+            file.write("c a")
+
+        index = ChainIndex(self.index.path)
+        self.assertTrue(index.load())
+        self.assertEqual(index.get_tips(), {"a": 2})
+        self.assertNotIn("c", index)
+
+
+class TestMapperChainIndex(TempMapperTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # the balances are not needed
+        update_balance_index = patch.object(Mapper, "update_balance_index")
+        update_balance_index.start()
+        self.addCleanup(update_balance_index.stop)
+
+    def add_chain(self, length, predecessor=None) -> list:
+        hashes = []
+        for i in range(length):
+            current = block_hash(f"{predecessor}{i}")
+            block = {"predecessor": predecessor, "transactions": [], "nonce": i}
+            Mapper.write_block(current, json.dumps(block).encode("utf-8"))
+            hashes.append(current)
+            predecessor = current
+        Mapper.write_latest_block_hash(predecessor)
+        return hashes
+
+    def reopen(self):
+        Mapper.block_store.close()
+        Mapper.chain_index.close()
+        Mapper.block_store = None
+        Mapper.chain_index = None
+
+    def test_queries(self):
+        hashes = self.add_chain(10)
+        self.assertEqual(Mapper.get_chain_hashes(), hashes)
+        self.assertEqual(Mapper.get_block_height(hashes[4]), 4)
+        self.assertEqual(Mapper.get_block_hash_at(7), hashes[7])
+        self.assertEqual(Mapper.get_block_hashes_after(hashes[6]), hashes[7:])
+        self.assertEqual(Mapper.get_successor_hashes(hashes[2]), [hashes[3]])
+        self.assertEqual(Mapper.get_chain_tips(), {hashes[-1]: 10})
+
+        self.reopen()
+        self.assertEqual(Mapper.get_block_hashes_after(hashes[6]), hashes[7:])
+
+    def test_missing_index_entries_are_added(self):
+        hashes = self.add_chain(3)
+        self.reopen()
+        os.remove(Mapper.store_dir + "/chain_index")
+        self.assertEqual(Mapper.get_chain_hashes(), hashes)
+
+        # crash after a block was saved, but before it was added to the chain index
+        with patch.object(ChainIndex, "add_block"):
+            hashes += self.add_chain(1, hashes[-1])
+        self.reopen()
+        self.assertEqual(Mapper.get_chain_hashes(), hashes)
+
+    def test_long_chain_is_served_without_recursion(self):
+        length = sys.getrecursionlimit() + 100
+        hashes = self.add_chain(length)
+        blocks = Block_download(None).build_blockchain_from_hash(hashes[0], [])
+        self.assertEqual([block.saved_hash for block in blocks], hashes[1:])
+
+    def test_response_without_deleted_block_is_built_again(self):
+        hashes = self.add_chain(4)
+        read_block_view = Mapper.read_block_view
+        deleted = [hashes[2]]
+
+        def read_once_deleted(block_hash):
+            if block_hash in deleted:
+                deleted.remove(block_hash)
+                return None
+            return read_block_view(block_hash)
+
+        block_download = Block_download(None)
+        with patch.object(Mapper, "read_block_view", side_effect=read_once_deleted):
+            self.assertIsNone(block_download.build_blockchain_from_hash(hashes[0], []))
+            deleted.append(hashes[2])
+            with patch.object(block_download, "node") as node:
+                block_download.serve_block_request(None, {"latest_block_hash": hashes[0]})
+        message = node.send_to_node.call_args.args[1]
+        self.assertEqual([block.saved_hash for block in message["blocks"]], hashes[1:])
@@ -0,0 +1,158 @@
+'''
+Tests for the binary encoding of blocks, transactions and network messages
+
+run with 'python -m unittest tests.test_codec' in the src/ directory
+'''
+
+import json
+import logging
+import socket
+from hashlib import sha256
+from unittest import TestCase
+from unittest.mock import patch
+from ecdsa import SigningKey, SECP256k1
+
+# local imports
+from blockchain.block import Block, Transaction
+from blockchain.block_cache import BlockCache
+from db.codec import CodecError, decode_block, encode_block
+from network.bo.codec import decode_message, encode_message
+from network.bo.messages.blocks import Blocks
+from network.bo.messages.prepare_to_validate_batch import Prepare_to_validate_batch
+from network.bo.stored_block import Stored_block
+from network.node_connection import P2PNodeConnection, escape, unescape
+
+logging.disable(logging.CRITICAL)
+
+PRIVATE_KEY = SigningKey.generate(curve=SECP256k1, hashfunc=sha256)
+
+
+def create_transaction(amount, timestamp="01/02/2022, 03:04:05") -> Transaction:
+    tx = Transaction.from_dict({"source": "bob", "target": "alice", "amount": amount,
+                                "timestamp": timestamp, "pubkey": None, "sig": None})
+    tx.set_pubkey(PRIVATE_KEY.get_verifying_key())
+    tx.set_signature(PRIVATE_KEY.sign(tx.hash().encode("utf-8")))
+    return tx
+
+
+def create_block() -> Block:
+    transactions = [create_transaction(1.5), create_transaction(2),
+                    create_transaction(3.0, "1/2/2022, 03:04:05")]
+    block = Block("ab" * 32, transactions, nonce=42)
+    block.set_saved_hash(block.hash())
+    return block
+
+
+class TestCodec(TestCase):
+
+    def test_block_has_the_same_hash_and_serialization(self):
+        block = create_block()
+        data = encode_block(block.to_dict())
+        self.assertLess(len(data), len(block.serialize()) / 2)
+        decoded = Block.from_dict(decode_block(data), block.saved_hash)
+        self.assertEqual(decoded.hash(), block.hash())
+        self.assertEqual(decoded.serialize(), block.serialize())
+        self.assertEqual([type(t.amount) for t in decoded.transactions], [float, int, float])
+
+    def test_genesis_block(self):
+        genesis = {"predecessor": None, "transactions": [], "nonce": 234}
+        self.assertEqual(decode_block(encode_block(genesis)), genesis)
+
+    def test_invalid_blocks(self):
+        with self.assertRaises(CodecError):
+            encode_block({"predecessor": None, "transactions": [{"amount": 1}], "nonce": 1})
+        with self.assertRaises(CodecError):
+            encode_block({"predecessor": None, "transactions": [], "nonce": None})
+        data = encode_block(create_block().to_dict())
+        with self.assertRaises(CodecError):
+            decode_block(data[:-10])
+
+    def test_messages(self):
+        block = create_block()
+        messages = [
+            Blocks([block, block], "fork-detected").to_dict(),
+            Prepare_to_validate_batch("batch", [create_transaction(1).to_full_dict()]).to_dict(),
+            {"name": "vote", "valid": True, "tx_id": None, "values": [1, 2.5, 2**70, "ä"]},
+            {"name": "odd", "transactions": [{"source": "bob"}]},
+        ]
+        for message in messages:
+            data = encode_message(message)
+            self.assertEqual(json.dumps(decode_message(data), sort_keys=True),
+                             json.dumps(message, sort_keys=True))
+        blocks = Blocks.from_dict(decode_message(encode_message(messages[0]))).get_blocks()
+        self.assertEqual(blocks[0].hash(), block.hash())
+
+    def test_stored_blocks(self):
+        block = create_block()
+        stored = [Stored_block(block.saved_hash, memoryview(encode_block(block.to_dict()))),
+                  Stored_block(block.saved_hash, block.serialize())]
+        message = Blocks(stored).to_dict()
+        expected = json.dumps(Blocks([block, block]).to_dict(), sort_keys=True)
+        data = encode_message(message)
+        # the stored block is copied into the message
+        self.assertIn(bytes(stored[0].data), data)
+        self.assertEqual(json.dumps(decode_message(data), sort_keys=True), expected)
+        # peers with version 1 get blocks encoded like other blocks
+        data = encode_message(message, 1)
+        self.assertEqual(data[1], 1)
+        self.assertEqual(json.dumps(decode_message(data), sort_keys=True), expected)
+
+    def test_escape(self):
+        data = bytes(range(256)) + b"\x1b\x04\x1b\x1b\x02\x04"
+        self.assertNotIn(b"\x04", escape(data))
+        self.assertEqual(unescape(escape(data)), data)
+
+
+class Node:
+    def __init__(self, codec_version) -> None:
+        self.codec_version = codec_version
+
+    def debug_print(self, message):
+        pass
+
+
+class TestNodeConnection(TestCase):
+
+    def setUp(self):
+        self.sock, self.peer_sock = socket.socketpair()
+        # the blocks of the tests have the same hash, but other signatures
+        cache_patch = patch("network.bo.stored_block.block_cache", BlockCache())
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+
+    def tearDown(self):
+        self.sock.close()
+        self.peer_sock.close()
+
+    def send(self, connection, message) -> bytes:
+        connection.send(message)
+        packet = self.peer_sock.recv(65536)
+        self.assertEqual(packet[-1:], b"\x04")
+        return packet[:-1]
+
+    def test_binary_if_the_peer_supports_it(self):
+        message = Blocks([create_block()]).to_dict()
+        connection = P2PNodeConnection(Node(1), self.sock, "peer", "127.0.0.1", 80, codec=1)
+        packet = self.send(connection, message)
+        self.assertEqual(packet[:1], b"\xb2")
+
+        receiver = P2PNodeConnection(Node(1), self.peer_sock, "node", "127.0.0.1", 81)
+        self.assertIsNone(receiver.codec)
+        self.assertEqual(receiver.parse_packet(packet), json.loads(json.dumps(message)))
+        # the receiver can answer with binary messages now
+        self.assertEqual(receiver.codec, 1)
+
+    def test_json_for_other_peers(self):
+        connection = P2PNodeConnection(Node(1), self.sock, "peer", "127.0.0.1", 80)
+        packet = self.send(connection, {"name": "connection-accepted"})
+        self.assertEqual(json.loads(packet), {"name": "connection-accepted"})
+        self.assertEqual(connection.parse_packet(packet), {"name": "connection-accepted"})
+
+        connection = P2PNodeConnection(Node(None), self.sock, "peer", "127.0.0.1", 80, codec=1)
+        packet = self.send(connection, {"name": "connection-accepted"})
+        self.assertEqual(json.loads(packet), {"name": "connection-accepted"})
+
+        block = create_block()
+        stored = Stored_block(block.saved_hash, memoryview(encode_block(block.to_dict())))
+        packet = self.send(connection, Blocks([stored]).to_dict())
+        self.assertEqual(json.loads(packet), json.loads(json.dumps(Blocks([block]).to_dict())))
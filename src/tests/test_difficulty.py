@@ -0,0 +1,54 @@
+'''
+Tests for the proof of work targets
+
+run with 'python -m unittest tests.test_difficulty' in the src/ directory
+'''
+
+import argparse
+import logging
+from unittest import TestCase
+
+# local imports
+from blockchain.difficulty import Difficulty, DEFAULT_DIFFICULTY, leading_zero_bits
+
+logging.disable(logging.CRITICAL)
+
+
+class TestDifficulty(TestCase):
+
+    def test_hex_digits(self):
+        ''' A number of hex digits works like the old check of leading zero hex digits '''
+        difficulty = Difficulty.from_hex_digits(4)
+        self.assertEqual(difficulty, DEFAULT_DIFFICULTY)
+        self.assertTrue(difficulty.check_hex("0000" + "f" * 60))
+        self.assertFalse(difficulty.check_hex("0001" + "0" * 60))
+        self.assertFalse(difficulty.check_hex("000f" + "f" * 60))
+
+    def test_bits(self):
+        difficulty = Difficulty.from_bits(13)
+        self.assertEqual(difficulty.get_bits(), 13)
+        # 13 zero bits: the 4th hex digit can be 0-7
+        self.assertTrue(difficulty.check_hex("0007" + "f" * 60))
+        self.assertFalse(difficulty.check_hex("0008" + "0" * 60))
+
+    def test_target(self):
+        difficulty = Difficulty(0x1234 << 240)
+        self.assertTrue(difficulty.check((0x1234 << 240).to_bytes(32, "big")))
+        self.assertFalse(difficulty.check(((0x1234 << 240) + 1).to_bytes(32, "big")))
+        self.assertEqual(difficulty.get_target_words()[0], 0x12340000)
+
+    def test_get(self):
+        self.assertEqual(Difficulty.get(3), Difficulty.from_bits(12))
+        self.assertIs(Difficulty.get(DEFAULT_DIFFICULTY), DEFAULT_DIFFICULTY)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Difficulty.from_bits(257)
+        with self.assertRaises(ValueError):
+            Difficulty(2**256)
+
+    def test_argument(self):
+        self.assertEqual(leading_zero_bits("256"), 256)
+        for value in ("-1", "257", "16.5"):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                leading_zero_bits(value)
@@ -0,0 +1,81 @@
+'''
+Tests for the mempool of validated transactions
+
+run with 'python -m unittest tests.test_mempool' in the src/ directory
+'''
+
+import logging
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import patch
+
+# local imports
+from blockchain.block import Transaction
+from blockchain.mempool import Mempool
+from db.mapper import Mapper
+
+logging.disable(logging.CRITICAL)
+
+
+def create_transaction(source, amount) -> Transaction:
+    return Transaction(source, 'alice', float(amount), datetime(2022, 1, 1, 0, 0, 0))
+
+
+class TestMempool(TestCase):
+
+    def setUp(self):
+        self.mempool = Mempool(max_size=4, max_per_sender=3)
+        # every sender has a balance of 100
+        self.patch = patch.object(Mapper, "read_balance", return_value=0)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def test_duplicates_are_ignored(self):
+        tx = create_transaction('bob', 1)
+        self.assertTrue(self.mempool.add(tx))
+        self.assertFalse(self.mempool.add(create_transaction('bob', 1)))
+        self.assertEqual(len(self.mempool), 1)
+        self.assertIn(tx.hash(), self.mempool)
+        self.assertIs(self.mempool.get(tx.hash()), tx)
+
+    def test_limit_per_sender(self):
+        for amount in range(3):
+            self.assertTrue(self.mempool.add(create_transaction('bob', amount)))
+        self.assertFalse(self.mempool.add(create_transaction('bob', 3)))
+        self.assertEqual(len(self.mempool.get_by_sender('bob')), 3)
+
+    def test_busiest_sender_is_evicted(self):
+        for amount in range(3):
+            self.mempool.add(create_transaction('bob', amount))
+        self.mempool.add(create_transaction('carol', 1))
+        self.assertTrue(self.mempool.add(create_transaction('dave', 1)))
+        self.assertEqual([tx.amount for tx in self.mempool.get_by_sender('bob')], [0.0, 1.0])
+        self.assertEqual(self.mempool.get_stats()["evictions"], 1)
+        # carol would have the most transactions after adding another one
+        self.mempool.add(create_transaction('eve', 1))
+        self.assertFalse(self.mempool.add(create_transaction('carol', 2)))
+
+    def test_block_template(self):
+        transactions = [create_transaction('bob', 60), create_transaction('carol', 10),
+                        create_transaction('bob', 50), create_transaction('bob', 40)]
+        for tx in transactions:
+            self.mempool.add(tx)
+        # bob's second transaction would spend more than his balance
+        template = self.mempool.get_block_template()
+        self.assertEqual(template, [transactions[0], transactions[1], transactions[3]])
+        # the transactions are reserved until the block is saved or released
+        self.assertEqual(self.mempool.get_block_template(), [])
+        self.mempool.release(template)
+        self.assertEqual(self.mempool.get_block_template(max_transactions=2), template[:2])
+
+    def test_saved_transactions_are_removed(self):
+        transactions = [create_transaction('bob', 1), create_transaction('carol', 1)]
+        for tx in transactions:
+            self.mempool.add(tx)
+        template = self.mempool.get_block_template()
+        self.mempool.remove_transactions(template[:1])
+        self.assertEqual(len(self.mempool), 1)
+        self.assertEqual(self.mempool.get_by_sender('bob'), [])
+        self.assertEqual(self.mempool.get_stats()["reserved"], 1)
@@ -0,0 +1,115 @@
+'''
+Tests for the merkle tree and the incremental merkle root calculation used while mining
+
+run with 'python -m unittest tests.test_merkle_tree' in the src/ directory
+'''
+
+import json
+import logging
+import numpy as np
+from hashlib import sha256
+from unittest import TestCase
+
+# local imports
+from blockchain import sha256_batch
+from blockchain.block import MiningEngine, VectorizedMiningEngine
+from blockchain.difficulty import Difficulty
+from blockchain.merkle_tree import MerkleTree
+
+logging.disable(logging.CRITICAL)
+
+
+class TestMiningEngine(TestCase):
+
+    TRANSACTION_COUNTS = [0, 1, 2, 3, 4, 5, 6, 7, 15]
+    NONCES = [0, 1, 42, 65535, 2**32]
+
+    @staticmethod
+    def create_transactions(count):
+        return [json.dumps({"source": "bob", "target": "alice", "amount": float(i)})
+                for i in range(count)]
+
+    def test_root_hash_matches_merkle_tree(self):
+        ''' The engine has to calculate the same root hash as a freshly built MerkleTree '''
+        for count in self.TRANSACTION_COUNTS:
+            transactions = self.create_transactions(count)
+            engine = MiningEngine(transactions)
+            for nonce in self.NONCES:
+                with self.subTest(transactions=count, nonce=nonce):
+                    expected = MerkleTree(transactions + [str(nonce)]).getRootHash()
+                    self.assertEqual(engine.get_root_hash(nonce), expected)
+
+    def test_engine_does_not_modify_transactions(self):
+        transactions = self.create_transactions(3)
+        MiningEngine(transactions).get_root_hash(1)
+        self.assertEqual(transactions, self.create_transactions(3))
+
+
+class TestVectorizedMiningEngine(TestCase):
+
+    TRANSACTION_COUNTS = [0, 1, 2, 5, 6]
+    # nonces with different numbers of digits
+    NONCES = [0, 1, 9, 10, 99, 100, 12345, 2**32, 2**64 - 1]
+
+    def test_root_hashes_match_mining_engine(self):
+        for count in self.TRANSACTION_COUNTS:
+            transactions = TestMiningEngine.create_transactions(count)
+            engine = VectorizedMiningEngine(transactions)
+            roots = sha256_batch.merkle_roots(engine.siblings, engine.midstates,
+                                              np.array(self.NONCES, dtype=np.uint64))
+            for index, nonce in enumerate(self.NONCES):
+                with self.subTest(transactions=count, nonce=nonce):
+                    self.assertEqual(sha256_batch.state_to_digest(roots, index),
+                                     engine.get_root_hash(nonce))
+
+    def test_search_finds_the_same_nonce(self):
+        ''' The first valid nonce has to be the same as with the scalar engine '''
+        transactions = TestMiningEngine.create_transactions(3)
+        scalar = MiningEngine(transactions)
+        vectorized = VectorizedMiningEngine(transactions, batch_size=1000)
+        # targets with leading zero bits that are not a multiple of 4 and an arbitrary target
+        difficulties = [Difficulty.from_bits(bits) for bits in [4, 7, 9, 12]] \
+            + [Difficulty(0x0123 << 240)]
+        for difficulty in difficulties:
+            for start, step in [(0, 1), (7, 3)]:
+                with self.subTest(difficulty=difficulty, start=start, step=step):
+                    self.assertEqual(vectorized.search(start, 50000, step, difficulty),
+                                     scalar.search(start, 50000, step, difficulty))
+
+
+class TestMerkleTree(TestCase):
+
+    @staticmethod
+    def double_hash(val):
+        return sha256(sha256(val.encode("utf-8")).hexdigest().encode("utf-8")).hexdigest()
+
+    def test_root_hash_of_hex_strings(self):
+        ''' The root hash is the double hash of the concatenated hex strings of the children '''
+        values = ["a", "b", "c"]
+        a, b, c = (self.double_hash(value) for value in values)
+        expected = self.double_hash(self.double_hash(a + b) + self.double_hash(c + c))
+        self.assertEqual(MerkleTree(values).getRootHash(), expected)
+
+    def test_single_value_is_duplicated(self):
+        a = self.double_hash("a")
+        self.assertEqual(MerkleTree(["a"]).getRootHash(), self.double_hash(a + a))
+
+    def test_empty_tree(self):
+        with self.assertRaises(ValueError):
+            MerkleTree([])
+
+    def test_proofs(self):
+        for count in range(1, 10):
+            values = [str(i) for i in range(count)]
+            tree = MerkleTree(values)
+            root = tree.getRootHash()
+            for index, value in enumerate(values):
+                with self.subTest(values=count, index=index):
+                    proof = tree.get_proof(index)
+                    self.assertTrue(MerkleTree.verify_proof(value, proof, root))
+                    self.assertFalse(MerkleTree.verify_proof("x", proof, root))
+
+    def test_proof_index_out_of_range(self):
+        tree = MerkleTree(["a", "b", "c"])
+        with self.assertRaises(IndexError):
+            tree.get_proof(3)
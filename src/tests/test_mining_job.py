@@ -0,0 +1,137 @@
+'''
+Tests for mining blocks in the background
+
+run with 'python -m unittest tests.test_mining_job' in the src/ directory
+'''
+
+import json
+import logging
+import time
+from concurrent.futures import CancelledError
+from hashlib import sha256
+from unittest import TestCase
+from unittest.mock import patch
+from datetime import datetime
+from ecdsa import SigningKey, SECP256k1
+
+# local imports
+from blockchain.block import Block, Transaction
+from blockchain.block_cache import BlockCache
+from blockchain.difficulty import Difficulty
+from blockchain.mempool import Mempool
+from blockchain.mining_job import MiningJob
+from blockchain.mining_pool import MiningPool
+from db.mapper import Mapper
+from tests.temp_mapper import TempMapperTestCase
+
+logging.disable(logging.CRITICAL)
+
+
+class Node():
+    ''' The parts of P2PNode that are used by a mining job '''
+
+    def __init__(self, pool, difficulty) -> None:
+        self.mining_pool = pool
+        self.difficulty = difficulty
+        self.mempool = Mempool()
+        self.currently_mined_block = None
+
+    def set_currently_mined_block(self, block):
+        self.currently_mined_block = block
+
+
+class TestMiningJob(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = MiningPool(processes=1)
+        cls.pool.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    @staticmethod
+    def create_transactions():
+        return [Transaction('bob', 'alice', 1.0, datetime(2022, 1, 1))]
+
+    def test_result(self):
+        node = Node(self.pool, Difficulty.from_bits(8))
+        job = MiningJob(self.create_transactions(), node)
+        done = []
+        job.add_done_callback(done.append)
+        block = job.start().result(timeout=30)
+
+        transactions = [json.dumps(t.to_dict()) for t in block.transactions]
+        self.assertTrue(block.validate_nonce(transactions, block.nonce, node.difficulty))
+        self.assertEqual(done, [job])
+        self.assertGreater(job.progress()["nonces"], 0)
+        self.assertIsNone(node.currently_mined_block)
+
+    def test_cancel(self):
+        # the difficulty is too high to find a nonce during the test
+        node = Node(self.pool, Difficulty.from_bits(64))
+        job = MiningJob(self.create_transactions(), node).start()
+        time.sleep(0.2)
+        self.assertTrue(job.cancel())
+        with self.assertRaises(CancelledError):
+            job.result(timeout=5)
+        self.assertTrue(job.cancelled())
+        self.assertLess(job.cancel_latency, 1)
+
+    def test_restart(self):
+        node = Node(self.pool, Difficulty.from_bits(64))
+        job = MiningJob(self.create_transactions(), node).start()
+        time.sleep(0.2)
+        job.restart()
+        time.sleep(0.2)
+        self.assertEqual(job.progress()["restarts"], 1)
+        self.assertFalse(job.done())
+        job.cancel()
+        job.wait(timeout=5)
+
+    def test_restart_without_transactions_left(self):
+        node = Node(self.pool, Difficulty.from_bits(64))
+        transactions = self.create_transactions()
+        node.mempool.add(transactions[0])
+        job = MiningJob(transactions, node).start()
+        time.sleep(0.2)
+        # the transaction was saved in the received block
+        node.mempool.remove_transactions(transactions)
+        job.restart()
+        with self.assertRaises(CancelledError):
+            job.result(timeout=5)
+        self.assertEqual(job.transactions, [])
+        self.assertIsNone(node.currently_mined_block)
+
+    def test_jobs_run_one_after_another(self):
+        first = MiningJob(self.create_transactions(),
+                          Node(self.pool, Difficulty.from_bits(64))).start()
+        second = MiningJob(self.create_transactions(),
+                           Node(self.pool, Difficulty.from_bits(4)), first).start()
+        time.sleep(0.2)
+        self.assertFalse(second.done())
+        first.cancel()
+        self.assertIsNotNone(second.result(timeout=30).nonce)
+
+
+class TestRemoveSavedTransactions(TempMapperTestCase):
+
+    def test_chain_was_replaced(self):
+        private_key = SigningKey.generate(curve=SECP256k1, hashfunc=sha256)
+        transactions = [Transaction('bob', 'alice', float(amount), datetime(2022, 1, 1))
+                        for amount in range(3)]
+        for transaction in transactions:
+            transaction.set_pubkey(private_key.get_verifying_key())
+            transaction.set_signature(private_key.sign(transaction.hash().encode("utf-8")))
+        genesis = Block(None, [], nonce=0)
+        saved = Block(genesis.hash(), transactions[:2], nonce=0)
+        Mapper.commit_blocks([(genesis.hash(), genesis.serialize()),
+                              (saved.hash(), saved.serialize())], saved.hash())
+
+        job = MiningJob(transactions[1:], Node(None, None))
+        with patch("blockchain.mining_job.block_cache", BlockCache()) as cache:
+            # the block the job mined on is not on the new chain
+            job.remove_saved_transactions("ab" * 32)
+        self.assertEqual(job.transactions, transactions[2:])
+        self.assertEqual(cache.get_stats()["misses"], 2)
@@ -0,0 +1,54 @@
+'''
+Tests for the persistent pool of mining processes
+
+run with 'python -m unittest tests.test_mining_pool' in the src/ directory
+'''
+
+import json
+import logging
+import threading
+from unittest import TestCase
+from datetime import datetime
+
+# local imports
+from blockchain.block import Block, Transaction
+from blockchain.mining_pool import MiningPool
+
+logging.disable(logging.CRITICAL)
+
+
+class TestMiningPool(TestCase):
+
+    DIFFICULTY = 3
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = MiningPool(processes=2)
+        cls.pool.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    @staticmethod
+    def create_block(amount):
+        return Block(transactions=[Transaction('bob', 'alice', amount, datetime(2022, 1, 1))])
+
+    def test_pool_is_reused(self):
+        ''' The same worker processes have to find valid nonces for several blocks '''
+        workers = list(self.pool.workers)
+        for i in range(3):
+            block = self.create_block(float(i))
+            nonce = block.find_nonce(self.DIFFICULTY, 'multithreading', self.pool)
+            transactions = [json.dumps(t.to_dict()) for t in block.transactions]
+            self.assertTrue(block.validate_nonce(transactions, nonce, self.DIFFICULTY))
+        self.assertEqual(workers, self.pool.workers)
+        self.assertGreater(self.pool.get_stats()["hashes_per_second"], 0)
+
+    def test_stop_mining(self):
+        ''' Stopping the block aborts the job, the stop latency is recorded '''
+        block = self.create_block(1.0)
+        threading.Timer(0.2, block.stop_mining).start()
+        # the difficulty is too high to find a nonce before the timer fires
+        self.assertIsNone(block.find_nonce(16, 'multithreading', self.pool))
+        self.assertIsNotNone(self.pool.get_stats()["stop_latency"])
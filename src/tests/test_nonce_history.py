@@ -0,0 +1,65 @@
+'''
+Tests for the nonce history used by the nonce-skip mining method
+
+run with 'python -m unittest tests.test_nonce_history' in the src/ directory
+'''
+
+import logging
+import os
+from unittest.mock import patch
+
+# local imports
+from blockchain.nonce_history import NonceHistory
+from db.mapper import Mapper
+from tests.temp_mapper import TempMapperTestCase
+
+logging.disable(logging.CRITICAL)
+
+
+class TestNonceHistory(TempMapperTestCase):
+
+    def test_index_is_sorted(self):
+        history = NonceHistory()
+        for nonce in [50, 10, 30, 20]:
+            history.add(nonce)
+        self.assertEqual(list(history.nonces), [10, 20, 30, 50])
+        self.assertTrue(history.is_used(30))
+        self.assertFalse(history.is_used(40))
+        self.assertEqual(history.index_of(25), 2)
+
+    def test_new_nonces_are_appended_to_the_tail(self):
+        history = NonceHistory()
+        with patch.object(Mapper, "nonce_tail_max", 3):
+            for nonce in [50, 10]:
+                history.add(nonce)
+            self.assertFalse(os.path.exists(Mapper.nonce_index_file))
+            history.add(30)
+            self.assertFalse(os.path.exists(Mapper.nonce_index_file + ".tail"))
+            with open(Mapper.nonce_index_file, "rb") as file:
+                self.assertEqual(len(file.read()), 3 * 8)
+            history.add(20)
+        # the tail is merged into the index when it is loaded
+        Mapper.nonce_index = None
+        self.assertEqual(list(NonceHistory().nonces), [10, 20, 30, 50])
+
+    def test_index_is_built_from_nonce_list(self):
+        ''' The binary index is created from the nonce list of older versions '''
+        with open(Mapper.db_dir + "/nonce_list", "w") as file:
+            file.write("3\n1\n2\n")
+        self.assertEqual(list(NonceHistory().nonces), [1, 2, 3])
+
+    def test_start_nonce_estimation(self):
+        history = NonceHistory()
+        for nonce in range(100, 100 + 10 * (NonceHistory.MIN_NONCES - 1), 10):
+            history.add(nonce)
+        self.assertIsNone(history.estimate_start_nonce())
+
+        history.add(1000)
+        # first centroid is the mean of the 5 smallest nonces: 120
+        self.assertEqual(history.estimate_start_nonce(), 110)
+
+        # the clusters are persisted and updated online
+        history = NonceHistory()
+        history.add(100)
+        self.assertEqual(Mapper.read_nonce_clusters()["counts"][0], 6)
+        self.assertEqual(history.estimate_start_nonce(), 108)
@@ -0,0 +1,169 @@
+'''
+Tests for the batch verification of transaction signatures
+
+run with 'python -m unittest tests.test_signature_verifier' in the src/ directory
+'''
+
+import logging
+from datetime import datetime
+from hashlib import sha256
+from unittest import TestCase
+from unittest.mock import patch
+from ecdsa import SigningKey, SECP256k1
+
+# local imports
+from blockchain.block import Block, Transaction
+from blockchain.signature_verifier import SignatureCache, SignatureVerifier, VerifyingKeyCache
+from db.mapper import Mapper
+
+logging.disable(logging.CRITICAL)
+
+
+def create_transactions(count):
+    private_key = SigningKey.generate(curve=SECP256k1, hashfunc=sha256)
+    transactions = []
+    for i in range(count):
+        tx = Transaction('bob', 'alice', float(i), datetime(2022, 1, 1, 0, 0, 0))
+        tx.set_pubkey(private_key.get_verifying_key())
+        tx.set_signature(private_key.sign(tx.hash().encode("utf-8")))
+        transactions.append(tx)
+    return transactions
+
+
+class TestSignatureVerifier(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.verifier = SignatureVerifier(processes=2)
+        cls.verifier.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.verifier.shutdown()
+
+    def test_valid_signatures(self):
+        transactions = create_transactions(40)
+        self.assertEqual(self.verifier.verify(transactions), [True] * 40)
+        self.assertTrue(self.verifier.verify_all(transactions))
+
+    def test_invalid_signature(self):
+        transactions = create_transactions(40)
+        transactions[10].amount = 1000.0    # the signature doesn't match anymore
+        results = self.verifier.verify(transactions)
+        self.assertFalse(results[10])
+        # all other transactions are either valid or weren't checked
+        self.assertTrue(all(r in (True, None) for i, r in enumerate(results) if i != 10))
+        self.assertFalse(self.verifier.verify_all(transactions))
+
+    def test_small_batch_without_pool(self):
+        transactions = create_transactions(3)
+        transactions[1].amount = 1000.0
+        self.assertEqual(SignatureVerifier().verify(transactions), [True, False, None])
+        self.assertEqual(SignatureVerifier().verify([]), [])
+
+    def test_block_with_invalid_signature(self):
+        block = Block(transactions=create_transactions(20))
+        block.find_nonce(2)
+        block.set_saved_hash(block.hash())
+        with patch.object(Mapper, "read_balance", return_value=0):
+            self.assertTrue(block.validate(2, self.verifier))
+            block.transactions[5].set_signature(block.transactions[6].sig)
+            self.assertFalse(block.validate(2, self.verifier))
+            self.assertFalse(block.validate(2))
+
+
+class TestSignatureCache(TestCase):
+
+    def setUp(self):
+        self.cache = SignatureCache(max_entries=10)
+        self.verifier = SignatureVerifier(cache=self.cache)
+
+    def test_verified_signatures_are_cached(self):
+        transactions = create_transactions(5)
+        self.assertTrue(self.verifier.verify_all(transactions))
+        self.assertEqual(self.cache.get_stats()["misses"], 5)
+        with patch("blockchain.signature_verifier.verify_signature") as verify:
+            self.assertTrue(self.verifier.verify_all(transactions))
+        verify.assert_not_called()
+        self.assertEqual(self.cache.get_stats()["hits"], 5)
+
+    def test_invalid_signature_is_cached(self):
+        transactions = create_transactions(2)
+        transactions[0].set_signature(transactions[1].sig)
+        self.assertEqual(self.verifier.verify(transactions), [False, None])
+        self.assertEqual(self.verifier.verify(transactions), [False, None])
+        self.assertEqual(self.cache.get_stats()["hits"], 1)
+
+    def test_other_pubkey_is_not_a_hit(self):
+        transactions = create_transactions(1)
+        self.assertTrue(self.verifier.verify_all(transactions))
+        transactions[0].set_pubkey(create_transactions(1)[0].pubkey)
+        self.assertFalse(self.verifier.verify_all(transactions))
+
+    def test_least_recently_used_are_evicted(self):
+        transactions = create_transactions(12)
+        self.verifier.verify(transactions[:10])
+        self.cache.get(transactions[0].get_signature_data())
+        self.verifier.verify(transactions[10:])
+        stats = self.cache.get_stats()
+        self.assertEqual(stats["entries"], 10)
+        self.assertEqual(stats["evictions"], 2)
+        # transaction 0 was used recently, 1 and 2 were evicted
+        self.assertTrue(self.cache.get(transactions[0].get_signature_data()))
+        self.assertIsNone(self.cache.get(transactions[1].get_signature_data()))
+        self.assertIsNone(self.cache.get(transactions[2].get_signature_data()))
+
+
+class TestVerifyingKeyCache(TestCase):
+
+    def setUp(self):
+        self.cache = VerifyingKeyCache(max_keys=3, max_precomputed=1)
+        self.private_key = SigningKey.generate(curve=SECP256k1, hashfunc=sha256)
+        self.pubkey = self.private_key.get_verifying_key().to_string()
+
+    def test_key_is_parsed_once(self):
+        key = self.cache.get(self.pubkey)
+        self.assertIs(self.cache.get(self.pubkey), key)
+        self.assertEqual(key.to_string(), self.pubkey)
+        stats = self.cache.get_stats()
+        self.assertEqual((stats["misses"], stats["hits"]), (1, 1))
+
+    def test_hot_key_is_precomputed(self):
+        sig = self.private_key.sign(b"message")
+        for _ in range(VerifyingKeyCache.HOT_USES):
+            key = self.cache.get(self.pubkey, verification=True)
+        self.assertEqual(self.cache.get_stats()["precomputed"], 1)
+        self.assertTrue(key.verify(sig, b"message"))
+        self.assertIs(self.cache.get(self.pubkey), key)
+
+    def test_memory_cap(self):
+        pubkeys = [SigningKey.generate(curve=SECP256k1).get_verifying_key().to_string()
+                   for _ in range(2)]
+        for pubkey in pubkeys:
+            for _ in range(VerifyingKeyCache.HOT_USES):
+                self.cache.get(pubkey, verification=True)
+        self.cache.get(self.pubkey)
+        stats = self.cache.get_stats()
+        self.assertEqual(stats["precomputed"], 1)
+        self.assertEqual(stats["keys"], 3)
+        self.cache.get(SigningKey.generate(curve=SECP256k1).get_verifying_key().to_string())
+        self.assertEqual(self.cache.get_stats()["evictions"], 1)
+
+    def test_evicted_key_is_not_precomputed_on_every_use(self):
+        other = SigningKey.generate(curve=SECP256k1).get_verifying_key().to_string()
+        with patch.object(VerifyingKeyCache, "precompute",
+                          side_effect=lambda key: key) as precompute:
+            for _ in range(10 * VerifyingKeyCache.HOT_USES):
+                for pubkey in (self.pubkey, other):
+                    self.cache.get(pubkey, verification=True)
+        # the keys take turns, a key gets tables again after 2 * HOT_USES and 4 * HOT_USES
+        # uses instead of on every HOT_USES uses
+        self.assertEqual(precompute.call_count, 5)
+
+    def test_transactions_share_the_key(self):
+        tx = create_transactions(1)[0]
+        tx_dict = tx.to_full_dict()
+        first = Transaction.from_dict(tx_dict)
+        second = Transaction.from_dict(tx_dict)
+        self.assertIs(first.pubkey, second.pubkey)
+        self.assertTrue(first.verify_signature())
@@ -0,0 +1,98 @@
+'''
+Tests for the snapshots of the balances and the chain
+
+run with 'python -m unittest tests.test_snapshot' in the src/ directory
+'''
+
+import hashlib
+import json
+import logging
+import os
+from unittest.mock import patch
+
+# local imports
+from db.mapper import Mapper
+from db.snapshot import list_snapshots, snapshot_file
+from tests.temp_mapper import TempMapperTestCase
+
+logging.disable(logging.CRITICAL)
+
+
+class TestSnapshot(TempMapperTestCase):
+    mapper_attributes = {"snapshot_interval": 3}
+
+    def setUp(self):
+        super().setUp()
+        # genesis block and 7 blocks after it, snapshots of the blocks 3 and 6
+        self.hashes = [self.add_block(None, 0)]
+        for amount in range(1, 8):
+            self.hashes.append(self.add_block(self.hashes[-1], amount))
+
+    def add_block(self, predecessor, amount, nonce=0) -> str:
+        block = {"predecessor": predecessor, "nonce": nonce, "transactions": [
+            {"source": "bob", "target": "alice", "amount": amount}]}
+        block_bytes = json.dumps(block).encode("utf-8")
+        block_hash = hashlib.sha256(block_bytes).hexdigest()
+        Mapper.commit_blocks([(block_hash, block_bytes)], block_hash)
+        return block_hash
+
+    def restart(self):
+        ''' Reopen the store and forget the balance index like a new process '''
+        Mapper.block_store.close()
+        Mapper.chain_index.close()
+        Mapper.block_store = None
+        Mapper.chain_index = None
+        Mapper.balance_index = None
+
+    def test_snapshots_are_written_every_interval(self):
+        directory = Mapper.get_snapshot_dir()
+        self.assertEqual(list_snapshots(directory), [6, 3])
+        snapshot = Mapper.find_snapshot(self.hashes[-1])
+        self.assertEqual(snapshot["tip"], self.hashes[6])
+        self.assertEqual(snapshot["chain"], self.hashes[:7])
+        self.assertEqual(snapshot["balances"], {"alice": 21, "bob": -21})
+
+        # the oldest snapshot is removed
+        for amount in range(8, 11):
+            self.hashes.append(self.add_block(self.hashes[-1], amount))
+        self.assertEqual(list_snapshots(directory), [9, 6])
+
+    def test_balances_are_replayed_after_the_snapshot(self):
+        os.remove(Mapper.balance_index_file)
+        self.restart()
+        with patch.object(Mapper, "read_block_if_exists",
+                          wraps=Mapper.read_block_if_exists) as read_block:
+            Mapper.load_state()
+        self.assertEqual(read_block.call_count, 1)
+        self.assertEqual(Mapper.read_balance("alice"), 28)
+
+    def test_corrupt_snapshot_is_ignored(self):
+        path = snapshot_file(Mapper.get_snapshot_dir(), 6)
+        with open(path) as file:
+            snapshot = json.load(file)
+        snapshot["balances"]["alice"] = 1000
+        with open(path, "w") as file:
+            json.dump(snapshot, file)
+        os.remove(Mapper.balance_index_file)
+        self.restart()
+        with patch.object(Mapper, "read_block_if_exists",
+                          wraps=Mapper.read_block_if_exists) as read_block:
+            Mapper.load_state()
+        # blocks 4 to 7 after the snapshot of block 3
+        self.assertEqual(read_block.call_count, 4)
+        self.assertEqual(Mapper.read_balance("alice"), 28)
+
+    def test_chain_index_is_rebuilt_with_the_snapshot(self):
+        os.remove(os.path.join(Mapper.store_dir, "chain_index"))
+        self.restart()
+        with patch.object(Mapper, "read_predecessor",
+                          wraps=Mapper.read_predecessor) as read_predecessor:
+            Mapper.load_state()
+        # the genesis block and the block after the snapshot
+        self.assertEqual(read_predecessor.call_count, 2)
+        self.assertEqual(Mapper.get_chain_hashes(), self.hashes)
+
+    def test_snapshot_of_another_chain_is_ignored(self):
+        fork = self.add_block(self.hashes[4], 100, nonce=1)
+        snapshot = Mapper.find_snapshot(fork)
+        self.assertEqual(snapshot["tip"], self.hashes[3])
@@ -0,0 +1,173 @@
+'''
+Tests for the SQLite storage backend of the Mapper
+
+run with 'python -m unittest tests.test_sqlite_store' in the src/ directory
+'''
+
+import json
+import logging
+import os
+import tempfile
+from hashlib import sha256
+from unittest import TestCase
+from unittest.mock import patch
+from ecdsa import SigningKey, SECP256k1
+
+# local imports
+from blockchain.block import Block, Transaction
+from db.block_store import BlockStore
+from db.codec import encode_block
+from db.mapper import Mapper
+from db.sqlite_store import SqliteStore
+from tests.temp_mapper import TempMapperTestCase
+
+logging.disable(logging.CRITICAL)
+
+PRIVATE_KEY = SigningKey.generate(curve=SECP256k1, hashfunc=sha256)
+
+
+def create_block(predecessor, transfers, nonce=0) -> tuple:
+    ''' (hash, stored block, Block) of a block with (source, target, amount) transfers '''
+    transactions = [Transaction.from_dict({"source": source, "target": target, "amount": amount,
+                                           "timestamp": "01/02/2022, 03:04:05", "pubkey": None,
+                                           "sig": None})
+                    for source, target, amount in transfers]
+    for transaction in transactions:
+        transaction.set_pubkey(PRIVATE_KEY.get_verifying_key())
+        transaction.set_signature(PRIVATE_KEY.sign(transaction.hash().encode("utf-8")))
+    block = Block(predecessor, transactions, nonce=nonce)
+    return block.hash(), encode_block(json.loads(block.serialize())), block
+
+
+class TestSqliteStore(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = self.tmp_dir.name + "/store"
+        self.store = SqliteStore(self.path)
+        self.blocks = []
+        predecessor = None
+        for transfers in ([], [("bob", "alice", 1)],
+                          [("alice", "carol", 2), ("carol", "bob", 3)]):
+            block = create_block(predecessor, transfers)
+            predecessor = block[0]
+            self.blocks.append(block)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def reopen(self):
+        self.store.close()
+        self.store = SqliteStore(self.path)
+
+    def test_put_get_delete(self):
+        self.store.put_many([(block_hash, data) for block_hash, data, _ in self.blocks])
+        self.reopen()
+        self.assertEqual(self.store.connection.execute("PRAGMA journal_mode").fetchone()[0],
+                         "wal")
+        self.assertEqual(self.store.hashes(), [block[0] for block in self.blocks])
+        self.assertEqual(self.store.get(self.blocks[1][0]), self.blocks[1][1])
+        self.assertEqual(self.store.get_predecessor(self.blocks[2][0]), self.blocks[1][0])
+
+        self.store.delete(self.blocks[1][0])
+        self.assertNotIn(self.blocks[1][0], self.store)
+        self.assertIsNone(self.store.get(self.blocks[1][0]))
+        self.assertEqual(len(self.store), 2)
+        transaction = self.blocks[1][2].transactions[0]
+        self.assertIsNone(self.store.get_transaction(transaction.hash()))
+        self.assertEqual(self.store.find_transactions("bob"),
+                         [(self.blocks[2][0], self.blocks[2][2].transactions[1].to_full_dict())])
+
+    def test_heights_and_successors(self):
+        # the successors are stored first
+        for block_hash, data, _ in reversed(self.blocks):
+            self.store.put(block_hash, data)
+        self.assertEqual([self.store.get_height(block[0]) for block in self.blocks], [0, 1, 2])
+        fork = create_block(self.blocks[0][0], [], nonce=1)
+        self.store.put(fork[0], fork[1])
+        self.assertEqual(self.store.get_hashes_at_height(1), [self.blocks[1][0], fork[0]])
+        self.assertEqual(self.store.get_successors(self.blocks[0][0]),
+                         [self.blocks[1][0], fork[0]])
+        # the successors of a deleted block start new chains
+        self.store.delete(self.blocks[0][0])
+        self.assertEqual(self.store.get_height(self.blocks[2][0]), 1)
+
+    def test_transactions_by_address_and_hash(self):
+        self.store.put_many([(block_hash, data) for block_hash, data, _ in self.blocks])
+        segments = BlockStore(self.tmp_dir.name + "/segments")
+        segments.put_many([(block_hash, data) for block_hash, data, _ in self.blocks])
+        transactions = [t for _, _, block in self.blocks for t in block.transactions]
+        for store in (self.store, segments):
+            self.assertEqual([t for _, t in store.find_transactions("carol")],
+                             [transactions[1].to_full_dict(), transactions[2].to_full_dict()])
+            self.assertEqual(store.get_transaction(transactions[2].hash()),
+                             (self.blocks[2][0], transactions[2].to_full_dict()))
+            self.assertIsNone(store.get_transaction("00" * 32))
+        segments.close()
+
+    def test_delete_and_put_at_once(self):
+        self.store.put_many([(block_hash, data) for block_hash, data, _ in self.blocks[:2]])
+        fork = create_block(self.blocks[0][0], [("bob", "dave", 1)])
+        with self.assertRaises(ValueError):
+            self.store.put_many([(fork[0], fork[1]), ("ab" * 32, b"not a block")],
+                                delete=[self.blocks[1][0]])
+        self.assertIn(self.blocks[1][0], self.store)
+        self.store.put_many([(fork[0], fork[1])], delete=[self.blocks[1][0]])
+        self.assertEqual(self.store.hashes(), [self.blocks[0][0], fork[0]])
+        self.assertEqual(self.store.find_transactions("alice"), [])
+
+    def test_delete_a_chain(self):
+        self.store.put_many([(block_hash, data) for block_hash, data, _ in self.blocks])
+        with patch.object(self.store, "update_heights",
+                          wraps=self.store.update_heights) as update_heights:
+            self.store.put_many([], delete=[self.blocks[0][0], self.blocks[1][0]])
+        # only the heights after the remaining block are updated
+        update_heights.assert_called_once_with(self.blocks[2][0], 0)
+        self.assertEqual(self.store.get_height(self.blocks[2][0]), 0)
+
+    def test_put_many_is_one_transaction(self):
+        blocks = [(block_hash, data) for block_hash, data, _ in self.blocks]
+        with self.assertRaises(ValueError):
+            self.store.put_many(blocks[:2] + [("ab" * 32, b"not a block")])
+        self.assertEqual(len(self.store), 0)
+        with patch.object(self.store, "connection", wraps=self.store.connection) as connection:
+            self.store.put_many(blocks, sync=True)
+        statements = [call.args[0] for call in connection.execute.call_args_list]
+        self.assertEqual(statements.count("COMMIT"), 1)
+        self.assertEqual(len(self.store), 3)
+
+
+class TestMapperWithSqlite(TempMapperTestCase):
+    mapper_attributes = {"storage_backend": "sqlite"}
+
+    def test_node_with_its_own_db_dir(self):
+        # the genesis block of the old storage is imported and becomes the latest block
+        genesis_hash, _, genesis = create_block(None, [], nonce=7)
+        os.mkdir(Mapper.blockchain_dir)
+        with open(os.path.join(Mapper.blockchain_dir, genesis_hash), "wb") as file:
+            file.write(genesis.serialize())
+        Mapper.set_db_dir(self.db_dir + "/node")
+        self.assertEqual(Mapper.read_latest_block_hash(), genesis_hash)
+        self.assertTrue(os.path.exists(self.db_dir + "/node/latest_block_hash"))
+        blocks = []
+        predecessor = None
+        for transfers in ([], [("bob", "alice", 10)], [("alice", "bob", 4)]):
+            block_hash, _, block = create_block(predecessor, transfers)
+            blocks.append((block_hash, block.serialize()))
+            predecessor = block_hash
+        Mapper.commit_blocks(blocks, predecessor)
+
+        self.assertIsInstance(Mapper.get_block_store(), SqliteStore)
+        self.assertTrue(os.path.exists(self.db_dir + "/node/store/blocks.sqlite"))
+        self.assertEqual(Mapper.get_chain_hashes(), [block_hash for block_hash, _ in blocks])
+        self.assertEqual(Mapper.read_balance("alice"), 6)
+        # the heights and successors come from the database, not from the chain index
+        with patch.object(Mapper, "get_chain_index") as get_chain_index:
+            self.assertEqual(Mapper.get_block_height(blocks[2][0]), 2)
+            self.assertEqual(Mapper.get_successor_hashes(blocks[0][0]), [blocks[1][0]])
+        get_chain_index.assert_not_called()
+        self.assertEqual([block_hash for block_hash, _ in Mapper.read_transactions_of("alice")],
+                         [blocks[1][0], blocks[2][0]])
+        tx_hash = Transaction.from_dict(json.loads(blocks[2][1])["transactions"][0]).hash()
+        self.assertEqual(Mapper.read_transaction(tx_hash)[0], blocks[2][0])
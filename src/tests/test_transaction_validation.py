@@ -0,0 +1,192 @@
+'''
+Tests for the two-phase validation of single transactions and of batches
+
+run with 'python -m unittest tests.test_transaction_validation' in the src/ directory
+'''
+
+import logging
+import threading
+import time
+from datetime import datetime
+from hashlib import sha256
+from unittest import TestCase
+from unittest.mock import patch
+from ecdsa import SigningKey, SECP256k1
+
+# local imports
+from blockchain.block import Transaction
+from blockchain.mempool import Mempool
+from blockchain.signature_verifier import SignatureVerifier
+from db.mapper import Mapper
+from network.bo.bitmap import to_bitmap, from_bitmap
+from network.conversations.batch_validation import Batch_Validation, Validation_Batcher
+from network.conversations.transaction_validation import Transaction_Validation
+
+logging.disable(logging.CRITICAL)
+
+
+class Connection:
+    def __init__(self, port) -> None:
+        self.port = port
+
+
+class Node:
+    ''' Records the messages instead of sending them '''
+
+    def __init__(self, port, peers) -> None:
+        self.port = port
+        self.all_nodes = [Connection(peer) for peer in peers]
+        self.conversations = {"transaction_validation": {}, "batch_validation": {}}
+        self.conversations_lock = threading.RLock()
+        self.mempool = Mempool()
+        self.signature_verifier = SignatureVerifier()
+        self.sent = []
+
+    def send_to_nodes(self, message):
+        self.sent.append((None, message))
+
+    def send_to_node(self, connection, message):
+        self.sent.append((connection.port, message))
+
+
+def create_transaction(amount, source='bob') -> dict:
+    private_key = SigningKey.generate(curve=SECP256k1, hashfunc=sha256)
+    tx = Transaction(source, 'alice', float(amount), datetime(2022, 1, 1, 0, 0, 0))
+    tx.set_pubkey(private_key.get_verifying_key())
+    tx.set_signature(private_key.sign(tx.hash().encode("utf-8")))
+    return tx.to_full_dict()
+
+
+class TestTransactionValidation(TestCase):
+
+    def setUp(self):
+        self.patch = patch.object(Mapper, "read_balance", return_value=0)
+        self.patch.start()
+        self.coordinator = Node(8080, [8081, 8082])
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def vote(self, tx_id, port, valid):
+        validation = Transaction_Validation.get(self.coordinator, tx_id)
+        validation.vote_received(Connection(port), {"name": "vote", "valid": valid,
+                                                    "tx_id": tx_id})
+
+    def test_rounds_run_at_the_same_time(self):
+        first = Transaction_Validation(self.coordinator, create_transaction(1))
+        second = Transaction_Validation(self.coordinator, create_transaction(2))
+        first.send_prepare_to_validate()
+        second.send_prepare_to_validate()
+        self.assertEqual(len(self.coordinator.conversations["transaction_validation"]), 2)
+
+        self.vote(second.tx_id, 8081, True)
+        self.vote(first.tx_id, 8081, True)
+        self.vote(first.tx_id, 8082, False)
+        self.vote(second.tx_id, 8082, True)
+
+        decisions = {msg["tx_id"]: msg["valid"] for _, msg in self.coordinator.sent
+                     if msg["name"] == "global-decision"}
+        self.assertEqual(decisions, {first.tx_id: False, second.tx_id: True})
+        self.assertEqual(len(self.coordinator.mempool), 1)
+        self.assertIn(second.tx_id, self.coordinator.mempool)
+        self.assertEqual(self.coordinator.conversations["transaction_validation"], {})
+
+    def test_participant_votes_with_the_transaction_id(self):
+        participant = Node(8081, [8080])
+        validation = Transaction_Validation(participant, create_transaction(1))
+        validation.prepare_to_validate_received(Connection(8080))
+        port, vote = participant.sent[0]
+        self.assertEqual((port, vote["valid"], vote["tx_id"]), (8080, True, validation.tx_id))
+
+        Transaction_Validation.get(participant, validation.tx_id).global_decision_received(
+            {"name": "global-decision", "valid": True, "tx_id": validation.tx_id})
+        self.assertIn(validation.tx_id, participant.mempool)
+        self.assertIsNone(Transaction_Validation.get(participant, validation.tx_id))
+
+    def test_timeout(self):
+        validation = Transaction_Validation(self.coordinator, create_transaction(1))
+        validation.send_prepare_to_validate()
+        self.vote(validation.tx_id, 8081, True)
+        validation.started -= Transaction_Validation.TIMEOUT + 1
+        Transaction_Validation.remove_expired(self.coordinator)
+
+        _, decision = self.coordinator.sent[-1]
+        self.assertEqual((decision["name"], decision["valid"]), ("global-decision", False))
+        self.assertIsNone(Transaction_Validation.get(self.coordinator, validation.tx_id))
+        self.assertEqual(len(self.coordinator.mempool), 0)
+
+    def test_without_peers(self):
+        node = Node(8080, [])
+        validation = Transaction_Validation(node, create_transaction(1))
+        validation.send_prepare_to_validate()
+        self.assertIn(validation.tx_id, node.mempool)
+        self.assertEqual(node.sent, [])
+
+
+class TestBatchValidation(TestCase):
+
+    def setUp(self):
+        self.patch = patch.object(Mapper, "read_balance", return_value=0)
+        self.patch.start()
+        self.coordinator = Node(8080, [8081, 8082])
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def test_bitmap(self):
+        values = [True, False, False, True, True] + [False] * 10 + [True]
+        self.assertEqual(from_bitmap(to_bitmap(values), len(values)), values)
+        self.assertEqual(from_bitmap(to_bitmap([]), 3), [False] * 3)
+
+    def test_participant_votes_for_each_transaction(self):
+        transactions = [create_transaction(1), create_transaction(2),
+                        create_transaction(60, 'carol'), create_transaction(50, 'carol')]
+        transactions[1]["amount"] = 3.0     # invalid signature
+        participant = Node(8081, [8080])
+        validation = Batch_Validation(participant, "batch", transactions)
+        validation.prepare_to_validate_received(Connection(8080))
+        _, vote = participant.sent[0]
+        self.assertEqual(vote["name"], "vote-batch")
+        # carol can't spend 110 with a balance of 100
+        self.assertEqual(from_bitmap(vote["bitmap"], 4), [True, False, True, False])
+
+    def test_without_peers(self):
+        node = Node(8080, [])
+        transactions = [create_transaction(60, 'carol'), create_transaction(50, 'carol')]
+        Batch_Validation.create(node, transactions).send_prepare_to_validate()
+        # carol can't spend 110 with a balance of 100
+        self.assertEqual(len(node.mempool), 1)
+        self.assertEqual(node.sent, [])
+
+    def test_decision_is_the_intersection_of_the_votes(self):
+        transactions = [create_transaction(i) for i in range(4)]
+        validation = Batch_Validation.create(self.coordinator, transactions)
+        validation.send_prepare_to_validate()
+        _, prepare = self.coordinator.sent[0]
+        self.assertEqual(len(prepare["transactions"]), 4)
+
+        for port, votes in [(8081, [True, True, False, True]), (8082, [True, False, False, True])]:
+            Batch_Validation.get(self.coordinator, validation.batch_id).vote_received(
+                Connection(port), {"name": "vote-batch", "batch_id": validation.batch_id,
+                                   "bitmap": to_bitmap(votes)})
+
+        _, decision = self.coordinator.sent[-1]
+        self.assertEqual(from_bitmap(decision["bitmap"], 4), [True, False, False, True])
+        self.assertEqual(len(self.coordinator.mempool), 2)
+        self.assertIsNone(Batch_Validation.get(self.coordinator, validation.batch_id))
+
+    def test_batcher_sends_full_batches(self):
+        batcher = Validation_Batcher(self.coordinator, batch_size=3, max_wait=60)
+        for i in range(7):
+            batcher.add(Transaction.from_dict(create_transaction(i)))
+        batches = [msg for _, msg in self.coordinator.sent]
+        self.assertEqual([len(msg["transactions"]) for msg in batches], [3, 3])
+        batcher.flush()
+        self.assertEqual(len(self.coordinator.sent[-1][1]["transactions"]), 1)
+
+    def test_batcher_sends_after_max_wait(self):
+        batcher = Validation_Batcher(self.coordinator, batch_size=100, max_wait=0.05)
+        batcher.add(Transaction.from_dict(create_transaction(1)))
+        self.assertEqual(self.coordinator.sent, [])
+        time.sleep(0.3)
+        self.assertEqual(len(self.coordinator.sent), 1)
@@ -0,0 +1,96 @@
+'''
+Tests for the verification of the stored blockchain
+
+run with 'python -m unittest tests.test_verify_chain' in the src/ directory
+'''
+
+import hashlib
+import json
+import logging
+from ecdsa import SigningKey, SECP256k1
+
+# local imports
+from blockchain.block import Block, Transaction
+from blockchain.verify_chain import verify_chain
+from db.mapper import Mapper
+from tests.temp_mapper import TempMapperTestCase
+
+logging.disable(logging.CRITICAL)
+
+PRIVATE_KEY = SigningKey.generate(curve=SECP256k1, hashfunc=hashlib.sha256)
+
+
+def create_transaction(amount, private_key=PRIVATE_KEY) -> Transaction:
+    tx = Transaction.from_dict({"source": "bob", "target": "alice", "amount": amount,
+                                "timestamp": "01/02/2022, 03:04:05", "pubkey": None,
+                                "sig": None})
+    tx.set_pubkey(PRIVATE_KEY.get_verifying_key())
+    tx.set_signature(private_key.sign(tx.hash().encode("utf-8")))
+    return tx
+
+
+class TestVerifyChain(TempMapperTestCase):
+
+    def setUp(self):
+        super().setUp()
+        genesis = json.dumps({"predecessor": None, "transactions": [], "nonce": 0}).encode()
+        self.tip = hashlib.sha256(genesis).hexdigest()
+        Mapper.commit_blocks([(self.tip, genesis)], self.tip)
+        for amount in (10, 20, 30):
+            self.add_block([create_transaction(amount)])
+
+    def add_block(self, transactions):
+        block = Block(self.tip, transactions, nonce=1)
+        self.tip = block.hash()
+        Mapper.commit_blocks([(self.tip, block.serialize())], self.tip)
+
+    def verify(self, **kwargs) -> dict:
+        return verify_chain(self.tip, 0, workers=1, **kwargs)
+
+    def test_valid_chain_and_checkpoint(self):
+        result = self.verify()
+        self.assertTrue(result["valid"], result["error"])
+        self.assertEqual((result["height"], result["verified"]), (3, 3))
+
+        # only the blocks after the checkpoint are verified again
+        self.add_block([create_transaction(5)])
+        result = self.verify()
+        self.assertTrue(result["valid"], result["error"])
+        self.assertEqual((result["height"], result["verified"]), (4, 1))
+        self.assertEqual(self.verify(use_checkpoint=False)["verified"], 4)
+
+    def test_checkpoint_of_fewer_checks(self):
+        self.assertTrue(self.verify(check_signatures=False)["valid"])
+        # the checkpoint without signatures isn't used to skip the signatures
+        self.assertEqual(self.verify()["verified"], 3)
+        self.assertEqual(self.verify(check_signatures=False)["verified"], 0)
+
+        # a run without signatures uses the checkpoint with signatures, but doesn't replace it
+        self.add_block([create_transaction(5)])
+        self.assertEqual(self.verify(check_signatures=False)["verified"], 1)
+        self.assertEqual(self.verify()["verified"], 1)
+
+    def test_balance_too_low(self):
+        self.add_block([create_transaction(50)])
+        self.add_block([create_transaction(1)])
+        result = self.verify()
+        self.assertFalse(result["valid"])
+        self.assertIn("at height 4: bob can't send 50", result["error"])
+        # the blocks before the invalid block are valid
+        self.assertEqual(result["height"], 3)
+        self.assertEqual(self.verify()["verified"], 0)
+
+    def test_proof_of_work(self):
+        result = verify_chain(self.tip, 30, workers=1)
+        self.assertFalse(result["valid"])
+        self.assertIn("at height 1: nonce 1 does not fulfill the difficulty", result["error"])
+
+    def test_invalid_signature(self):
+        other_key = SigningKey.generate(curve=SECP256k1, hashfunc=hashlib.sha256)
+        self.add_block([create_transaction(1, other_key)])
+        self.assertIn("signature", self.verify()["error"])
+        self.assertTrue(self.verify(check_signatures=False)["valid"])
+
+    def test_unknown_tip(self):
+        self.tip = "00" * 32
+        self.assertIn("is not stored", self.verify()["error"])